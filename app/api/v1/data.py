@@ -7,6 +7,7 @@ from typing import Optional
 from fastapi import APIRouter, Depends, UploadFile, File, Form, HTTPException
 from sqlalchemy.orm import Session
 
+from app.core.blocking import run_blocking
 from app.database import get_db
 from app.db.models import Data as DataModel
 from app.core.config import settings
@@ -27,6 +28,15 @@ def _serialize_data(d: DataModel) -> dict:
     }
 
 
+def _store_upload(db: Session, type: str, key: str, content: bytes, content_type: str | None) -> dict:
+    s3_url = upload_bytes(key, content, content_type)
+    data = DataModel(id=uuid.uuid4(), type=type, s3_url=s3_url)
+    db.add(data)
+    db.commit()
+    db.refresh(data)
+    return _serialize_data(data)
+
+
 @router.post("")
 async def upload_multipart(
     type: str = Form(...),
@@ -37,13 +47,7 @@ async def upload_multipart(
         raise HTTPException(status_code=500, detail="S3 is not configured")
     key = f"uploads/{uuid.uuid4()}/{file.filename}"
     content = await file.read()
-    s3_url = upload_bytes(key, content, file.content_type)
-
-    data = DataModel(id=uuid.uuid4(), type=type, s3_url=s3_url)
-    db.add(data)
-    db.commit()
-    db.refresh(data)
-    return _serialize_data(data)
+    return await run_blocking(_store_upload, db, type, key, content, file.content_type)
 
 
 @router.post("/presign")
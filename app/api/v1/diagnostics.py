@@ -0,0 +1,54 @@
+from __future__ import annotations
+
+from fastapi import APIRouter, HTTPException
+
+from app.core.blocking import blocking_stats
+from app.core.config import settings
+from app.core.loop_monitor import loop_lag_monitor
+from app.services import ocr_cache
+from app.services.http_clients import get_upstream_clients
+from app.services.profiler import profiler_status, request_pipeline_profiles
+from app.services.resilience import guards_stats
+from app.services.s3 import s3_pool_stats
+from app.services.s3_utils import presign_cache_stats
+
+router = APIRouter(prefix="/diagnostics", tags=["Diagnostics"])
+
+
+@router.get("/http-pools")
+def http_pools() -> dict:
+    return get_upstream_clients().stats()
+
+
+@router.get("/ocr-cache")
+def ocr_cache_stats() -> dict:
+    return ocr_cache.stats()
+
+
+@router.get("/event-loop")
+def event_loop() -> dict:
+    return {"lag": loop_lag_monitor.stats(), "blockingPool": blocking_stats()}
+
+
+@router.get("/s3-pool")
+def s3_pool() -> dict:
+    return {**s3_pool_stats(), "presignCache": presign_cache_stats()}
+
+
+@router.get("/upstreams")
+def upstreams() -> dict:
+    return guards_stats()
+
+
+@router.get("/profiler")
+def profiler() -> dict:
+    return profiler_status()
+
+
+@router.post("/profiler/pipeline")
+def profile_pipeline(runs: int = 1) -> dict:
+    """Профилировать следующие runs прогонов пайплайна (0 — отменить)."""
+    if not settings.profiler_enabled:
+        raise HTTPException(status_code=409, detail="Profiler is disabled")
+    request_pipeline_profiles(runs)
+    return profiler_status()
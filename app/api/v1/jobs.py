@@ -1,8 +1,12 @@
 from __future__ import annotations
 
+import hashlib
+import json
 import os
+import time
 import uuid
 from decimal import Decimal
+from typing import AsyncIterator
 
 from fastapi import (
     APIRouter,
@@ -14,15 +18,22 @@ from fastapi import (
     HTTPException,
     UploadFile,
 )
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
 import logging
 
-from app.database import get_db
+from app.api.deps import require_api_key
+from app.database import SessionLocal, get_db
 from app.db.models import Job, User
+from app.core.blocking import run_blocking
 from app.core.config import settings
+from app.core.metrics import S3_UPLOAD_SECONDS
+from app.core.timing import timed
 from app.services.file_utils import save_upload_to_temp
-from app.services.job_pipeline import process_job_pipeline
-from app.services.s3 import upload_bytes
+from app.services.job_events import TERMINAL_EVENTS, JobEventSubscription, publish_job_event
+from app.services.job_queue import enqueue_job_pipeline, retry_job_pipeline
+from app.services.pdf_split import is_pdf
+from app.services.s3 import head_object, presigned_upload, upload_file
 from app.services.user_profile import avatar_id_for_ip, username_for_ip
 
 router = APIRouter(prefix="/job", tags=["Job"])
@@ -83,13 +94,14 @@ def _find_or_create_user_by_ip(db: Session, ip: str) -> User:
 
 
 def _resolve_user(db: Session, user_id: str | None, ip: str | None) -> User:
-    if user_id:
-        user = db.query(User).filter(User.id == user_id).first()
-        if not user:
-            raise HTTPException(status_code=404, detail="User not found")
-        return user
-    if ip:
-        return _find_or_create_user_by_ip(db, ip)
+    with timed("resolve_user"):
+        if user_id:
+            user = db.query(User).filter(User.id == user_id).first()
+            if not user:
+                raise HTTPException(status_code=404, detail="User not found")
+            return user
+        if ip:
+            return _find_or_create_user_by_ip(db, ip)
     raise HTTPException(status_code=400, detail="Either user_id or x-user-ip header is required")
 
 
@@ -109,6 +121,58 @@ def _debit_token(user: User) -> None:
         user.tokens_used_as_anon = (user.tokens_used_as_anon or 0) + 1
 
 
+def _create_job_sync(
+    db: Session,
+    background_tasks: BackgroundTasks,
+    user_identifier: str | None,
+    ip: str | None,
+    temp_path: str,
+    filename: str,
+    content_type: str | None,
+    input_sha256: str,
+) -> dict:
+    # Вся синхронная работа ручки (БД, S3, Redis) — одним вызовом в пуле блокирующего I/O
+    db.info["metrics_source"] = "create_job"
+    user = _resolve_user(db, user_identifier, ip)
+    _ensure_token_balance(user)
+
+    job_id = uuid.uuid4()
+    key = f"jobs/{user.id}/{job_id}/{filename}"
+    with S3_UPLOAD_SECONDS.labels(source="create_job").time():
+        s3_url = upload_file(key, temp_path, content_type)
+
+    job = Job(
+        id=job_id,
+        user_id=user.id,
+        anon_user_id=user.anon_user_id,
+        status="queued",
+        tokens_reserved=Decimal("1"),
+        input_s3_url=s3_url,
+        input_mime_type=content_type,
+        input_sha256=input_sha256,
+    )
+    db.add(job)
+
+    _debit_token(user)
+    db.commit()
+    db.refresh(job)
+
+    enqueue_job_pipeline(str(job.id), background_tasks, temp_path, content_type)
+    publish_job_event(str(job.id), "queued")
+
+    return {
+        "jobId": str(job.id),
+        "status": job.status,
+        "tokensLeft": float(user.balance_tokens or 0),
+    }
+
+
+def _discard_upload(db: Session, temp_path: str) -> None:
+    db.rollback()
+    if os.path.exists(temp_path):
+        os.remove(temp_path)
+
+
 @router.post("")
 async def create_job(
     background_tasks: BackgroundTasks,
@@ -123,51 +187,300 @@ async def create_job(
     user_identifier = userId or user_id_form
     ip = (x_user_ip or "").strip() or None
 
-    temp_path = await save_upload_to_temp(image)
+    hasher = hashlib.sha256()
+    with timed("upload_temp"):
+        temp_path = await save_upload_to_temp(image, hasher)
     try:
-        user = _resolve_user(db, user_identifier, ip)
-        _ensure_token_balance(user)
-
-        with open(temp_path, "rb") as f:
-            content = f.read()
-
-        job_id = uuid.uuid4()
-        filename = image.filename or "image"
-        key = f"jobs/{user.id}/{job_id}/{filename}"
-        s3_url = upload_bytes(key, content, image.content_type)
-
-        job = Job(
-            id=job_id,
-            user_id=user.id,
-            anon_user_id=user.anon_user_id,
-            status="queued",
-            tokens_reserved=Decimal("1"),
-            input_s3_url=s3_url,
-            input_mime_type=image.content_type,
+        return await run_blocking(
+            _create_job_sync,
+            db,
+            background_tasks,
+            user_identifier,
+            ip,
+            temp_path,
+            image.filename or "image",
+            image.content_type,
+            hasher.hexdigest(),
         )
-        db.add(job)
+    except HTTPException:
+        await run_blocking(_discard_upload, db, temp_path)
+        raise
+    except Exception:
+        await run_blocking(_discard_upload, db, temp_path)
+        logger.exception("create_job_failed")
+        raise
+
 
-        _debit_token(user)
-        db.commit()
-        db.refresh(job)
+def _create_batch_job_sync(
+    db: Session,
+    background_tasks: BackgroundTasks,
+    user_identifier: str | None,
+    ip: str | None,
+    uploads: list[tuple[str, str, str | None, str]],
+) -> dict:
+    # uploads: [(temp_path, filename, content_type, sha256)] в порядке страниц
+    db.info["metrics_source"] = "create_batch_job"
+    user = _resolve_user(db, user_identifier, ip)
+    _ensure_token_balance(user)
 
-        background_tasks.add_task(process_job_pipeline, str(job.id), temp_path, image.content_type)
+    job_id = uuid.uuid4()
+    pages = []
+    for index, (temp_path, filename, content_type, sha256) in enumerate(uploads):
+        key = f"jobs/{user.id}/{job_id}/{index + 1:03d}_{filename}"
+        with S3_UPLOAD_SECONDS.labels(source="create_batch_job").time():
+            s3_url = upload_file(key, temp_path, content_type)
+        pages.append(
+            {
+                "index": index,
+                "s3Url": s3_url,
+                "mimeType": content_type,
+                "sha256": sha256,
+                "status": "queued",
+            }
+        )
 
-        return {
-            "jobId": str(job.id),
-            "status": job.status,
-            "tokensLeft": float(user.balance_tokens or 0),
-        }
+    # одна задача и одно резервирование на весь набор страниц
+    job = Job(
+        id=job_id,
+        user_id=user.id,
+        anon_user_id=user.anon_user_id,
+        status="queued",
+        tokens_reserved=Decimal("1"),
+        input_s3_url=pages[0]["s3Url"],
+        input_mime_type=pages[0]["mimeType"],
+        pipeline_meta={"pages": pages},
+    )
+    db.add(job)
+
+    _debit_token(user)
+    db.commit()
+    db.refresh(job)
+
+    # страницы пайплайн читает из S3: каждая — в своём потоке
+    enqueue_job_pipeline(str(job.id), background_tasks)
+    publish_job_event(str(job.id), "queued")
+
+    return {
+        "jobId": str(job.id),
+        "status": job.status,
+        "pages": len(pages),
+        "tokensLeft": float(user.balance_tokens or 0),
+    }
+
+
+@router.post("/batch")
+async def create_batch_job(
+    background_tasks: BackgroundTasks,
+    images: list[UploadFile] = File(...),
+    userId: str | None = Form(default=None, alias="userId"),
+    user_id_form: str | None = Form(default=None, alias="user_id"),
+    db: Session = Depends(get_db),
+    x_user_ip: str | None = Header(default=None, alias="x-user-ip"),
+) -> dict:
+    if not settings.s3_bucket_name:
+        raise HTTPException(status_code=500, detail="S3 is not configured")
+    if len(images) > settings.job_batch_max_pages:
+        raise HTTPException(status_code=400, detail=f"Too many pages (limit {settings.job_batch_max_pages})")
+    user_identifier = userId or user_id_form
+    ip = (x_user_ip or "").strip() or None
+
+    uploads: list[tuple[str, str, str | None, str]] = []
+    try:
+        for image in images:
+            hasher = hashlib.sha256()
+            with timed("upload_temp"):
+                temp_path = await save_upload_to_temp(image, hasher)
+            uploads.append((temp_path, image.filename or "image", image.content_type, hasher.hexdigest()))
+        return await run_blocking(_create_batch_job_sync, db, background_tasks, user_identifier, ip, uploads)
     except HTTPException:
-        db.rollback()
-        if os.path.exists(temp_path):
-            os.remove(temp_path)
+        await run_blocking(db.rollback)
+        raise
+    except Exception:
+        await run_blocking(db.rollback)
+        logger.exception("create_batch_job_failed")
         raise
+    finally:
+        for temp_path, *_ in uploads:
+            if os.path.exists(temp_path):
+                await run_blocking(os.remove, temp_path)
+
+
+def _presign_job_sync(
+    db: Session,
+    user_identifier: str | None,
+    ip: str | None,
+    filename: str,
+    content_type: str,
+) -> dict:
+    user = _resolve_user(db, user_identifier, ip)
+    # баланс проверяем сразу, но списываем только при подтверждении загрузки
+    _ensure_token_balance(user)
+
+    job_id = uuid.uuid4()
+    key = f"jobs/{user.id}/{job_id}/{filename}"
+    expires = settings.job_upload_presign_ttl_seconds
+    presign = presigned_upload(key, content_type, settings.job_upload_max_bytes, expires)
+
+    job = Job(
+        id=job_id,
+        user_id=user.id,
+        anon_user_id=user.anon_user_id,
+        status="waiting_upload",
+        tokens_reserved=Decimal("0"),
+        input_s3_url=f"s3://{settings.s3_bucket_name}/{key}",
+        input_mime_type=content_type,
+    )
+    db.add(job)
+    db.commit()
+
+    return {
+        "jobId": str(job_id),
+        "status": "waiting_upload",
+        "uploadUrl": presign.get("url"),
+        "fields": presign.get("fields"),
+        "expiresInSeconds": expires,
+    }
+
+
+@router.post("/presign")
+async def presign_job(
+    fileName: str = Form(..., alias="fileName"),
+    contentType: str = Form(..., alias="contentType"),
+    userId: str | None = Form(default=None, alias="userId"),
+    user_id_form: str | None = Form(default=None, alias="user_id"),
+    db: Session = Depends(get_db),
+    x_user_ip: str | None = Header(default=None, alias="x-user-ip"),
+) -> dict:
+    if not settings.s3_bucket_name:
+        raise HTTPException(status_code=500, detail="S3 is not configured")
+    if not (contentType.lower().startswith("image/") or is_pdf(contentType)):
+        raise HTTPException(status_code=415, detail="Unsupported content type")
+    user_identifier = userId or user_id_form
+    ip = (x_user_ip or "").strip() or None
+    filename = os.path.basename(fileName) or "image"
+    try:
+        return await run_blocking(_presign_job_sync, db, user_identifier, ip, filename, contentType)
     except Exception:
+        await run_blocking(db.rollback)
+        raise
+
+
+def _confirm_state(job: Job, user: User | None) -> dict:
+    return {
+        "jobId": str(job.id),
+        "status": job.status,
+        "tokensLeft": float(user.balance_tokens or 0) if user else None,
+    }
+
+
+def _confirm_job_sync(db: Session, background_tasks: BackgroundTasks, job_id: str) -> dict:
+    job = db.query(Job).filter(Job.id == job_id).first()
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if job.status != "waiting_upload":
+        state = _confirm_state(job, db.get(User, job.user_id) if job.user_id else None)
         db.rollback()
-        if os.path.exists(temp_path):
-            os.remove(temp_path)
-        logger.exception("create_job_failed")
+        return state
+    s3_url, mime_type = job.input_s3_url, job.input_mime_type
+    # HEAD в S3 — вне транзакции и до блокировок: сетевой вызов не держит
+    # строки задачи и пользователя
+    db.rollback()
+    head = head_object(s3_url)
+    if head is None:
+        raise HTTPException(status_code=409, detail="Upload not found")
+    size = int(head.get("ContentLength") or 0)
+    if size <= 0:
+        raise HTTPException(status_code=400, detail="Uploaded file is empty")
+    if size > settings.job_upload_max_bytes:
+        raise HTTPException(status_code=413, detail="Uploaded file is too large")
+    uploaded_type = head.get("ContentType")
+    if mime_type and uploaded_type != mime_type:
+        raise HTTPException(status_code=415, detail="Uploaded content type mismatch")
+
+    # блокировка строки задачи и повторная проверка: параллельное подтверждение
+    # не спишет токен дважды, истёкшую (job_sweeper) задачу не подтвердить
+    job = db.query(Job).filter(Job.id == job_id).with_for_update().populate_existing().first()
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    user = db.query(User).filter(User.id == job.user_id).with_for_update().first() if job.user_id else None
+    if job.status != "waiting_upload":
+        state = _confirm_state(job, user)
+        db.rollback()
+        return state
+    if user is None:
+        raise HTTPException(status_code=404, detail="User not found")
+
+    _ensure_token_balance(user)
+    job.status = "queued"
+    job.tokens_reserved = Decimal("1")
+    meta = dict(job.pipeline_meta or {})
+    meta["upload"] = {"mode": "direct", "bytes": size, "etag": (head.get("ETag") or "").strip('"') or None}
+    job.pipeline_meta = meta
+    _debit_token(user)
+    db.commit()
+
+    # временного файла нет — пайплайн скачает вход из input_s3_url
+    enqueue_job_pipeline(str(job.id), background_tasks)
+    publish_job_event(str(job.id), "queued")
+
+    return {
+        "jobId": str(job.id),
+        "status": "queued",
+        "tokensLeft": float(user.balance_tokens or 0),
+    }
+
+
+@router.post("/{job_id}/confirm")
+async def confirm_job(
+    job_id: str,
+    background_tasks: BackgroundTasks,
+    db: Session = Depends(get_db),
+) -> dict:
+    try:
+        uuid.UUID(job_id)
+    except ValueError:
+        raise HTTPException(status_code=404, detail="Job not found")
+    try:
+        return await run_blocking(_confirm_job_sync, db, background_tasks, job_id)
+    except HTTPException:
+        await run_blocking(db.rollback)
+        raise
+    except Exception:
+        await run_blocking(db.rollback)
+        logger.exception("confirm_job_failed job_id=%s", job_id)
+        raise
+
+
+def _retry_job_sync(db: Session, background_tasks: BackgroundTasks, job_id: str) -> dict:
+    try:
+        job = retry_job_pipeline(db, job_id, background_tasks)
+    except LookupError:
+        raise HTTPException(status_code=404, detail="Job not found")
+    except ValueError as exc:
+        raise HTTPException(status_code=409, detail=str(exc))
+    publish_job_event(str(job.id), "queued")
+    stages = (job.pipeline_meta or {}).get("stages") or {}
+    return {
+        "jobId": str(job.id),
+        "status": job.status,
+        "completedStages": [name for name, stage in stages.items() if stage.get("status") == "done"],
+    }
+
+
+@router.post("/{job_id}/retry", dependencies=[Depends(require_api_key)])
+async def retry_job(
+    job_id: str,
+    background_tasks: BackgroundTasks,
+    db: Session = Depends(get_db),
+) -> dict:
+    try:
+        uuid.UUID(job_id)
+    except ValueError:
+        raise HTTPException(status_code=404, detail="Job not found")
+    try:
+        return await run_blocking(_retry_job_sync, db, background_tasks, job_id)
+    except Exception:
+        await run_blocking(db.rollback)
         raise
 
 
@@ -178,3 +491,59 @@ def get_job(job_id: str, db: Session = Depends(get_db)) -> dict:
         raise HTTPException(status_code=404, detail="Job not found")
     user = db.query(User).filter(User.id == job.user_id).first() if job.user_id else None
     return _serialize_job(job, user)
+
+
+def _load_job_snapshot(job_id: str) -> dict | None:
+    db = SessionLocal()
+    try:
+        job = db.query(Job).filter(Job.id == job_id).first()
+        return _serialize_job(job) if job else None
+    finally:
+        db.close()
+
+
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+@router.get("/{job_id}/events")
+async def job_events(job_id: str) -> StreamingResponse:
+    try:
+        uuid.UUID(job_id)
+    except ValueError:
+        raise HTTPException(status_code=404, detail="Job not found")
+    subscription = JobEventSubscription(job_id)
+    await subscription.open()
+    try:
+        snapshot = await run_blocking(_load_job_snapshot, job_id)
+    except Exception:
+        await subscription.close()
+        raise
+    if snapshot is None:
+        await subscription.close()
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    async def stream() -> AsyncIterator[str]:
+        try:
+            # снимок текущего состояния, дальше — события пайплайна из Redis pub/sub
+            yield _sse("snapshot", snapshot)
+            if snapshot["status"] in TERMINAL_EVENTS:
+                return
+            deadline = time.monotonic() + settings.job_events_max_stream_seconds
+            async for message in subscription.events(settings.job_events_heartbeat_seconds):
+                if time.monotonic() > deadline:
+                    return
+                if message is None:
+                    yield ": keepalive\n\n"
+                    continue
+                yield _sse(message["event"], message.get("data") or {})
+                if message["event"] in TERMINAL_EVENTS:
+                    return
+        finally:
+            await subscription.close()
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
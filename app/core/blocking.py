@@ -0,0 +1,28 @@
+from __future__ import annotations
+
+import functools
+from typing import Any, Callable, TypeVar
+
+import anyio
+import anyio.to_thread
+
+from app.core.config import settings
+
+T = TypeVar("T")
+
+# Отдельный лимит потоков для блокирующего I/O ручек (БД, boto3, файлы), чтобы
+# загрузки не выедали общий пул Starlette, которым обслуживаются sync-ручки
+_limiter = anyio.CapacityLimiter(settings.blocking_io_max_threads)
+
+
+async def run_blocking(func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """Выполняет блокирующую функцию в ограниченном пуле потоков, не занимая event loop."""
+    return await anyio.to_thread.run_sync(functools.partial(func, *args, **kwargs), limiter=_limiter)
+
+
+def blocking_stats() -> dict[str, Any]:
+    return {
+        "total": _limiter.total_tokens,
+        "borrowed": _limiter.borrowed_tokens,
+        "waiting": _limiter.statistics().tasks_waiting,
+    }
@@ -0,0 +1,67 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+from collections import deque
+from typing import Any
+
+from app.core.config import settings
+from app.core.metrics import EVENT_LOOP_LAG_MAX_SECONDS, EVENT_LOOP_LAG_SECONDS
+
+logger = logging.getLogger(__name__)
+
+
+class LoopLagMonitor:
+    """Меряет отзывчивость event loop: засыпает на interval и смотрит, насколько
+    позже запланированного проснулся. Если кто-то блокирует loop, лаг растёт."""
+
+    def __init__(self, interval: float = 0.5, window: int = 600, warn_threshold: float = 0.25) -> None:
+        self.interval = interval
+        self.warn_threshold = warn_threshold
+        self._samples: deque[float] = deque(maxlen=window)
+        self._task: asyncio.Task | None = None
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            started = loop.time()
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, loop.time() - started - self.interval)
+            self._samples.append(lag)
+            EVENT_LOOP_LAG_SECONDS.observe(lag)
+            EVENT_LOOP_LAG_MAX_SECONDS.set(max(self._samples))
+            if lag > self.warn_threshold:
+                logger.warning("loop_monitor.lag lag_ms=%.1f", lag * 1000)
+
+    def stats(self) -> dict[str, Any]:
+        samples = sorted(self._samples)
+        if not samples:
+            return {"samples": 0}
+
+        def pct(p: float) -> float:
+            return round(samples[min(len(samples) - 1, int(p * len(samples)))] * 1000, 2)
+
+        return {
+            "samples": len(samples),
+            "intervalMs": self.interval * 1000,
+            "lastMs": round(self._samples[-1] * 1000, 2),
+            "p50Ms": pct(0.5),
+            "p99Ms": pct(0.99),
+            "maxMs": round(samples[-1] * 1000, 2),
+        }
+
+
+loop_lag_monitor = LoopLagMonitor(interval=settings.loop_lag_sample_interval_seconds)
@@ -0,0 +1,119 @@
+from __future__ import annotations
+
+import os
+
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram, generate_latest
+from prometheus_client import multiprocess
+
+# Несколько воркеров uvicorn: при заданном PROMETHEUS_MULTIPROC_DIR каждый процесс
+# пишет значения в свои файлы в этом каталоге, а /metrics собирает их все.
+MULTIPROC_DIR = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+
+UPSTREAM_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0, 300.0)
+IO_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+EVENT_LOOP_LAG_SECONDS = Histogram(
+    "event_loop_lag_seconds",
+    "Задержка пробуждения event loop API относительно запланированного времени",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0),
+)
+EVENT_LOOP_LAG_MAX_SECONDS = Gauge(
+    "event_loop_lag_max_seconds",
+    "Максимальная задержка event loop за последнее окно замеров",
+    multiprocess_mode="livemax",
+)
+UPSTREAM_LIMITER_WAIT_SECONDS = Histogram(
+    "upstream_limiter_wait_seconds",
+    "Ожидание свободной ёмкости апстрима (RPS и конкурентность) перед запросом",
+    ["upstream"],
+    buckets=(0.005, 0.025, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0),
+)
+
+OCR_SUBMIT_SECONDS = Histogram(
+    "ocr_submit_seconds",
+    "Отправка файла в Yandex OCR (recognizeTextAsync) до получения operation id",
+    buckets=UPSTREAM_BUCKETS,
+)
+OCR_POLL_WAIT_SECONDS = Histogram(
+    "ocr_poll_wait_seconds",
+    "Ожидание завершения операции Yandex OCR (опрос operations)",
+    buckets=UPSTREAM_BUCKETS,
+)
+GPT_GENERATE_SECONDS = Histogram(
+    "gpt_generate_seconds",
+    "Генерация ответа Yandex GPT (без ожидания лимитера)",
+    ["stream"],
+    buckets=UPSTREAM_BUCKETS,
+)
+S3_UPLOAD_SECONDS = Histogram(
+    "s3_upload_seconds",
+    "Загрузка объекта в S3",
+    ["source"],
+    buckets=IO_BUCKETS,
+)
+DB_COMMIT_SECONDS = Histogram(
+    "db_commit_seconds",
+    "COMMIT сессии SQLAlchemy вместе с flush",
+    ["source"],
+    buckets=IO_BUCKETS,
+)
+JOB_OUTCOMES_TOTAL = Counter(
+    "job_outcomes_total",
+    "Завершения прогонов пайплайна: done, failed, parked, deferred",
+    ["outcome"],
+)
+JOB_ERRORS_TOTAL = Counter(
+    "job_errors_total",
+    "Ошибки задач по классам error_message",
+    ["error_class"],
+)
+PIPELINES_IN_FLIGHT = Gauge(
+    "job_pipelines_in_flight",
+    "Пайплайны, выполняющиеся сейчас",
+    multiprocess_mode="livesum",
+)
+DB_POOL_CHECKED_OUT = Gauge(
+    "db_pool_checked_out",
+    "Соединения пула SQLAlchemy, выданные сессиям",
+    multiprocess_mode="livesum",
+)
+
+# Классы error_message: метка с ограниченным набором значений вместо текста ошибки
+_ERROR_CLASSES = (
+    ("circuit is open", "circuit_open"),
+    ("ocr returned empty text", "ocr_empty"),
+    ("abandoned after", "abandoned"),
+    ("timed out waiting for", "limiter_timeout"),
+    ("timeout", "timeout"),
+    ("yandex ocr", "ocr"),
+    ("yandex gpt", "gpt"),
+    ("input_s3_url", "input"),
+)
+
+
+def error_class(error_message: str | None) -> str:
+    message = (error_message or "").lower()
+    for needle, name in _ERROR_CLASSES:
+        if needle in message:
+            return name
+    return "other"
+
+
+def record_job_failure(error_message: str | None) -> None:
+    JOB_OUTCOMES_TOTAL.labels(outcome="failed").inc()
+    JOB_ERRORS_TOTAL.labels(error_class=error_class(error_message)).inc()
+
+
+def render_metrics() -> tuple[bytes, str]:
+    """Текст для /metrics: в multiprocess-режиме — сумма по файлам всех процессов."""
+    registry = REGISTRY
+    if MULTIPROC_DIR:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    return generate_latest(registry), CONTENT_TYPE_LATEST
+
+
+def mark_process_dead() -> None:
+    # live-гейджи завершившегося процесса не должны попадать в сумму
+    if MULTIPROC_DIR:
+        multiprocess.mark_process_dead(os.getpid())
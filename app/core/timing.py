@@ -0,0 +1,144 @@
+from __future__ import annotations
+
+import json
+import logging
+import threading
+import time
+from contextvars import ContextVar
+from typing import Any
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class RequestTimings:
+    """Суммарные длительности стадий одного запроса (стадия может повторяться)."""
+
+    def __init__(self) -> None:
+        self.started = time.perf_counter()
+        self.stages: dict[str, float] = {}
+        self.closed = False
+        self._lock = threading.Lock()
+
+    def add(self, name: str, seconds: float) -> None:
+        with self._lock:
+            # после ответа (BackgroundTasks того же запроса) стадии уже не учитываются
+            if not self.closed:
+                self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def snapshot(self) -> dict[str, float]:
+        with self._lock:
+            return dict(self.stages)
+
+    def close(self) -> tuple[float, dict[str, float]]:
+        with self._lock:
+            self.closed = True
+            return time.perf_counter() - self.started, dict(self.stages)
+
+
+# Контекст копируется в потоки run_blocking/run_in_threadpool, объект общий на запрос
+_current: ContextVar[RequestTimings | None] = ContextVar("request_timings", default=None)
+
+
+class _Stage:
+    __slots__ = ("timings", "name", "started")
+
+    def __init__(self, timings: RequestTimings, name: str) -> None:
+        self.timings = timings
+        self.name = name
+
+    def __enter__(self) -> None:
+        self.started = time.perf_counter()
+
+    def __exit__(self, *_: Any) -> None:
+        self.timings.add(self.name, time.perf_counter() - self.started)
+
+
+class _NoopStage:
+    __slots__ = ()
+
+    def __enter__(self) -> None:
+        return None
+
+    def __exit__(self, *_: Any) -> None:
+        return None
+
+
+_NOOP = _NoopStage()
+
+
+def timed(name: str) -> _Stage | _NoopStage:
+    """with timed("s3_put"): ... — длительность блока попадает в Server-Timing и
+    лог медленных запросов. Вне запроса (или если замеры выключены) ничего не делает."""
+    timings = _current.get()
+    return _NOOP if timings is None else _Stage(timings, name)
+
+
+def add_timing(name: str, seconds: float) -> None:
+    timings = _current.get()
+    if timings is not None:
+        timings.add(name, seconds)
+
+
+def _server_timing(total: float, stages: dict[str, float]) -> bytes:
+    parts = [f"{name};dur={seconds * 1000:.1f}" for name, seconds in stages.items()]
+    parts.append(f"total;dur={total * 1000:.1f}")
+    return ", ".join(parts).encode("latin-1")
+
+
+class TimingMiddleware:
+    """Чистый ASGI-middleware: заголовок Server-Timing со стадиями запроса и одна
+    строка лога на запрос дольше SLOW_REQUEST_LOG_MS. Подключается только если
+    включено одно из двух (см. app.main)."""
+
+    def __init__(self, app: Any) -> None:
+        self.app = app
+        self.header_enabled = settings.server_timing_enabled
+        self.slow_threshold = settings.slow_request_log_ms / 1000
+
+    async def __call__(self, scope: dict, receive: Any, send: Any) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        timings = RequestTimings()
+        token = _current.set(timings)
+        status = 0
+        streaming = False
+
+        async def send_wrapper(message: dict) -> None:
+            nonlocal status, streaming
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                headers = message.get("headers") or []
+                streaming = any(k == b"content-type" and v.startswith(b"text/event-stream") for k, v in headers)
+                if self.header_enabled:
+                    total = time.perf_counter() - timings.started
+                    server_timing = _server_timing(total, timings.snapshot())
+                    message = {**message, "headers": [*headers, (b"server-timing", server_timing)]}
+            elif message["type"] == "http.response.body" and not message.get("more_body", False):
+                # конец ответа: BackgroundTasks выполняются уже после него
+                self._finish(scope, status, streaming, timings)
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _current.reset(token)
+            self._finish(scope, status, streaming, timings)
+
+    def _finish(self, scope: dict, status: int, streaming: bool, timings: RequestTimings) -> None:
+        if timings.closed:
+            return
+        total, stages = timings.close()
+        # SSE живёт долго по определению — не «медленный запрос»
+        if self.slow_threshold <= 0 or streaming or total < self.slow_threshold:
+            return
+        logger.warning(
+            "request.slow method=%s path=%s status=%s total_ms=%.0f stages=%s",
+            scope.get("method"),
+            scope.get("path"),
+            status,
+            total * 1000,
+            json.dumps({name: round(seconds * 1000, 1) for name, seconds in stages.items()}),
+        )
@@ -1,11 +1,14 @@
 import os
+import time
 from typing import Tuple, Dict, Any
 
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import Session, sessionmaker
 from sqlalchemy.pool import QueuePool
 
 from app.core.config import settings
+from app.core.metrics import DB_COMMIT_SECONDS, DB_POOL_CHECKED_OUT
+from app.core.timing import add_timing
 
 
 def _build_conn() -> Tuple[str, Dict[str, Any]]:
@@ -71,6 +74,36 @@ engine = create_engine(
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 
+@event.listens_for(engine, "checkout")
+def _on_checkout(*_: Any) -> None:
+    DB_POOL_CHECKED_OUT.inc()
+
+
+@event.listens_for(engine, "checkin")
+def _on_checkin(*_: Any) -> None:
+    DB_POOL_CHECKED_OUT.dec()
+
+
+# Время COMMIT (вместе с flush); метка source — из Session.info["metrics_source"]
+@event.listens_for(SessionLocal, "before_commit")
+def _on_before_commit(session: Session) -> None:
+    session.info["commit_started"] = time.perf_counter()
+
+
+@event.listens_for(SessionLocal, "after_commit")
+def _on_after_commit(session: Session) -> None:
+    started = session.info.pop("commit_started", None)
+    if started is not None:
+        elapsed = time.perf_counter() - started
+        DB_COMMIT_SECONDS.labels(source=session.info.get("metrics_source", "api")).observe(elapsed)
+        add_timing("db_commit", elapsed)
+
+
+@event.listens_for(SessionLocal, "after_rollback")
+def _on_after_rollback(session: Session) -> None:
+    session.info.pop("commit_started", None)
+
+
 def get_db():
     db = SessionLocal()
     try:
@@ -1,7 +1,7 @@
 from sqlalchemy import (
     Column, Text, Numeric, String, DateTime, ForeignKey,
     Boolean, Integer, JSON, func, Enum as SAEnum,
-    Index, UniqueConstraint, CheckConstraint
+    Index, UniqueConstraint, CheckConstraint, text
 )
 from sqlalchemy.dialects.postgresql import UUID, JSONB
 from sqlalchemy.ext.declarative import declarative_base
@@ -11,7 +11,7 @@ Base = declarative_base()
 
 # Enum types
 JobStatusEnum = SAEnum(
-    'waiting_payment', 'queued', 'processing', 'done', 'failed',
+    'waiting_payment', 'waiting_upload', 'queued', 'processing', 'done', 'failed',
     name='job_status', native_enum=True
 )
 
@@ -91,6 +91,21 @@ class Job(Base):
     __tablename__ = "jobs"
     __table_args__ = (
         Index('ix_jobs_request_id', 'request_id'),
+        Index('ix_jobs_input_sha256', 'input_sha256'),
+        Index(
+            'ix_jobs_detected_text_trgm', 'detected_text',
+            postgresql_using='gin',
+            postgresql_ops={'detected_text': 'gin_trgm_ops'},
+            postgresql_where=text("status = 'done'"),
+        ),
+        Index(
+            'ix_jobs_active_status_updated', 'status', 'updated_at',
+            postgresql_where=text("status IN ('queued', 'processing')"),
+        ),
+        Index(
+            'ix_jobs_waiting_upload_updated', 'updated_at',
+            postgresql_where=text("status = 'waiting_upload'"),
+        ),
         CheckConstraint('tokens_reserved >= 0', name='ck_jobs_tokens_reserved_nonneg'),
         CheckConstraint('tokens_consumed >= 0', name='ck_jobs_tokens_consumed_nonneg'),
         CheckConstraint('tokens_consumed <= tokens_reserved', name='ck_jobs_tokens_consumed_lte_reserved'),
@@ -105,6 +120,7 @@ class Job(Base):
     order_id = Column(Text, unique=True)
     input_s3_url = Column(Text)
     input_mime_type = Column(Text)
+    input_sha256 = Column(Text)
 
     # Основная логика
     status = Column(JobStatusEnum, default='waiting_payment', nullable=False)
@@ -130,6 +146,20 @@ class Job(Base):
     updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
 
 
+class OcrCacheEntry(Base):
+    __tablename__ = "ocr_cache"
+    __table_args__ = (
+        Index('ix_ocr_cache_last_hit_at', 'last_hit_at'),
+    )
+
+    content_sha256 = Column(Text, primary_key=True)
+    detected_text = Column(Text, nullable=False)
+    ocr_meta = Column(JSONB)
+    hits = Column(Integer, default=0, nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    last_hit_at = Column(DateTime(timezone=True), server_default=func.now())
+
+
 class Data(Base):
     __tablename__ = "data"
     __table_args__ = (
@@ -1,4 +1,6 @@
-from fastapi import FastAPI, APIRouter, Depends
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI, APIRouter, Depends, Response
 import logging
 import sys
 from starlette.middleware.sessions import SessionMiddleware
@@ -6,8 +8,14 @@ from starlette.middleware.cors import CORSMiddleware
 from fastapi.responses import ORJSONResponse
 
 from app.core.config import settings
+from app.core.loop_monitor import loop_lag_monitor
+from app.core.metrics import mark_process_dead, render_metrics
+from app.core.timing import TimingMiddleware
+from app.services.profiler import ProfilingMiddleware
 from app.api.deps import require_api_key
-from app.api.v1 import auth, jobs, transactions, users, webhooks, data, payments, tariffs
+from app.api.v1 import auth, jobs, transactions, users, webhooks, data, payments, tariffs, diagnostics
+from app.services.http_clients import get_upstream_clients
+from app.services.job_sweeper import job_sweeper
 
 def _configure_logging() -> None:
     """Инициализация базовой конфигурации логирования, если не настроена извне.
@@ -29,14 +37,35 @@ def _configure_logging() -> None:
 _configure_logging()
 
 
+@asynccontextmanager
+async def lifespan(_: FastAPI):
+    get_upstream_clients().open()
+    loop_lag_monitor.start()
+    job_sweeper.start()
+    try:
+        yield
+    finally:
+        await job_sweeper.stop()
+        await loop_lag_monitor.stop()
+        get_upstream_clients().close()
+        mark_process_dead()
+
+
 app = FastAPI(
     title="Neurolibrary API",
     version="0.1.0",
     default_response_class=ORJSONResponse,
+    lifespan=lifespan,
 )
 
 app.add_middleware(SessionMiddleware, secret_key=settings.jwt_secret_key)
 
+# без SERVER_TIMING_ENABLED и SLOW_REQUEST_LOG_MS middleware не подключается, timed() — no-op
+if settings.server_timing_enabled or settings.slow_request_log_ms > 0:
+    app.add_middleware(TimingMiddleware)
+if settings.profiler_enabled:
+    app.add_middleware(ProfilingMiddleware)
+
 # CORS
 cors_origins = [
     "https://xn-----glcep7bbaf7au.xn--p1ai/",
@@ -62,6 +91,7 @@ api_v1.include_router(users.public_router)
 api_v1.include_router(data.router, dependencies=[Depends(require_api_key)])
 api_v1.include_router(payments.router, dependencies=[Depends(require_api_key)])
 api_v1.include_router(tariffs.router, dependencies=[Depends(require_api_key)])
+api_v1.include_router(diagnostics.router, dependencies=[Depends(require_api_key)])
 api_v1.include_router(webhooks.router)  # вебхуки без API-ключа
 
 app.include_router(api_v1)
@@ -73,3 +103,9 @@ app.include_router(auth.router_public)
 @app.get("/health")
 def healthcheck() -> dict:
     return {"status": "ok", "env": settings.environment}
+
+
+@app.get("/metrics", include_in_schema=False)
+def metrics() -> Response:
+    body, content_type = render_metrics()
+    return Response(content=body, media_type=content_type)
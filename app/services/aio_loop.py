@@ -0,0 +1,46 @@
+from __future__ import annotations
+
+import asyncio
+import os
+import threading
+from typing import Any, Coroutine, TypeVar
+
+T = TypeVar("T")
+
+_loop: asyncio.AbstractEventLoop | None = None
+_lock = threading.Lock()
+
+
+def get_background_loop() -> asyncio.AbstractEventLoop:
+    """Общий фоновый event loop процесса (отдельный daemon-поток).
+
+    На нём живут асинхронные клиенты апстримов, чтобы синхронный код пайплайна
+    (BackgroundTasks, воркеры RQ) мог делить одно соединение и один поллер.
+    Вызывающий поток при этом не освобождается: run_coroutine блокирует его до
+    результата корутины.
+    """
+    global _loop
+    with _lock:
+        if _loop is None or _loop.is_closed():
+            loop = asyncio.new_event_loop()
+            thread = threading.Thread(target=loop.run_forever, name="aio-loop", daemon=True)
+            thread.start()
+            _loop = loop
+    return _loop
+
+
+def run_coroutine(coro: Coroutine[Any, Any, T], timeout: float | None = None) -> T:
+    """Выполняет корутину на фоновом loop и синхронно дожидается результата
+    (вызывающий поток стоит всё это время)."""
+    return asyncio.run_coroutine_threadsafe(coro, get_background_loop()).result(timeout)
+
+
+def _reset_after_fork() -> None:
+    # Поток loop не переживает fork (воркеры gunicorn/uvicorn, стандартный rq worker
+    # без PipelineWorker): в дочернем процессе loop создаётся заново
+    global _loop, _lock
+    _loop = None
+    _lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
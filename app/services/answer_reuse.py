@@ -0,0 +1,74 @@
+from __future__ import annotations
+
+import logging
+import re
+import uuid
+from typing import Any
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Триграммы только отбирают кандидатов: задачи, отличающиеся одним числом
+# ("x^2 - 5x + 6" и "x^2 - 5x + 4") или словом ("На сколько больше…" и
+# "На сколько меньше…"), набирают сходство выше 0.9
+CANDIDATES_LIMIT = 5
+
+# Оператор % использует GIN-индекс ix_jobs_detected_text_trgm (pg_trgm) по завершённым задачам
+_SIMILAR_JOB_SQL = text(
+    """
+    SELECT id, detected_text, generated_text, similarity(detected_text, :query) AS score
+    FROM jobs
+    WHERE status = 'done'
+      AND is_ok
+      AND generated_text IS NOT NULL
+      AND id <> :job_id
+      AND detected_text % :query
+    ORDER BY score DESC
+    LIMIT :limit
+    """
+)
+
+# Числа (с десятичной частью), слова на любом алфавите и математические знаки
+_TEXT_TOKEN = re.compile(r"\d+(?:[.,]\d+)*|[^\W\d_]+|[+\-*/^=<>()\[\]{}|√%]")
+# Варианты одного знака после OCR: минусы/тире, умножение, деление, ё
+_TEXT_CHARS = str.maketrans({"−": "-", "–": "-", "—": "-", "×": "*", "·": "*", "÷": "/", "ё": "е"})
+
+
+def text_signature(detected_text: str) -> str:
+    """Нормализованный текст задачи: слова в нижнем регистре, числа и знаки без
+    пробелов и пунктуации. У одной и той же задачи совпадает точно, у задач,
+    отличающихся числом, знаком или словом, — нет."""
+    return " ".join(_TEXT_TOKEN.findall(detected_text.lower().translate(_TEXT_CHARS)))
+
+
+def find_similar_answer(db: Session, detected_text: str, job_id: uuid.UUID) -> dict[str, Any] | None:
+    """Ищет решённую задачу с почти таким же detected_text (триграммное сходство)
+    и тем же нормализованным текстом (text_signature).
+
+    Возвращает {"jobId", "generatedText", "similarity"} или None, если сходство
+    ниже ANSWER_REUSE_MIN_SIMILARITY или ни у одного кандидата не совпал текст.
+    """
+    query = (detected_text or "").strip()
+    if len(query) < settings.answer_reuse_min_text_len:
+        return None
+    # порог действует только в рамках текущей транзакции
+    db.execute(
+        text("SELECT set_config('pg_trgm.similarity_threshold', :threshold, true)"),
+        {"threshold": str(settings.answer_reuse_min_similarity)},
+    )
+    rows = db.execute(_SIMILAR_JOB_SQL, {"query": query, "job_id": job_id, "limit": CANDIDATES_LIMIT}).all()
+    db.commit()
+    signature = text_signature(query)
+    for row in rows:
+        if text_signature(row.detected_text) != signature:
+            logger.info(
+                "answer_reuse.text_mismatch job_id=%s source_job_id=%s similarity=%.3f", job_id, row.id, row.score
+            )
+            continue
+        logger.info("answer_reuse.match job_id=%s source_job_id=%s similarity=%.3f", job_id, row.id, row.score)
+        return {"jobId": str(row.id), "generatedText": row.generated_text, "similarity": float(row.score)}
+    return None
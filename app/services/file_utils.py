@@ -1,18 +1,27 @@
 import os
 import tempfile
 from fastapi import UploadFile, HTTPException
-from typing import List
+from typing import Any, List
 import json
 from datetime import datetime
 import glob
 
+from app.core.blocking import run_blocking
+
 MAX_FILE_SIZE_BYTES = 50 * 1024 * 1024
 
-async def save_upload_to_temp(upload: UploadFile) -> str:
-	# Stream to disk and enforce size limit
+async def save_upload_to_temp(upload: UploadFile, hasher: Any | None = None) -> str:
+	# Stream to disk and enforce size limit; hasher (hashlib-объект) обновляется тем же потоком.
+	# Запись на диск и хэширование — в пуле блокирующего I/O, чтобы не держать event loop
 	suffix = os.path.splitext(upload.filename or "")[1]
-	handle = tempfile.NamedTemporaryFile(delete=False, suffix=suffix)
+	handle = await run_blocking(tempfile.NamedTemporaryFile, delete=False, suffix=suffix)
 	path = handle.name
+
+	def _write(chunk: bytes) -> None:
+		if hasher is not None:
+			hasher.update(chunk)
+		handle.write(chunk)
+
 	try:
 		written = 0
 		while True:
@@ -21,13 +30,13 @@ async def save_upload_to_temp(upload: UploadFile) -> str:
 				break
 			written += len(chunk)
 			if written > MAX_FILE_SIZE_BYTES:
-				handle.close()
-				os.remove(path)
+				await run_blocking(handle.close)
+				await run_blocking(os.remove, path)
 				raise HTTPException(status_code=413, detail="File too large (limit 50MB)")
-			handle.write(chunk)
+			await run_blocking(_write, chunk)
 		return path
 	finally:
-		handle.close()
+		await run_blocking(handle.close)
 
 
 def save_multiple_uploads_to_temp(uploads: List[UploadFile]) -> List[str]:
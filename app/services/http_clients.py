@@ -0,0 +1,176 @@
+from __future__ import annotations
+
+import logging
+import threading
+from dataclasses import dataclass
+from typing import Any
+
+import httpx
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+UPSTREAMS = ("yandex_ocr", "yandex_gpt", "vk_id", "yookassa")
+
+
+@dataclass(frozen=True)
+class UpstreamConfig:
+    name: str
+    timeout: float
+    max_connections: int
+    max_keepalive_connections: int
+    keepalive_expiry: float
+    http2: bool
+
+
+def _http2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def _build_configs() -> dict[str, UpstreamConfig]:
+    timeouts = {
+        "yandex_ocr": settings.yandex_ocr_timeout_seconds,
+        "yandex_gpt": settings.yandex_gpt_timeout_seconds,
+        "vk_id": settings.vk_id_timeout_seconds,
+        "yookassa": settings.yookassa_timeout_seconds,
+    }
+    http2_upstreams = {name.strip() for name in (settings.http2_upstreams or "").split(",") if name.strip()}
+    if http2_upstreams and not _http2_available():
+        logger.warning("http_clients.http2_unavailable: install httpx[http2], falling back to HTTP/1.1")
+        http2_upstreams = set()
+    return {
+        name: UpstreamConfig(
+            name=name,
+            timeout=timeouts[name],
+            max_connections=settings.http_pool_max_connections,
+            max_keepalive_connections=settings.http_pool_max_keepalive,
+            keepalive_expiry=settings.http_pool_keepalive_expiry_seconds,
+            http2=name in http2_upstreams,
+        )
+        for name in UPSTREAMS
+    }
+
+
+def _is_http2(conn: Any) -> bool:
+    # httpcore.HTTPConnection оборачивает HTTP11Connection/HTTP2Connection после установки соединения
+    return type(getattr(conn, "_connection", None)).__name__.endswith("HTTP2Connection")
+
+
+def _pool_stats(client: httpx.Client | httpx.AsyncClient | None) -> dict[str, Any] | None:
+    if client is None:
+        return None
+    pool = getattr(getattr(client, "_transport", None), "_pool", None)
+    if pool is None:
+        return {"closed": client.is_closed}
+    connections = list(pool.connections)
+    idle = sum(1 for conn in connections if conn.is_idle())
+    return {
+        "closed": client.is_closed,
+        "connections": len(connections),
+        "idle": idle,
+        "active": len(connections) - idle,
+        "http2": sum(1 for conn in connections if _is_http2(conn)),
+        "pendingRequests": len(getattr(pool, "_requests", []) or []),
+    }
+
+
+class UpstreamClientRegistry:
+    """Долгоживущие httpx-клиенты с keep-alive пулами, по одному на апстрим.
+
+    Синхронные клиенты потокобезопасны и общие для всего процесса. Асинхронные
+    используются только на фоновом loop (app.services.aio_loop) — там же и закрываются.
+    """
+
+    def __init__(self) -> None:
+        self._configs: dict[str, UpstreamConfig] | None = None
+        self._sync: dict[str, httpx.Client] = {}
+        self._async: dict[str, httpx.AsyncClient] = {}
+        self._lock = threading.Lock()
+
+    def config(self, name: str) -> UpstreamConfig:
+        if self._configs is None:
+            self._configs = _build_configs()
+        try:
+            return self._configs[name]
+        except KeyError:
+            raise ValueError(f"Unknown upstream: {name}") from None
+
+    def _client_kwargs(self, name: str) -> dict[str, Any]:
+        cfg = self.config(name)
+        return {
+            "timeout": cfg.timeout,
+            "limits": httpx.Limits(
+                max_connections=cfg.max_connections,
+                max_keepalive_connections=cfg.max_keepalive_connections,
+                keepalive_expiry=cfg.keepalive_expiry,
+            ),
+            "http2": cfg.http2,
+        }
+
+    def sync_client(self, name: str) -> httpx.Client:
+        client = self._sync.get(name)
+        if client is None or client.is_closed:
+            with self._lock:
+                client = self._sync.get(name)
+                if client is None or client.is_closed:
+                    client = httpx.Client(**self._client_kwargs(name))
+                    self._sync[name] = client
+        return client
+
+    def async_client(self, name: str) -> httpx.AsyncClient:
+        client = self._async.get(name)
+        if client is None or client.is_closed:
+            with self._lock:
+                client = self._async.get(name)
+                if client is None or client.is_closed:
+                    client = httpx.AsyncClient(**self._client_kwargs(name))
+                    self._async[name] = client
+        return client
+
+    def open(self) -> None:
+        for name in UPSTREAMS:
+            self.sync_client(name)
+        logger.info("http_clients.opened upstreams=%s", ",".join(UPSTREAMS))
+
+    def close(self) -> None:
+        from app.services.aio_loop import run_coroutine
+
+        with self._lock:
+            sync_clients = list(self._sync.values())
+            async_clients = list(self._async.values())
+            self._sync.clear()
+            self._async.clear()
+        for client in sync_clients:
+            client.close()
+        for client in async_clients:
+            try:
+                run_coroutine(client.aclose(), timeout=5.0)
+            except Exception:
+                logger.warning("http_clients.async_close_failed", exc_info=True)
+        logger.info("http_clients.closed")
+
+    def stats(self) -> dict[str, Any]:
+        result: dict[str, Any] = {}
+        for name in UPSTREAMS:
+            cfg = self.config(name)
+            result[name] = {
+                "timeout": cfg.timeout,
+                "maxConnections": cfg.max_connections,
+                "maxKeepalive": cfg.max_keepalive_connections,
+                "http2Enabled": cfg.http2,
+                "sync": _pool_stats(self._sync.get(name)),
+                "async": _pool_stats(self._async.get(name)),
+            }
+        return result
+
+
+_registry = UpstreamClientRegistry()
+
+
+def get_upstream_clients() -> UpstreamClientRegistry:
+    return _registry
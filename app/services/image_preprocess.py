@@ -0,0 +1,85 @@
+from __future__ import annotations
+
+import io
+import logging
+from typing import Any, Tuple
+
+from PIL import Image, ImageOps
+from pillow_heif import register_heif_opener
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# HEIC/HEIF с iPhone открываются через Image.open, OCR получает JPEG
+register_heif_opener()
+
+PREPROCESSABLE_MIME_TYPES = {
+    "image/jpeg",
+    "image/jpg",
+    "image/png",
+    "image/webp",
+    "image/bmp",
+    "image/tiff",
+    "image/heic",
+    "image/heif",
+}
+# Форматы, которые OCR принимает как есть, если пережатие не уменьшило файл
+OCR_NATIVE_MIME_TYPES = {"image/jpeg", "image/jpg", "image/png"}
+_EXIF_ORIENTATION = 0x0112
+
+
+def _to_rgb(img: Image.Image) -> Image.Image:
+    if img.mode in ("RGBA", "LA") or (img.mode == "P" and "transparency" in img.info):
+        # прозрачность → белый фон, как у бумажной страницы
+        rgba = img.convert("RGBA")
+        background = Image.new("RGB", rgba.size, (255, 255, 255))
+        background.paste(rgba, mask=rgba.getchannel("A"))
+        return background
+    if img.mode != "RGB":
+        return img.convert("RGB")
+    return img
+
+
+def _open_image(content: Any) -> Image.Image:
+    if hasattr(content, "read") and hasattr(content, "seek"):
+        # mmap читается напрямую, без копии в BytesIO
+        content.seek(0)
+        return Image.open(content)
+    return Image.open(io.BytesIO(content))
+
+
+def preprocess_image(content: bytes, mime_type: str | None) -> Tuple[bytes, str | None, dict[str, Any]]:
+    """Готовит изображение к OCR: EXIF-поворот, ограничение длинной стороны,
+    перекодирование в JPEG без метаданных.
+
+    Возвращает (content, mime_type, meta). При ошибке или неподдерживаемом типе
+    возвращает исходные данные — предобработка не должна ронять задачу.
+    """
+    mime = (mime_type or "").lower()
+    meta: dict[str, Any] = {"bytesBefore": len(content), "mimeBefore": mime_type}
+    if mime not in PREPROCESSABLE_MIME_TYPES:
+        return content, mime_type, {**meta, "bytesAfter": len(content), "skipped": "unsupported_mime"}
+
+    max_side = settings.image_max_side_px
+    try:
+        img = _open_image(content)
+        meta["sizeBefore"] = list(img.size)
+        rotated = img.getexif().get(_EXIF_ORIENTATION, 1) != 1
+        # для JPEG декодируем сразу в уменьшенном масштабе (DCT scaling)
+        img.draft("RGB", (max_side, max_side))
+        img = ImageOps.exif_transpose(img)
+        resized = max(meta["sizeBefore"]) > max_side
+        img.thumbnail((max_side, max_side), Image.LANCZOS)
+        img = _to_rgb(img)
+        out = io.BytesIO()
+        img.save(out, format="JPEG", quality=settings.image_jpeg_quality, optimize=True)
+        result = out.getvalue()
+    except Exception as exc:
+        logger.warning("image_preprocess.failed mime=%s error=%s", mime_type, exc)
+        return content, mime_type, {**meta, "bytesAfter": len(content), "skipped": "error", "error": str(exc)}
+
+    meta.update({"sizeAfter": list(img.size), "rotated": rotated, "resized": resized})
+    if len(result) >= len(content) and not rotated and not resized and mime in OCR_NATIVE_MIME_TYPES:
+        return content, mime_type, {**meta, "bytesAfter": len(content), "skipped": "not_smaller"}
+    return result, "image/jpeg", {**meta, "bytesAfter": len(result), "mimeAfter": "image/jpeg"}
@@ -0,0 +1,56 @@
+from __future__ import annotations
+
+import json
+import logging
+from typing import Any, AsyncIterator
+
+from app.core.timing import timed
+from app.services.redis_client import get_async_redis, get_redis
+
+logger = logging.getLogger(__name__)
+
+CHANNEL_PREFIX = "job_events:"
+TERMINAL_EVENTS = ("done", "failed")
+
+
+def job_channel(job_id: str) -> str:
+    return f"{CHANNEL_PREFIX}{job_id}"
+
+
+def publish_job_event(job_id: str, event: str, data: dict[str, Any] | None = None) -> None:
+    """Публикует событие задачи в Redis pub/sub (best effort: ошибки только логируются)."""
+    try:
+        with timed("publish_event"):
+            get_redis().publish(job_channel(job_id), json.dumps({"event": event, "data": data or {}}, ensure_ascii=False))
+    except Exception:
+        logger.warning("job_events.publish_failed job_id=%s event=%s", job_id, event)
+
+
+class JobEventSubscription:
+    """Подписка на события одной задачи; оформляется до чтения снимка из БД,
+    чтобы не потерять события между снимком и подпиской."""
+
+    def __init__(self, job_id: str) -> None:
+        self.job_id = job_id
+        self._pubsub = get_async_redis().pubsub()
+
+    async def open(self) -> None:
+        await self._pubsub.subscribe(job_channel(self.job_id))
+
+    async def close(self) -> None:
+        try:
+            await self._pubsub.unsubscribe(job_channel(self.job_id))
+        finally:
+            await self._pubsub.aclose()
+
+    async def events(self, idle_timeout: float) -> AsyncIterator[dict[str, Any] | None]:
+        """Отдаёт события по мере поступления; None — если за idle_timeout ничего не пришло."""
+        while True:
+            message = await self._pubsub.get_message(ignore_subscribe_messages=True, timeout=idle_timeout)
+            if message is None:
+                yield None
+                continue
+            try:
+                yield json.loads(message["data"])
+            except (TypeError, ValueError):
+                logger.warning("job_events.bad_message job_id=%s", self.job_id)
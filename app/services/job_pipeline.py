@@ -1,27 +1,594 @@
 from __future__ import annotations
 
+import hashlib
 import json
 import logging
+import mmap
 import os
+import time
 import uuid
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Any, Callable, Iterator
 
+import httpx
+from sqlalchemy import text, update
 from sqlalchemy.orm import Session
 
+from app.core.config import settings
+from app.core.metrics import JOB_OUTCOMES_TOTAL, PIPELINES_IN_FLIGHT, record_job_failure
 from app.database import SessionLocal
 from app.db.models import Job
-from app.services.yandex_ocr_service import get_ocr_service
+from app.services import answer_reuse, ocr_cache
+from app.services.aio_loop import run_coroutine
+from app.services.image_preprocess import preprocess_image
+from app.services.job_events import publish_job_event
+from app.services.meta_storage import store_meta
+from app.services.pdf_split import PDF_MIME_TYPE, is_pdf, split_pdf
+from app.services.page_ocr import PageResult, PageTask, merge_page_texts, recognize_pages
+from app.services.profiler import profile_pipeline_runs
+from app.services.rate_limiter import get_limiter
+from app.services.resilience import CircuitOpenError, get_guard
+from app.services.s3 import download_to_temp
+from app.services.yandex_ocr_service import OCROperationPending, get_async_ocr_service, get_ocr_service
 from app.services.yandex_gpt_service import get_gpt_service
 
 logger = logging.getLogger(__name__)
 
+# метка source для db_commit_seconds (см. app.database)
+PIPELINE_SESSION_INFO = {"metrics_source": "pipeline"}
 
-def _load_file(path: str) -> bytes:
+# pipeline_meta["ocrOperations"]: часть (страница, кусок PDF) → operation_id.
+# Пишется из потоков частей атомарным слиянием jsonb, без чтения строки
+_MERGE_OCR_OPERATION_SQL = text(
+    """
+    UPDATE jobs
+    SET pipeline_meta = coalesce(pipeline_meta, '{}'::jsonb) || jsonb_build_object(
+        'ocrOperations',
+        coalesce(pipeline_meta -> 'ocrOperations', '{}'::jsonb) || jsonb_build_object(:part, :operation_id)
+    )
+    WHERE id = :job_id
+    """
+)
+_MERGE_PAGES_SQL = text(
+    """
+    UPDATE jobs
+    SET pipeline_meta = coalesce(pipeline_meta, '{}'::jsonb) || jsonb_build_object('pages', CAST(:pages AS jsonb))
+    WHERE id = :job_id
+    """
+)
+
+
+class PartsPending(OCROperationPending):
+    """Не завершилась операция одной из частей (страницы или куска PDF). id операций
+    частей уже в pipeline_meta["ocrOperations"]: задача откладывается целиком, а при
+    перезапуске части дожидаются своих операций, а не отправляются заново."""
+
+
+def _map_file(path: str) -> mmap.mmap | bytes:
+    """Отображает файл в память только на чтение: без копии в куче процесса."""
     with open(path, "rb") as f:
-        return f.read()
+        if os.fstat(f.fileno()).st_size == 0:
+            return b""
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def _recognize_once(
+    content: bytes,
+    content_type: str | None,
+    on_submitted: Callable[[str], None] | None = None,
+) -> tuple[str, dict]:
+    if settings.ocr_async_poller_enabled:
+        # опрос операции — в общем поллере фонового loop (одно соединение и один
+        # запрос статуса на все операции процесса за интервал), но этот поток всё
+        # равно стоит в run_coroutine до результата: пайплайн синхронный
+        return run_coroutine(
+            get_async_ocr_service().recognize(
+                content,
+                mime_type=content_type,
+                poll_timeout=settings.ocr_poll_timeout_seconds,
+                on_submitted=on_submitted,
+            )
+        )
+    return get_ocr_service().recognize(
+        content,
+        mime_type=content_type,
+        poll_timeout=settings.ocr_poll_timeout_seconds,
+        poll_interval=settings.ocr_poll_interval_seconds,
+        on_submitted=on_submitted,
+    )
+
+
+def _fetch_once(operation_id: str) -> tuple[str, dict]:
+    if settings.ocr_async_poller_enabled:
+        return run_coroutine(
+            get_async_ocr_service().fetch(operation_id, poll_timeout=settings.ocr_poll_timeout_seconds)
+        )
+    return get_ocr_service().fetch(
+        operation_id,
+        poll_timeout=settings.ocr_poll_timeout_seconds,
+        poll_interval=settings.ocr_poll_interval_seconds,
+    )
+
+
+def _recognize(
+    content: bytes,
+    content_type: str | None,
+    on_submitted: Callable[[str], None] | None = None,
+) -> tuple[str, dict]:
+    submitted: list[str] = []
+
+    def remember(operation_id: str) -> None:
+        submitted.append(operation_id)
+        if on_submitted is not None:
+            on_submitted(operation_id)
+
+    def attempt() -> tuple[str, dict]:
+        # повтор после ошибки опроса продолжает ту же операцию, файл заново не отправляется
+        if submitted:
+            return _fetch_once(submitted[-1])
+        return _recognize_once(content, content_type, remember)
+
+    # повторы и circuit breaker апстрима OCR; без hedging: дубль attempt либо
+    # отправил бы файл второй раз (новая платная операция), либо опрашивал ту же
+    return get_guard("yandex_ocr").call(attempt, hedge=False)
+
+
+def _persist_operation(job_uuid: uuid.UUID) -> Callable[[str], None]:
+    """Колбэк: записывает operation_id сразу после отправки, чтобы долгую
+    операцию можно было дождаться позже, а не отправлять файл повторно."""
+
+    def on_submitted(operation_id: str) -> None:
+        db = SessionLocal(info=PIPELINE_SESSION_INFO)
+        try:
+            db.execute(
+                update(Job)
+                .where(Job.id == job_uuid)
+                .values(ocr_operation_id=operation_id, ocr_status="pending")
+            )
+            db.commit()
+        except Exception:
+            db.rollback()
+            logger.warning("job_pipeline.persist_operation_failed job_id=%s", job_uuid, exc_info=True)
+        finally:
+            db.close()
+
+    return on_submitted
+
+
+def _persist_part_operation(job_uuid: uuid.UUID, part: str) -> Callable[[str], None]:
+    """Как _persist_operation, но для части многочастной задачи: operation_id
+    пишется в pipeline_meta["ocrOperations"][part]."""
+
+    def on_submitted(operation_id: str) -> None:
+        db = SessionLocal(info=PIPELINE_SESSION_INFO)
+        try:
+            db.execute(_MERGE_OCR_OPERATION_SQL, {"job_id": job_uuid, "part": part, "operation_id": operation_id})
+            db.commit()
+        except Exception:
+            db.rollback()
+            logger.warning("job_pipeline.persist_operation_failed job_id=%s part=%s", job_uuid, part, exc_info=True)
+        finally:
+            db.close()
+
+    return on_submitted
+
+
+def _fetch_saved(operation_id: str, job_id: str) -> tuple[str, dict] | None:
+    """Дожидается сохранённой операции. None — операции в Yandex уже нет (404)."""
+    try:
+        return get_guard("yandex_ocr").call(lambda: _fetch_once(operation_id), hedge=False)
+    except httpx.HTTPStatusError as exc:
+        if exc.response.status_code != 404:
+            raise
+    logger.warning("job_pipeline.ocr_operation_expired job_id=%s operation_id=%s", job_id, operation_id)
+    return None
+
+
+def _recognize_part(
+    job_uuid: uuid.UUID,
+    operations: dict[str, str],
+    part: str,
+    content: Any,
+    content_type: str | None,
+) -> tuple[str, dict]:
+    """OCR части: после отложенного перезапуска дожидается её сохранённой операции,
+    иначе отправляет и сразу записывает operation_id."""
+    operation_id = operations.get(part)
+    if operation_id:
+        fetched = _fetch_saved(operation_id, str(job_uuid))
+        if fetched is not None:
+            return fetched
+    return _recognize(content, content_type, _persist_part_operation(job_uuid, part))
+
+
+def _recognize_all_pages(tasks: list[PageTask], on_page_done: Callable[[PageResult], None]) -> list[PageResult]:
+    """recognize_pages, в котором долгая часть не прерывает остальные: части с
+    незавершённой операцией собираются, и после всех — PartsPending."""
+    pending: list[str] = []
+
+    def deferrable(task: PageTask) -> PageTask:
+        def run() -> tuple[str, dict]:
+            try:
+                return task()
+            except OCROperationPending as exc:
+                pending.append(exc.operation_id)
+                return "", {"ocrPending": exc.operation_id}
+
+        return run
+
+    def on_done(result: PageResult) -> None:
+        if "ocrPending" not in result.meta:
+            on_page_done(result)
+
+    results = recognize_pages([deferrable(task) for task in tasks], on_done)
+    if pending:
+        raise PartsPending(pending[0])
+    return results
+
+
+def _recognize_pdf(
+    content: mmap.mmap | bytes,
+    job_uuid: uuid.UUID,
+    operations: dict[str, str],
+    part_prefix: str = "pdf",
+) -> tuple[str, dict]:
+    """OCR PDF: режем на куски по OCR_PDF_PAGES_PER_CHUNK страниц и распознаём
+    их параллельно — время документа ≈ время самого медленного куска.
+    Долгий кусок откладывает задачу (PartsPending), а не валит её."""
+    job_id = str(job_uuid)
+    chunks = split_pdf(content, settings.ocr_pdf_pages_per_chunk, settings.ocr_pdf_max_pages)
+    total_pages = chunks[-1][1] + 1
+    done_count = 0
+
+    def on_page_done(result: PageResult) -> None:
+        nonlocal done_count
+        done_count += 1
+        publish_job_event(
+            job_id, "page_done", {"page": result.index, "pagesDone": done_count, "pagesTotal": len(chunks)}
+        )
+
+    def chunk_task(first: int, last: int, data: bytes) -> PageTask:
+        part = f"{part_prefix}:{first}-{last}"
+        return lambda: _recognize_part(job_uuid, operations, part, data, PDF_MIME_TYPE)
+
+    results = _recognize_all_pages([chunk_task(*chunk) for chunk in chunks], on_page_done)
+    ocr_meta = {
+        "pdfPages": total_pages,
+        "chunks": [
+            {
+                "pages": [first, last],
+                "operationId": r.meta.get("operationId"),
+                "elapsedMs": r.elapsed_ms,
+                "detectedTextLen": len(r.text or ""),
+            }
+            for (first, last, _), r in zip(chunks, results)
+        ],
+        "pageTimingsMs": [r.elapsed_ms for r in results],
+    }
+    logger.info(
+        "job_pipeline.pdf_recognized job_id=%s pages=%s chunks=%s slowest_ms=%s",
+        job_id,
+        total_pages,
+        len(chunks),
+        max(ocr_meta["pageTimingsMs"]),
+    )
+    return merge_page_texts(results), ocr_meta
+
+
+def _lookup_cached(db: Session, content_hash: str, job_id: str) -> tuple[str, dict] | None:
+    if not settings.ocr_cache_enabled:
+        return None
+    try:
+        cached = ocr_cache.lookup(db, content_hash)
+    except Exception:
+        db.rollback()
+        logger.warning("job_pipeline.ocr_cache_lookup_failed job_id=%s", job_id, exc_info=True)
+        return None
+    if cached is None:
+        return None
+    detected_text, ocr_meta = cached
+    logger.info("job_pipeline.ocr_cache_hit job_id=%s sha256=%s", job_id, content_hash)
+    return detected_text, {**ocr_meta, "cacheHit": True}
+
+
+def _store_cached(content_hash: str, detected_text: str, ocr_meta: dict, job_id: str) -> None:
+    if not settings.ocr_cache_enabled:
+        return
+    try:
+        ocr_cache.store(content_hash, detected_text, ocr_meta)
+    except Exception:
+        logger.warning("job_pipeline.ocr_cache_store_failed job_id=%s", job_id, exc_info=True)
+
+
+def _preprocess(content: mmap.mmap | bytes, content_type: str | None, job_id: str) -> tuple[Any, str | None, dict | None]:
+    if is_pdf(content_type) or not settings.image_preprocess_enabled:
+        return content, content_type, None
+    content, content_type, preprocess_meta = preprocess_image(content, content_type)
+    logger.info(
+        "job_pipeline.preprocessed job_id=%s bytes_before=%s bytes_after=%s",
+        job_id,
+        preprocess_meta.get("bytesBefore"),
+        preprocess_meta.get("bytesAfter"),
+    )
+    return content, content_type, preprocess_meta
+
 
+def _recognize_input(
+    content: Any,
+    content_type: str | None,
+    job_uuid: uuid.UUID,
+    operations: dict[str, str],
+    part: str | None = None,
+    on_submitted: Callable[[str], None] | None = None,
+) -> tuple[str, dict]:
+    """OCR входа задачи (part=None) или одной её страницы (part="page:<i>")."""
+    if is_pdf(content_type):
+        return _recognize_pdf(content, job_uuid, operations, f"{part}:pdf" if part else "pdf")
+    if part is not None:
+        return _recognize_part(job_uuid, operations, part, content, content_type)
+    return _recognize(content, content_type, on_submitted)
 
-def process_job_pipeline(job_id: str, temp_path: str, content_type: str | None = None) -> None:
-    db: Session = SessionLocal()
+
+def _resume_ocr(db: Session, job: Job) -> bool:
+    """Дожидается сохранённой операции OCR вместо повторной отправки файла.
+    False — операции в Yandex уже нет, распознавать нужно заново."""
+    job_id = str(job.id)
+    operation_id = job.ocr_operation_id
+    logger.info("job_pipeline.ocr_resume job_id=%s operation_id=%s", job_id, operation_id)
+    fetched = _fetch_saved(operation_id, job_id)
+    if fetched is None:
+        job.ocr_operation_id = None
+        job.ocr_status = None
+        return False
+    detected_text, ocr_meta = fetched
+    if job.input_sha256:
+        _store_cached(job.input_sha256, detected_text, ocr_meta, job_id)
+    job.detected_text = detected_text
+    job.ocr_status = "done"
+    job.pipeline_meta = {**(job.pipeline_meta or {}), "ocr": store_meta(job, "ocr", ocr_meta)}
+    return True
+
+
+def _recognize_cached(
+    db: Session,
+    content: mmap.mmap | bytes,
+    content_type: str | None,
+    content_hash: str,
+    job_uuid: uuid.UUID,
+    operations: dict[str, str],
+    part: str,
+) -> tuple[str, dict, dict | None]:
+    """OCR одной страницы: сначала кэш по SHA-256, иначе предобработка и распознавание.
+
+    Возвращает (detected_text, ocr_meta, preprocess_meta | None).
+    """
+    job_id = str(job_uuid)
+    cached = _lookup_cached(db, content_hash, job_id)
+    if cached:
+        return cached[0], cached[1], None
+    content, content_type, preprocess_meta = _preprocess(content, content_type, job_id)
+    detected_text, ocr_meta = _recognize_input(content, content_type, job_uuid, operations, part)
+    _store_cached(content_hash, detected_text, ocr_meta, job_id)
+    return detected_text, ocr_meta, preprocess_meta
+
+
+def _page_task(job_uuid: uuid.UUID, index: int, page: dict, operations: dict[str, str]) -> PageTask:
+    def run() -> tuple[str, dict]:
+        # у потока страницы своя сессия: Session не потокобезопасна
+        db = SessionLocal(info=PIPELINE_SESSION_INFO)
+        path = None
+        mapped: mmap.mmap | bytes = b""
+        try:
+            path = download_to_temp(page["s3Url"])
+            mapped = _map_file(path)
+            content_hash = page.get("sha256") or hashlib.sha256(mapped).hexdigest()
+            text, ocr_meta, preprocess_meta = _recognize_cached(
+                db, mapped, page.get("mimeType"), content_hash, job_uuid, operations, f"page:{index}"
+            )
+            if preprocess_meta is not None:
+                ocr_meta = {**ocr_meta, "preprocess": preprocess_meta}
+            return text, ocr_meta
+        finally:
+            db.close()
+            if isinstance(mapped, mmap.mmap):
+                mapped.close()
+            if path and os.path.exists(path):
+                os.remove(path)
+
+    return run
+
+
+def _ocr_pages(db: Session, job: Job) -> tuple[str, dict]:
+    """OCR многостраничной задачи: страницы распознаются параллельно,
+    прогресс по каждой пишется в pipeline_meta["pages"]."""
+    job_id = str(job.id)
+    operations = dict(job.pipeline_meta.get("ocrOperations") or {})
+    pages = [dict(p) for p in job.pipeline_meta["pages"]]
+    for page in pages:
+        page["status"] = "processing"
+    job.pipeline_meta = {**job.pipeline_meta, "pages": pages}
+    db.commit()
+
+    done_count = 0
+
+    def on_page_done(result: PageResult) -> None:
+        nonlocal done_count
+        done_count += 1
+        pages[result.index] = {
+            **pages[result.index],
+            "status": "done",
+            "elapsedMs": result.elapsed_ms,
+            "detectedTextLen": len(result.text or ""),
+            "cacheHit": bool(result.meta.get("cacheHit")),
+        }
+        # слиянием в SQL, а не присваиванием pipeline_meta: потоки страниц в это
+        # время дописывают ocrOperations из своих сессий
+        db.execute(_MERGE_PAGES_SQL, {"job_id": job.id, "pages": json.dumps(pages, ensure_ascii=False)})
+        db.commit()
+        publish_job_event(
+            job_id, "page_done", {"page": result.index, "pagesDone": done_count, "pagesTotal": len(pages)}
+        )
+
+    tasks = [_page_task(job.id, index, page, operations) for index, page in enumerate(pages)]
+    results = _recognize_all_pages(tasks, on_page_done)
+    ocr_meta = {
+        "pages": [{k: v for k, v in r.meta.items() if k != "raw"} for r in results],
+        "pageTimingsMs": [r.elapsed_ms for r in results],
+    }
+    return merge_page_texts(results), ocr_meta
+
+
+def _generate(db: Session, job: Job, detected_text: str) -> tuple[str, dict]:
+    job_id = str(job.id)
+    # почти такой же текст уже решали — берём готовый ответ
+    reused = None
+    if settings.answer_reuse_enabled:
+        try:
+            reused = answer_reuse.find_similar_answer(db, detected_text, job.id)
+        except Exception:
+            db.rollback()
+            logger.warning("job_pipeline.answer_reuse_failed job_id=%s", job_id, exc_info=True)
+    if reused:
+        return reused["generatedText"], {"reusedFromJobId": reused["jobId"], "similarity": reused["similarity"]}
+    if not settings.gpt_streaming_enabled:
+        # без hedging: дублирующий responses.create — второй платный ответ
+        return get_guard("yandex_gpt").call(lambda: get_gpt_service().generate(detected_text), hedge=False)
+
+    streamed = False
+
+    def on_delta(delta: str) -> None:
+        nonlocal streamed
+        streamed = True
+        publish_job_event(job_id, "gpt_delta", {"delta": delta})
+
+    def attempt() -> tuple[str, dict]:
+        nonlocal streamed
+        if streamed:
+            # повтор после частично отданного потока: клиент начинает ответ заново
+            publish_job_event(job_id, "gpt_reset")
+            streamed = False
+        return get_gpt_service().generate(detected_text, on_delta=on_delta)
+
+    # два параллельных потока перемешали бы дельты — при стриминге без hedging
+    return get_guard("yandex_gpt").call(attempt, hedge=False)
+
+
+def _stage_done(job: Job, stage: str) -> bool:
+    return ((job.pipeline_meta or {}).get("stages") or {}).get(stage, {}).get("status") == "done"
+
+
+def _set_stage(job: Job, stage: str, **fields: Any) -> None:
+    meta = dict(job.pipeline_meta or {})
+    stages = dict(meta.get("stages") or {})
+    stages[stage] = {**(stages.get(stage) or {}), **fields}
+    meta["stages"] = stages
+    job.pipeline_meta = meta
+
+
+@contextmanager
+def _stage(db: Session, job: Job, stage: str) -> Iterator[None]:
+    """Чекпоинт стадии в pipeline_meta["stages"]: running → done | failed.
+
+    Результат стадии коммитится вместе с отметкой done, поэтому после падения
+    повторный запуск видит либо завершённую стадию с её выходом, либо незавершённую.
+    """
+    job_id = str(job.id)
+    started = time.monotonic()
+    _set_stage(job, stage, status="running", startedAt=datetime.now(timezone.utc).isoformat(), error=None)
+    db.commit()
+    try:
+        yield
+    except OCROperationPending as exc:
+        db.rollback()
+        _set_stage(job, stage, status="pending", operationId=exc.operation_id)
+        db.commit()
+        raise
+    except Exception as exc:
+        db.rollback()
+        _set_stage(job, stage, status="failed", error=str(exc)[:500], elapsedMs=int((time.monotonic() - started) * 1000))
+        db.commit()
+        logger.warning("job_pipeline.stage_failed job_id=%s stage=%s", job_id, stage)
+        raise
+    _set_stage(job, stage, status="done", elapsedMs=int((time.monotonic() - started) * 1000))
+    db.commit()
+    logger.info("job_pipeline.stage_done job_id=%s stage=%s", job_id, stage)
+
+
+def _mark_failed(db: Session, job_uuid: uuid.UUID, error_message: str) -> None:
+    failed_job = db.query(Job).filter(Job.id == job_uuid).first()
+    if failed_job:
+        failed_job.status = "failed"
+        failed_job.error_message = error_message
+        db.commit()
+    record_job_failure(error_message)
+    publish_job_event(str(job_uuid), "failed", {"errorMessage": error_message})
+
+
+def _park(db: Session, job_uuid: uuid.UUID, exc: CircuitOpenError) -> None:
+    """Апстрим лежит: задача возвращается в queued с пометкой parked, её
+    перезапустит sweeper через JOB_PARKED_RETRY_SECONDS (без расхода попыток)."""
+    job = db.query(Job).filter(Job.id == job_uuid).first()
+    if not job:
+        return
+    job.status = "queued"
+    job.pipeline_meta = {
+        **(job.pipeline_meta or {}),
+        "parked": {"upstream": exc.upstream, "at": datetime.now(timezone.utc).isoformat()},
+    }
+    db.commit()
+    JOB_OUTCOMES_TOTAL.labels(outcome="parked").inc()
+    logger.warning("job_pipeline.parked job_id=%s upstream=%s", job_uuid, exc.upstream)
+    publish_job_event(str(job_uuid), "queued", {"parked": True})
+
+
+def _defer_ocr(db: Session, job_uuid: uuid.UUID, exc: OCROperationPending) -> None:
+    """Операция OCR не уложилась в дедлайн опроса: задача возвращается в queued,
+    а пайплайн перезапускается через OCR_RESUME_DELAY_SECONDS и продолжает опрос."""
+    job = db.query(Job).filter(Job.id == job_uuid).first()
+    if not job:
+        return
+    meta = dict(job.pipeline_meta or {})
+    resumes = int(meta.get("ocrResumes") or 0) + 1
+    if resumes > settings.ocr_resume_max_attempts:
+        logger.warning("job_pipeline.ocr_resume_exhausted job_id=%s operation_id=%s", job_uuid, exc.operation_id)
+        # больше не опрашиваем — слоты квоты операций отпускаем, не дожидаясь аренды
+        for operation_id in {exc.operation_id, *(meta.get("ocrOperations") or {}).values()}:
+            get_limiter("yandex_ocr").release_operation(operation_id)
+        _mark_failed(db, job_uuid, "Yandex OCR operation timeout")
+        return
+    meta["ocrResumes"] = resumes
+    job.pipeline_meta = meta
+    if not isinstance(exc, PartsPending):
+        # у многочастной задачи операции частей — в pipeline_meta["ocrOperations"]
+        job.ocr_operation_id = exc.operation_id
+    job.ocr_status = "pending"
+    # отложенный запуск захватывает задачу так же, как первый (status queued)
+    job.status = "queued"
+    db.commit()
+    JOB_OUTCOMES_TOTAL.labels(outcome="deferred").inc()
+    logger.info(
+        "job_pipeline.ocr_deferred job_id=%s operation_id=%s attempt=%s", job_uuid, exc.operation_id, resumes
+    )
+    publish_job_event(str(job_uuid), "queued", {"ocrPending": True})
+    # job_queue импортирует этот модуль — импорт здесь, чтобы не было цикла
+    from app.services.job_queue import schedule_job_pipeline
+
+    schedule_job_pipeline(str(job_uuid), settings.ocr_resume_delay_seconds)
+
+
+@PIPELINES_IN_FLIGHT.track_inprogress()
+@profile_pipeline_runs
+def process_job_pipeline(job_id: str, temp_path: str | None = None, content_type: str | None = None) -> None:
+    """Пайплайн задачи: стадии preprocess → ocr → gpt → finalize.
+
+    temp_path — локальная копия входа (режим BackgroundTasks). Если её нет
+    (воркер RQ на другой машине, рестарт, повтор), вход скачивается из input_s3_url.
+    Стадии с чекпоинтом done и сохранённым результатом пропускаются — повторный
+    запуск после сбоя продолжает с первой незавершённой стадии.
+    """
+    db: Session = SessionLocal(info=PIPELINE_SESSION_INFO)
+    mapped: mmap.mmap | bytes = b""
     job_uuid = None
     try:
         job_uuid = uuid.UUID(job_id)
@@ -29,71 +596,128 @@ def process_job_pipeline(job_id: str, temp_path: str, content_type: str | None =
         logger.error("job_pipeline.invalid_job_id job_id=%s", job_id)
         return
     try:
-        job = db.query(Job).filter(Job.id == job_uuid).first()
-        if not job:
-            logger.warning("job_pipeline.job_missing job_id=%s", job_id)
+        # атомарный захват: дубль из очереди (sweeper, повторный enqueue) или
+        # запоздавший запуск уже выполненной задачи сюда не проходит
+        claimed = db.execute(
+            update(Job)
+            .where(Job.id == job_uuid, Job.status == "queued")
+            .values(status="processing", error_message=None)
+            .returning(Job.id)
+        ).first()
+        db.commit()
+        if claimed is None:
+            status = db.query(Job.status).filter(Job.id == job_uuid).scalar()
+            logger.warning("job_pipeline.not_claimed job_id=%s status=%s", job_id, status)
             return
+        job = db.query(Job).filter(Job.id == job_uuid).one()
         logger.info("job_pipeline.start job_id=%s", job_id)
-        job.status = "processing"
-        db.commit()
+        publish_job_event(job_id, "processing")
 
-        content = _load_file(temp_path)
-
-        # OCR step
-        ocr_service = get_ocr_service()
-        detected_text, ocr_meta = ocr_service.recognize(content, mime_type=content_type)
-        job.detected_text = detected_text
-        job.ocr_operation_id = ocr_meta.get("operationId")
-        job.ocr_status = "done"
-        meta = dict(job.pipeline_meta or {})
-        meta["ocr"] = ocr_meta
-        job.pipeline_meta = meta
-        db.commit()
-        logger.info(
-            "job_pipeline.ocr_result job_id=%s detected_text_len=%s meta=%s",
-            job_id,
-            len(detected_text or ""),
-            json.dumps(ocr_meta, ensure_ascii=False),
-        )
+        resumed = False
+        if not _stage_done(job, "ocr") and job.ocr_status == "pending" and job.ocr_operation_id:
+            with _stage(db, job, "ocr"):
+                resumed = _resume_ocr(db, job)
+
+        if resumed or (_stage_done(job, "ocr") and (job.detected_text or "").strip()):
+            detected_text = job.detected_text
+            if not resumed:
+                logger.info("job_pipeline.stage_skipped job_id=%s stage=ocr", job_id)
+        elif (job.pipeline_meta or {}).get("pages"):
+            # у страниц свой кэш OCR по хэшу — повтор не распознаёт готовые страницы заново
+            with _stage(db, job, "ocr"):
+                detected_text, ocr_meta = _ocr_pages(db, job)
+                job.detected_text = detected_text
+                job.ocr_status = "done"
+                job.pipeline_meta = {**job.pipeline_meta, "ocr": store_meta(job, "ocr", ocr_meta)}
+        else:
+            with _stage(db, job, "preprocess"):
+                if not temp_path or not os.path.exists(temp_path):
+                    if not job.input_s3_url:
+                        raise RuntimeError("Job has no input_s3_url to load input from")
+                    temp_path = download_to_temp(job.input_s3_url)
+                content_type = content_type or job.input_mime_type
+                mapped = _map_file(temp_path)
+                content_hash = job.input_sha256 or hashlib.sha256(mapped).hexdigest()
+                job.input_sha256 = content_hash
+                cached = _lookup_cached(db, content_hash, job_id)
+                content: Any = mapped
+                if cached is None:
+                    content, content_type, preprocess_meta = _preprocess(mapped, content_type, job_id)
+                    if preprocess_meta is not None:
+                        job.pipeline_meta = {**(job.pipeline_meta or {}), "preprocess": preprocess_meta}
+            with _stage(db, job, "ocr"):
+                if cached is not None:
+                    detected_text, ocr_meta = cached
+                else:
+                    operations = dict((job.pipeline_meta or {}).get("ocrOperations") or {})
+                    detected_text, ocr_meta = _recognize_input(
+                        content, content_type, job_uuid, operations, on_submitted=_persist_operation(job_uuid)
+                    )
+                    _store_cached(content_hash, detected_text, ocr_meta, job_id)
+                job.detected_text = detected_text
+                job.ocr_operation_id = ocr_meta.get("operationId")
+                job.ocr_status = "done"
+                job.pipeline_meta = {**(job.pipeline_meta or {}), "ocr": store_meta(job, "ocr", ocr_meta)}
+            logger.info(
+                "job_pipeline.ocr_result job_id=%s detected_text_len=%s meta=%s",
+                job_id,
+                len(detected_text or ""),
+                json.dumps(ocr_meta, ensure_ascii=False),
+            )
+        publish_job_event(job_id, "ocr_done", {"detectedText": detected_text})
 
         if not (detected_text or "").strip():
             job.status = "failed"
             job.error_message = "OCR returned empty text"
             db.commit()
+            record_job_failure(job.error_message)
+            publish_job_event(job_id, "failed", {"errorMessage": job.error_message})
             logger.warning("job_pipeline.empty_ocr_result job_id=%s", job_id)
             return
 
-        # GPT step
-        gpt_service = get_gpt_service()
-        generated_text, gpt_meta = gpt_service.generate(detected_text)
-        job.generated_text = generated_text
-        job.gpt_response_id = gpt_meta.get("responseId")
-        meta = dict(job.pipeline_meta or {})
-        meta["ocr"] = ocr_meta
-        meta["gpt"] = gpt_meta
-        job.pipeline_meta = meta
-        job.status = "done"
-        job.tokens_consumed = job.tokens_reserved
-        job.is_ok = True
-        db.commit()
-        logger.info(
-            "job_pipeline.gpt_result job_id=%s generated_text_len=%s meta=%s",
-            job_id,
-            len(generated_text or ""),
-            json.dumps(gpt_meta, ensure_ascii=False),
-        )
+        if _stage_done(job, "gpt") and job.generated_text:
+            generated_text = job.generated_text
+            logger.info("job_pipeline.stage_skipped job_id=%s stage=gpt", job_id)
+        else:
+            with _stage(db, job, "gpt"):
+                generated_text, gpt_meta = _generate(db, job, detected_text)
+                job.generated_text = generated_text
+                job.gpt_response_id = gpt_meta.get("responseId")
+                job.pipeline_meta = {**(job.pipeline_meta or {}), "gpt": store_meta(job, "gpt", gpt_meta)}
+            logger.info(
+                "job_pipeline.gpt_result job_id=%s generated_text_len=%s meta=%s",
+                job_id,
+                len(generated_text or ""),
+                json.dumps(gpt_meta, ensure_ascii=False),
+            )
+
+        with _stage(db, job, "finalize"):
+            job.status = "done"
+            job.tokens_consumed = job.tokens_reserved
+            job.is_ok = True
+        JOB_OUTCOMES_TOTAL.labels(outcome="done").inc()
+        publish_job_event(job_id, "done", {"generatedText": generated_text})
         logger.info("job_pipeline.done job_id=%s", job_id)
+    except OCROperationPending as exc:
+        db.rollback()
+        _defer_ocr(db, job_uuid, exc)
+    except CircuitOpenError as exc:
+        db.rollback()
+        if settings.upstream_breaker_park_jobs:
+            _park(db, job_uuid, exc)
+        else:
+            logger.warning("job_pipeline.circuit_open job_id=%s upstream=%s", job_id, exc.upstream)
+            _mark_failed(db, job_uuid, str(exc))
     except Exception as exc:
         logger.exception("job_pipeline.failed job_id=%s", job_id)
-        failed_job = db.query(Job).filter(Job.id == job_uuid).first()
-        if failed_job:
-            failed_job.status = "failed"
-            failed_job.error_message = str(exc)
-            db.commit()
+        db.rollback()
+        _mark_failed(db, job_uuid, str(exc))
     finally:
         db.close()
+        if isinstance(mapped, mmap.mmap):
+            mapped.close()
         try:
-            if os.path.exists(temp_path):
+            if temp_path and os.path.exists(temp_path):
                 os.remove(temp_path)
         except Exception:
             logger.warning("job_pipeline.cleanup_failed temp_path=%s", temp_path)
@@ -0,0 +1,133 @@
+from __future__ import annotations
+
+import logging
+import os
+import threading
+from datetime import timedelta
+
+from fastapi import BackgroundTasks
+from rq import Queue
+from rq.exceptions import NoSuchJobError
+from rq.job import Job as RQJob
+from rq.job import JobStatus
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.timing import timed
+from app.db.models import Job
+from app.services.job_pipeline import process_job_pipeline
+from app.services.redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+# Функция воркера импортируется RQ по строковому пути
+RQ_PIPELINE_FUNC = "app.workers.worker.run_job_pipeline"
+RETRYABLE_STATUSES = ("failed",)
+# id последнего RQ-джоба задачи: sweeper не ставит повторно то, что ещё ждёт в очереди
+RQ_JOB_KEY = "job_queue:rq_job:"
+RQ_JOB_KEY_TTL_SECONDS = 86400
+RQ_PENDING_STATUSES = (JobStatus.QUEUED, JobStatus.SCHEDULED, JobStatus.DEFERRED, JobStatus.STARTED)
+
+
+def get_job_queue() -> Queue:
+    return Queue(settings.rq_queue_name, connection=get_redis())
+
+
+def _remember_rq_job(job_id: str, rq_job_id: str) -> None:
+    try:
+        get_redis().set(f"{RQ_JOB_KEY}{job_id}", rq_job_id, ex=RQ_JOB_KEY_TTL_SECONDS)
+    except Exception:
+        logger.warning("job_queue.remember_failed job_id=%s rq_job_id=%s", job_id, rq_job_id)
+
+
+def rq_job_pending(job_id: str) -> bool:
+    """Последний RQ-джоб задачи ещё в очереди, отложен или выполняется."""
+    rq_job_id = get_redis().get(f"{RQ_JOB_KEY}{job_id}")
+    if rq_job_id is None:
+        return False
+    try:
+        status = RQJob.fetch(rq_job_id.decode(), connection=get_redis()).get_status()
+    except NoSuchJobError:
+        return False
+    return status in RQ_PENDING_STATUSES
+
+
+def enqueue_job_pipeline(
+    job_id: str,
+    background_tasks: BackgroundTasks | None = None,
+    temp_path: str | None = None,
+    content_type: str | None = None,
+) -> None:
+    """Ставит пайплайн задачи на выполнение согласно JOB_EXECUTION_BACKEND.
+
+    В режиме rq воркер сам скачивает вход из input_s3_url, поэтому локальный
+    временный файл API-процесса больше не нужен и удаляется.
+    """
+    if settings.job_execution_backend == "rq":
+        queue = get_job_queue()
+        with timed("enqueue"):
+            rq_job = queue.enqueue(
+                RQ_PIPELINE_FUNC,
+                job_id,
+                job_timeout=settings.rq_job_timeout_seconds,
+                description=f"job_pipeline:{job_id}",
+            )
+            _remember_rq_job(job_id, rq_job.id)
+        logger.info("job_queue.enqueued job_id=%s rq_job_id=%s queue=%s", job_id, rq_job.id, queue.name)
+        if temp_path and os.path.exists(temp_path):
+            try:
+                os.remove(temp_path)
+            except Exception:
+                logger.warning("job_queue.cleanup_failed temp_path=%s", temp_path)
+        return
+
+    if background_tasks is None:
+        raise RuntimeError("BackgroundTasks are required for the background execution backend")
+    background_tasks.add_task(process_job_pipeline, job_id, temp_path, content_type)
+
+
+def schedule_job_pipeline(job_id: str, delay_seconds: float) -> None:
+    """Отложенный перезапуск пайплайна (например, дождаться долгой операции OCR).
+
+    В режиме rq — enqueue_in (воркер должен быть запущен с --with-scheduler),
+    в режиме background — таймер в этом процессе; если процесс умрёт раньше,
+    задачу подберёт job_sweeper.
+    """
+    if settings.job_execution_backend == "rq":
+        rq_job = get_job_queue().enqueue_in(
+            timedelta(seconds=delay_seconds),
+            RQ_PIPELINE_FUNC,
+            job_id,
+            job_timeout=settings.rq_job_timeout_seconds,
+            description=f"job_pipeline:{job_id}",
+        )
+        _remember_rq_job(job_id, rq_job.id)
+        logger.info("job_queue.scheduled job_id=%s rq_job_id=%s delay=%s", job_id, rq_job.id, delay_seconds)
+        return
+    timer = threading.Timer(delay_seconds, process_job_pipeline, args=(job_id,))
+    timer.daemon = True
+    timer.start()
+    logger.info("job_queue.scheduled job_id=%s delay=%s", job_id, delay_seconds)
+
+
+def retry_job_pipeline(db: Session, job_id: str, background_tasks: BackgroundTasks | None = None) -> Job:
+    """Повторно ставит упавшую задачу в очередь.
+
+    Пайплайн продолжит с первой незавершённой стадии (см. pipeline_meta["stages"]):
+    уже распознанный текст повторно в OCR не отправляется.
+    LookupError — задачи нет, ValueError — задача не в состоянии для повтора.
+    """
+    job = db.query(Job).filter(Job.id == job_id).with_for_update().first()
+    if job is None:
+        raise LookupError("Job not found")
+    if job.status not in RETRYABLE_STATUSES:
+        raise ValueError(f"Job in status {job.status} cannot be retried")
+    meta = dict(job.pipeline_meta or {})
+    meta["retries"] = int(meta.get("retries") or 0) + 1
+    job.pipeline_meta = meta
+    job.status = "queued"
+    job.error_message = None
+    db.commit()
+    enqueue_job_pipeline(str(job.id), background_tasks)
+    logger.info("job_queue.retried job_id=%s retries=%s", job_id, meta["retries"])
+    return job
@@ -0,0 +1,206 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import and_, or_
+
+from app.core.blocking import run_blocking
+from app.core.config import settings
+from app.core.metrics import record_job_failure
+from app.database import SessionLocal
+from app.db.models import Job
+from app.services import ocr_cache
+from app.services.job_events import publish_job_event
+from app.services.job_pipeline import process_job_pipeline
+from app.services.job_queue import enqueue_job_pipeline, rq_job_pending
+from app.services.redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+SWEEPER_LOCK_KEY = "job_sweeper:lock"
+# загрузка, начатая перед самым истечением presigned URL, успевает подтвердиться
+UPLOAD_CONFIRM_GRACE_SECONDS = 300
+UPLOAD_EXPIRED_MESSAGE = "Upload was not confirmed in time"
+
+
+def _stale_thresholds() -> dict[str, int]:
+    return {
+        "queued": settings.job_stale_queued_seconds,
+        "processing": settings.job_stale_processing_seconds,
+    }
+
+
+def sweep_stale_jobs() -> list[str]:
+    """Находит задачи, застрявшие в queued/processing дольше порога, и перезапускает их.
+
+    Вход пайплайн возьмёт из input_s3_url, завершённые стадии пропустит.
+    После JOB_MAX_RESURRECTIONS перезапусков задача помечается failed.
+    Задачи waiting_upload, не подтверждённые за время жизни presigned URL, — тоже failed
+    (токен за них ещё не списан).
+    Возвращает id задач, которые нужно выполнить (для режима background).
+    """
+    now = datetime.now(timezone.utc)
+    conditions = [
+        and_(Job.status == status, Job.updated_at < now - timedelta(seconds=seconds))
+        for status, seconds in _stale_thresholds().items()
+    ]
+    # отложенные при открытом circuit breaker — перезапускаются раньше
+    conditions.append(
+        and_(
+            Job.status == "queued",
+            Job.pipeline_meta.has_key("parked"),
+            Job.updated_at < now - timedelta(seconds=settings.job_parked_retry_seconds),
+        )
+    )
+    db = SessionLocal()
+    resurrected: list[str] = []
+    expired: list[str] = []
+    try:
+        # частичный индекс ix_jobs_active_status_updated держит этот запрос дешёвым
+        jobs = (
+            db.query(Job)
+            .filter(or_(*conditions))
+            .order_by(Job.updated_at)
+            .limit(settings.job_sweeper_batch_size)
+            .with_for_update(skip_locked=True)
+            .all()
+        )
+        abandoned: list[tuple[str, str]] = []
+        # частичный индекс ix_jobs_waiting_upload_updated
+        upload_cutoff = settings.job_upload_presign_ttl_seconds + UPLOAD_CONFIRM_GRACE_SECONDS
+        expired_uploads = (
+            db.query(Job)
+            .filter(Job.status == "waiting_upload", Job.updated_at < now - timedelta(seconds=upload_cutoff))
+            .order_by(Job.updated_at)
+            .limit(settings.job_sweeper_batch_size)
+            .with_for_update(skip_locked=True)
+            .all()
+        )
+        for job in expired_uploads:
+            job.status = "failed"
+            job.error_message = UPLOAD_EXPIRED_MESSAGE
+            expired.append(str(job.id))
+        for job in jobs:
+            if settings.job_execution_backend == "rq" and rq_job_pending(str(job.id)):
+                # ждёт в длинной очереди RQ или выполняется — второй раз не ставим;
+                # updated_at сдвигается, чтобы не занимать batch следующих проходов
+                logger.info("job_sweeper.rq_pending job_id=%s status=%s", job.id, job.status)
+                job.updated_at = now
+                continue
+            meta = dict(job.pipeline_meta or {})
+            if meta.pop("parked", None) is not None:
+                job.pipeline_meta = meta
+                job.status = "queued"
+                logger.info("job_sweeper.unpark job_id=%s", job.id)
+                resurrected.append(str(job.id))
+                continue
+            attempts = int(meta.get("resurrections") or 0)
+            if attempts >= settings.job_max_resurrections:
+                job.status = "failed"
+                job.error_message = f"Job abandoned after {attempts} restarts"
+                abandoned.append((str(job.id), job.error_message))
+                continue
+            meta["resurrections"] = attempts + 1
+            job.pipeline_meta = meta
+            logger.warning(
+                "job_sweeper.resurrect job_id=%s status=%s updated_at=%s attempt=%s",
+                job.id,
+                job.status,
+                job.updated_at,
+                attempts + 1,
+            )
+            job.status = "queued"
+            resurrected.append(str(job.id))
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+    for job_id in expired:
+        logger.info("job_sweeper.upload_expired job_id=%s", job_id)
+        publish_job_event(job_id, "failed", {"errorMessage": UPLOAD_EXPIRED_MESSAGE})
+    for job_id, error_message in abandoned:
+        logger.warning("job_sweeper.abandoned job_id=%s", job_id)
+        record_job_failure(error_message)
+        publish_job_event(job_id, "failed", {"errorMessage": error_message})
+    for job_id in resurrected:
+        publish_job_event(job_id, "queued")
+    if settings.job_execution_backend == "rq":
+        for job_id in resurrected:
+            enqueue_job_pipeline(job_id)
+        return []
+    return resurrected
+
+
+class JobSweeper:
+    """Периодический перезапуск задач, осиротевших после деплоя или OOM,
+    и обслуживание OCR-кэша (ocr_cache.maintain).
+
+    Запускается в каждом API-процессе, но за один интервал работает только один:
+    Redis-лок берётся без ожидания и не отпускается до истечения TTL.
+    """
+
+    def __init__(self, interval: float) -> None:
+        self.interval = interval
+        self._task: asyncio.Task | None = None
+        self._executor: ThreadPoolExecutor | None = None
+
+    def start(self) -> None:
+        if not settings.job_sweeper_enabled:
+            return
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._executor is not None:
+            # ещё не начатые пайплайны остаются в queued — их подберёт следующий sweep
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def _pipeline_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=settings.job_sweeper_max_threads, thread_name_prefix="job-sweeper"
+            )
+        return self._executor
+
+    def _acquire(self) -> bool:
+        lock = get_redis().lock(SWEEPER_LOCK_KEY, timeout=max(1, int(self.interval)))
+        return bool(lock.acquire(blocking=False))
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                if not await run_blocking(self._acquire):
+                    continue
+                job_ids = await run_blocking(sweep_stale_jobs)
+            except Exception:
+                logger.exception("job_sweeper.failed")
+                continue
+            if settings.ocr_cache_enabled:
+                # обслуживание OCR-кэша здесь, а не на пути пайплайна: ни одна задача
+                # не платит за перенос попаданий и DELETE по всей таблице
+                try:
+                    await run_blocking(ocr_cache.maintain)
+                except Exception:
+                    logger.exception("job_sweeper.ocr_cache_maintenance_failed")
+            # режим background: пайплайны идут минутами — в своём пуле, а не в лимите
+            # run_blocking, иначе один sweep займёт потоки запросов
+            for job_id in job_ids:
+                self._pipeline_executor().submit(process_job_pipeline, job_id)
+
+
+job_sweeper = JobSweeper(interval=settings.job_sweeper_interval_seconds)
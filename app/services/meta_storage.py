@@ -0,0 +1,73 @@
+from __future__ import annotations
+
+import json
+import logging
+from typing import Any
+
+import zstandard
+
+from app.core.config import settings
+from app.core.metrics import S3_UPLOAD_SECONDS
+from app.db.models import Job
+from app.services.s3 import get_s3_client, upload_bytes
+from app.services.s3_utils import parse_s3_url
+
+logger = logging.getLogger(__name__)
+
+# Крупные поля метаданных OCR/GPT: в режиме s3 в строке jobs остаётся только сводка
+BULKY_KEYS = {"raw", "textAnnotation", "pages", "chunks"}
+ZSTD_LEVEL = 3
+
+
+def _summary(payload: dict[str, Any]) -> dict[str, Any]:
+    summary = {k: v for k, v in payload.items() if k not in BULKY_KEYS}
+    if isinstance(payload.get("pages"), list):
+        summary["pageCount"] = len(payload["pages"])
+    if isinstance(payload.get("chunks"), list):
+        summary["chunkCount"] = len(payload["chunks"])
+    return summary
+
+
+def _meta_key(job: Job, kind: str) -> str:
+    return f"jobs/{job.user_id or 'anon'}/{job.id}/meta/{kind}.json.zst"
+
+
+def store_meta(job: Job, kind: str, payload: dict[str, Any]) -> dict[str, Any]:
+    """Возвращает то, что кладётся в pipeline_meta[kind].
+
+    PIPELINE_META_STORAGE=inline — сами метаданные (как раньше).
+    PIPELINE_META_STORAGE=s3 — полный JSON сжимается zstd и уходит в S3, в БД
+    остаются указатель и сводка. При ошибке S3 метаданные остаются inline.
+    """
+    if settings.pipeline_meta_storage != "s3" or not settings.s3_bucket_name:
+        return payload
+    raw = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+    compressed = zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(raw)
+    try:
+        with S3_UPLOAD_SECONDS.labels(source="pipeline").time():
+            s3_url = upload_bytes(_meta_key(job, kind), compressed, "application/zstd")
+    except Exception:
+        logger.warning("meta_storage.offload_failed job_id=%s kind=%s", job.id, kind, exc_info=True)
+        return payload
+    logger.info(
+        "meta_storage.offloaded job_id=%s kind=%s bytes=%s compressed=%s", job.id, kind, len(raw), len(compressed)
+    )
+    return {
+        "storage": "s3",
+        "s3Url": s3_url,
+        "bytes": len(raw),
+        "compressedBytes": len(compressed),
+        "summary": _summary(payload),
+    }
+
+
+def load_meta(job: Job, kind: str) -> dict[str, Any] | None:
+    """Полные метаданные стадии: из pipeline_meta или, если вынесены, из S3 (загрузка по запросу)."""
+    entry = (job.pipeline_meta or {}).get(kind)
+    if not isinstance(entry, dict) or entry.get("storage") != "s3":
+        return entry
+    bucket, key = parse_s3_url(entry["s3Url"])
+    body = get_s3_client().get_object(Bucket=bucket, Key=key)["Body"].read()
+    # размер кадра известен не всегда — распаковываем потоково
+    raw = zstandard.ZstdDecompressor().decompressobj().decompress(body)
+    return json.loads(raw)
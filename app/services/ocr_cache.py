@@ -0,0 +1,207 @@
+from __future__ import annotations
+
+import json
+import logging
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Any, Tuple
+
+from redis.exceptions import ResponseError
+from sqlalchemy import bindparam, text, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.database import SessionLocal
+from app.db.models import OcrCacheEntry
+from app.services.redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+REDIS_KEY_PREFIX = "ocr_cache:entry:"
+REDIS_STATS_KEY = "ocr_cache:stats"
+# sha256 → число попаданий, ещё не перенесённых в ocr_cache.hits/last_hit_at
+REDIS_PENDING_HITS_KEY = "ocr_cache:pending_hits"
+# не чаще одного вытеснения за OCR_CACHE_EVICT_INTERVAL_SECONDS на все процессы
+REDIS_EVICT_LOCK_KEY = "ocr_cache:evict_lock"
+
+
+def _redis_key(content_sha256: str) -> str:
+    return f"{REDIS_KEY_PREFIX}{content_sha256}"
+
+
+def _count(field: str) -> None:
+    try:
+        get_redis().hincrby(REDIS_STATS_KEY, field, 1)
+    except Exception:
+        logger.warning("ocr_cache.stats_failed field=%s", field)
+
+
+def _cacheable_meta(ocr_meta: dict[str, Any]) -> dict[str, Any]:
+    # raw дублирует textAnnotation — в кэш его не кладём
+    return {k: v for k, v in (ocr_meta or {}).items() if k != "raw"}
+
+
+def _redis_set(content_sha256: str, detected_text: str, ocr_meta: dict[str, Any], ttl: int | None = None) -> None:
+    try:
+        get_redis().set(
+            _redis_key(content_sha256),
+            json.dumps({"detectedText": detected_text, "ocrMeta": ocr_meta}, ensure_ascii=False),
+            ex=ttl or settings.ocr_cache_ttl_seconds,
+        )
+    except Exception:
+        logger.warning("ocr_cache.redis_set_failed sha256=%s", content_sha256)
+
+
+def _record_hit(content_sha256: str, source: str) -> None:
+    # попадание копится в Redis; в Postgres его переносит flush_hits батчем (см. maintain)
+    try:
+        pipe = get_redis().pipeline(transaction=False)
+        pipe.hincrby(REDIS_PENDING_HITS_KEY, content_sha256, 1)
+        pipe.hincrby(REDIS_STATS_KEY, f"hits_{source}", 1)
+        pipe.execute()
+    except Exception:
+        logger.warning("ocr_cache.record_hit_failed sha256=%s", content_sha256)
+
+
+def lookup(db: Session, content_sha256: str) -> Tuple[str, dict[str, Any]] | None:
+    """Ищет результат OCR по хэшу файла: сначала Redis, затем таблица ocr_cache.
+
+    Только чтение: сессию вызывающего не коммитит, hits/last_hit_at обновляются
+    батчем в flush_hits."""
+    try:
+        raw = get_redis().get(_redis_key(content_sha256))
+    except Exception:
+        logger.warning("ocr_cache.redis_get_failed sha256=%s", content_sha256)
+        raw = None
+    if raw:
+        payload = json.loads(raw)
+        _record_hit(content_sha256, "redis")
+        return payload["detectedText"], payload.get("ocrMeta") or {}
+
+    entry = db.get(OcrCacheEntry, content_sha256)
+    ttl = settings.ocr_cache_ttl_seconds
+    if entry and entry.created_at:
+        # запись в Redis не должна пережить запись в Postgres
+        ttl = int(ttl - (datetime.now(timezone.utc) - entry.created_at).total_seconds())
+        if ttl <= 0:
+            entry = None
+    if entry is None:
+        _count("misses")
+        return None
+
+    _redis_set(content_sha256, entry.detected_text, entry.ocr_meta or {}, ttl=ttl)
+    _record_hit(content_sha256, "db")
+    return entry.detected_text, entry.ocr_meta or {}
+
+
+def flush_hits() -> int:
+    """Переносит накопленные в Redis попадания в ocr_cache (hits, last_hit_at)
+    одним UPDATE в отдельной сессии. Возвращает число обновлённых записей."""
+    redis = get_redis()
+    batch_key = f"{REDIS_PENDING_HITS_KEY}:{uuid.uuid4().hex}"
+    try:
+        # RENAME атомарен: попадания, пришедшие во время переноса, копятся в новом хэше
+        redis.rename(REDIS_PENDING_HITS_KEY, batch_key)
+    except ResponseError:
+        return 0
+    db = SessionLocal()
+    try:
+        rows = [{"sha": k.decode(), "hit_count": int(v)} for k, v in redis.hgetall(batch_key).items()]
+        table = OcrCacheEntry.__table__
+        db.execute(
+            update(table)
+            .where(table.c.content_sha256 == bindparam("sha"))
+            .values(hits=table.c.hits + bindparam("hit_count"), last_hit_at=datetime.now(timezone.utc)),
+            rows,
+        )
+        db.commit()
+    except Exception:
+        db.rollback()
+        logger.warning("ocr_cache.flush_hits_failed", exc_info=True)
+        return 0
+    finally:
+        db.close()
+        redis.delete(batch_key)
+    logger.info("ocr_cache.hits_flushed entries=%s", len(rows))
+    return len(rows)
+
+
+def store(content_sha256: str, detected_text: str, ocr_meta: dict[str, Any]) -> None:
+    """Записывает результат OCR в ocr_cache и Redis.
+
+    Upsert — в отдельной сессии: сессию пайплайна не коммитит, и выход стадии
+    по-прежнему коммитится вместе с отметкой done."""
+    if not (detected_text or "").strip():
+        return
+    meta = _cacheable_meta(ocr_meta)
+    now = datetime.now(timezone.utc)
+    stmt = insert(OcrCacheEntry).values(
+        content_sha256=content_sha256,
+        detected_text=detected_text,
+        ocr_meta=meta,
+        hits=0,
+        created_at=now,
+        last_hit_at=now,
+    )
+    db = SessionLocal()
+    try:
+        db.execute(
+            stmt.on_conflict_do_update(
+                index_elements=[OcrCacheEntry.content_sha256],
+                set_={"detected_text": detected_text, "ocr_meta": meta, "created_at": now, "last_hit_at": now},
+            )
+        )
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+    _redis_set(content_sha256, detected_text, meta)
+
+
+def evict() -> int:
+    """Удаляет просроченные записи и всё сверх OCR_CACHE_MAX_ENTRIES по давности попадания."""
+    cutoff = datetime.now(timezone.utc) - timedelta(seconds=settings.ocr_cache_ttl_seconds)
+    db = SessionLocal()
+    try:
+        result = db.execute(
+            text(
+                "DELETE FROM ocr_cache WHERE created_at < :cutoff OR content_sha256 IN ("
+                " SELECT content_sha256 FROM ocr_cache ORDER BY last_hit_at DESC OFFSET :max_entries)"
+            ),
+            {"cutoff": cutoff, "max_entries": settings.ocr_cache_max_entries},
+        )
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+    deleted = result.rowcount or 0
+    if deleted:
+        logger.info("ocr_cache.evicted count=%s", deleted)
+    return deleted
+
+
+def maintain() -> None:
+    """Периодическое обслуживание кэша, вне запросов и пайплайна (вызывает job_sweeper):
+    попадания переносятся в Postgres каждый проход, вытеснение — не чаще
+    OCR_CACHE_EVICT_INTERVAL_SECONDS на все процессы."""
+    flush_hits()
+    interval = max(1, int(settings.ocr_cache_evict_interval_seconds))
+    if get_redis().set(REDIS_EVICT_LOCK_KEY, "1", nx=True, ex=interval):
+        # попадания уже перенесены — LRU считается по свежему last_hit_at
+        evict()
+
+
+def stats() -> dict[str, int]:
+    try:
+        raw = get_redis().hgetall(REDIS_STATS_KEY)
+    except Exception:
+        logger.warning("ocr_cache.stats_read_failed")
+        return {}
+    counters = {k.decode(): int(v) for k, v in raw.items()}
+    hits = counters.get("hits_redis", 0) + counters.get("hits_db", 0)
+    return {**counters, "hits": hits, "misses": counters.get("misses", 0)}
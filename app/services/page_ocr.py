@@ -0,0 +1,68 @@
+from __future__ import annotations
+
+import logging
+import time
+from concurrent.futures import FIRST_EXCEPTION, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from typing import Any, Callable, Sequence
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Задача одной страницы: загрузить/подготовить вход и распознать, вернуть (text, meta)
+PageTask = Callable[[], "tuple[str, dict[str, Any]]"]
+
+
+@dataclass
+class PageResult:
+    index: int
+    text: str
+    meta: dict[str, Any] = field(default_factory=dict)
+    elapsed_ms: int = 0
+
+
+def recognize_pages(
+    tasks: Sequence[PageTask],
+    on_page_done: Callable[[PageResult], None] | None = None,
+    max_concurrency: int | None = None,
+) -> list[PageResult]:
+    """Распознаёт страницы параллельно, не больше OCR_PAGE_CONCURRENCY одновременно.
+
+    Результаты возвращаются в порядке страниц. on_page_done вызывается в
+    вызывающем потоке по мере готовности страниц (удобно для прогресса в БД).
+    Ошибка любой страницы отменяет ещё не начатые и пробрасывается дальше.
+    """
+    if not tasks:
+        return []
+    workers = max(1, min(len(tasks), max_concurrency or settings.ocr_page_concurrency))
+
+    def _run(index: int, task: PageTask) -> PageResult:
+        started = time.monotonic()
+        text, meta = task()
+        return PageResult(index=index, text=text, meta=meta, elapsed_ms=int((time.monotonic() - started) * 1000))
+
+    results: dict[int, PageResult] = {}
+    pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="page-ocr")
+    try:
+        pending = {pool.submit(_run, index, task): index for index, task in enumerate(tasks)}
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_EXCEPTION)
+            for future in done:
+                index = pending.pop(future)
+                exc = future.exception()
+                if exc is not None:
+                    logger.warning("page_ocr.page_failed page=%s error=%s", index, exc)
+                    raise exc
+                result = future.result()
+                results[index] = result
+                if on_page_done is not None:
+                    on_page_done(result)
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
+    return [results[index] for index in range(len(tasks))]
+
+
+def merge_page_texts(results: Sequence[PageResult]) -> str:
+    """Склеивает текст страниц в порядке страниц; пустые страницы пропускаются."""
+    return "\n\n".join(r.text.strip() for r in results if (r.text or "").strip())
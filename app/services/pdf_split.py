@@ -0,0 +1,49 @@
+from __future__ import annotations
+
+import io
+import logging
+from typing import Any
+
+from pypdf import PdfReader, PdfWriter
+
+logger = logging.getLogger(__name__)
+
+PDF_MIME_TYPE = "application/pdf"
+
+
+def is_pdf(mime_type: str | None) -> bool:
+    return (mime_type or "").lower() == PDF_MIME_TYPE
+
+
+def _reader(content: Any) -> PdfReader:
+    if hasattr(content, "read") and hasattr(content, "seek"):
+        # mmap читается напрямую, без копии в BytesIO
+        content.seek(0)
+        return PdfReader(content)
+    return PdfReader(io.BytesIO(content))
+
+
+def split_pdf(content: Any, pages_per_chunk: int = 1, max_pages: int | None = None) -> list[tuple[int, int, bytes]]:
+    """Режет PDF на куски по pages_per_chunk страниц для отдельных запросов OCR.
+
+    Возвращает [(первая страница, последняя страница, bytes)], страницы с нуля.
+    Если страниц больше max_pages — ValueError.
+    """
+    reader = _reader(content)
+    total = len(reader.pages)
+    if total == 0:
+        raise ValueError("PDF has no pages")
+    if max_pages is not None and total > max_pages:
+        raise ValueError(f"PDF has too many pages ({total}, limit {max_pages})")
+    step = max(1, pages_per_chunk)
+    chunks: list[tuple[int, int, bytes]] = []
+    for first in range(0, total, step):
+        last = min(first + step, total) - 1
+        writer = PdfWriter()
+        for index in range(first, last + 1):
+            writer.add_page(reader.pages[index])
+        out = io.BytesIO()
+        writer.write(out)
+        chunks.append((first, last, out.getvalue()))
+    logger.info("pdf_split.done pages=%s chunks=%s", total, len(chunks))
+    return chunks
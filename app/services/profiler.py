@@ -0,0 +1,263 @@
+from __future__ import annotations
+
+import asyncio
+import functools
+import hmac
+import logging
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from datetime import datetime, timezone
+from typing import Any, Callable, TypeVar
+
+from app.core.config import settings
+from app.services.redis_client import get_redis
+from app.services.s3 import upload_bytes
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+PROFILE_HEADER = b"x-profile"
+PIPELINE_RUNS_KEY = "profiler:pipeline_runs"
+RECENT_PROFILES_KEY = "profiler:recent"
+RECENT_PROFILES_LIMIT = 50
+# Потоки, в которых выполняется работа пайплайна: app.services.aio_loop,
+# app.services.page_ocr, app.services.resilience (hedging)
+PIPELINE_HELPER_THREADS = ("aio-loop", "page-ocr", "hedge")
+
+# Забрать один из N запрошенных прогонов пайплайна (атомарно для всех процессов)
+CLAIM_RUN_LUA = """
+local left = tonumber(redis.call('GET', KEYS[1]) or '0')
+if left <= 0 then
+    return 0
+end
+redis.call('DECR', KEYS[1])
+return 1
+"""
+
+
+class SamplingProfiler:
+    """Сэмплирующий профилировщик на sys._current_frames(): отдельный поток раз в
+    interval снимает стеки нужных потоков. Код приложения не инструментируется,
+    цена — один обход стеков за сэмпл. Результат — collapsed stacks
+    (flamegraph.pl, speedscope, inferno)."""
+
+    def __init__(
+        self,
+        interval: float,
+        max_seconds: float,
+        thread_ids: set[int] | None = None,
+        thread_prefixes: tuple[str, ...] = (),
+        thread_labels: dict[int, str] | None = None,
+    ) -> None:
+        self.interval = interval
+        self.max_seconds = max_seconds
+        # None — все потоки процесса; иначе эти id и потоки с именами на thread_prefixes
+        # (в том числе созданные уже во время профилирования)
+        self.thread_ids = thread_ids
+        self.thread_prefixes = thread_prefixes
+        # корень стека вместо имени потока
+        self.thread_labels = thread_labels or {}
+        self.samples = 0
+        self._stacks: Counter[str] = Counter()
+        self._labels: dict[Any, str] = {}
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+        self._started = 0.0
+
+    def start(self) -> None:
+        self._started = time.monotonic()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> str:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        return "".join(f"{stack} {count}\n" for stack, count in sorted(self._stacks.items()))
+
+    def _label(self, code: Any) -> str:
+        label = self._labels.get(code)
+        if label is None:
+            # «;» и пробел — разделители формата collapsed
+            filename = code.co_filename.rsplit("site-packages/", 1)[-1].replace(" ", "_")
+            label = self._labels[code] = f"{code.co_name} ({filename}:{code.co_firstlineno})".replace(";", ":")
+        return label
+
+    def _wanted(self, thread_id: int, name: str) -> bool:
+        if self.thread_ids is None or thread_id in self.thread_ids:
+            return True
+        return bool(self.thread_prefixes) and name.startswith(self.thread_prefixes)
+
+    def _run(self) -> None:
+        own = threading.get_ident()
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        while not self._stop.wait(self.interval):
+            if time.monotonic() - self._started > self.max_seconds:
+                logger.warning("profiler.max_duration_reached samples=%s", self.samples)
+                return
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own:
+                    continue
+                if thread_id not in names:
+                    names = {thread.ident: thread.name for thread in threading.enumerate()}
+                name = names.get(thread_id, str(thread_id))
+                if not self._wanted(thread_id, name):
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(self._label(frame.f_code))
+                    frame = frame.f_back
+                stack.append(self.thread_labels.get(thread_id, name).replace(" ", "_").replace(";", ":"))
+                self._stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+
+def _new_profiler(thread_ids: set[int] | None = None, **kwargs: Any) -> SamplingProfiler:
+    return SamplingProfiler(
+        interval=settings.profiler_interval_ms / 1000,
+        max_seconds=settings.profiler_max_seconds,
+        thread_ids=thread_ids,
+        **kwargs,
+    )
+
+
+def save_profile(name: str, collapsed: str) -> str:
+    """Сохраняет профиль в PROFILER_OUTPUT (local | s3); возвращает путь или s3-ссылку."""
+    filename = f"{name}.collapsed"
+    if settings.profiler_output == "s3" and settings.s3_bucket_name:
+        location = upload_bytes(f"profiles/{filename}", collapsed.encode("utf-8"), "text/plain")
+    else:
+        os.makedirs(settings.profiler_local_dir, exist_ok=True)
+        location = os.path.join(settings.profiler_local_dir, filename)
+        with open(location, "w", encoding="utf-8") as f:
+            f.write(collapsed)
+    try:
+        redis = get_redis()
+        redis.lpush(RECENT_PROFILES_KEY, f"{datetime.now(timezone.utc).isoformat()} {location}")
+        redis.ltrim(RECENT_PROFILES_KEY, 0, RECENT_PROFILES_LIMIT - 1)
+    except Exception:
+        logger.warning("profiler.recent_failed location=%s", location)
+    logger.info("profiler.saved location=%s", location)
+    return location
+
+
+def _profile_name(kind: str, ident: str) -> str:
+    return f"{kind}-{datetime.now(timezone.utc):%Y%m%dT%H%M%S}-{ident}"
+
+
+def request_pipeline_profiles(runs: int) -> int:
+    """Профилировать следующие runs прогонов process_job_pipeline в любом процессе."""
+    if runs > 0:
+        get_redis().set(PIPELINE_RUNS_KEY, runs)
+    else:
+        get_redis().delete(PIPELINE_RUNS_KEY)
+    return max(0, runs)
+
+
+def profiler_status() -> dict[str, Any]:
+    redis = get_redis()
+    return {
+        "enabled": settings.profiler_enabled,
+        "output": settings.profiler_output,
+        "pipelineRunsLeft": int(redis.get(PIPELINE_RUNS_KEY) or 0),
+        "recent": [item.decode() for item in redis.lrange(RECENT_PROFILES_KEY, 0, -1)],
+    }
+
+
+_claim_script = None
+
+
+def _claim_pipeline_run() -> bool:
+    global _claim_script
+    try:
+        if _claim_script is None:
+            _claim_script = get_redis().register_script(CLAIM_RUN_LUA)
+        return bool(_claim_script(keys=[PIPELINE_RUNS_KEY]))
+    except Exception:
+        logger.warning("profiler.claim_failed", exc_info=True)
+        return False
+
+
+def profile_pipeline_runs(func: Callable[..., T]) -> Callable[..., T]:
+    """Декоратор пайплайна: если запрошено профилирование следующих N прогонов,
+    прогон выполняется под сэмплером.
+
+    Сэмплируются поток пайплайна (корень стека — pipeline) и потоки, куда он
+    отдаёт работу: фоновый loop клиентов OCR, пул постраничного OCR и hedging.
+    Эти потоки общие для процесса — при параллельных пайплайнах в профиль
+    попадает и их работа."""
+
+    @functools.wraps(func)
+    def wrapper(job_id: str, *args: Any, **kwargs: Any) -> T:
+        if not settings.profiler_enabled or not _claim_pipeline_run():
+            return func(job_id, *args, **kwargs)
+        pipeline_thread = threading.get_ident()
+        profiler = _new_profiler(
+            {pipeline_thread},
+            thread_prefixes=PIPELINE_HELPER_THREADS,
+            thread_labels={pipeline_thread: "pipeline"},
+        )
+        profiler.start()
+        try:
+            return func(job_id, *args, **kwargs)
+        finally:
+            collapsed = profiler.stop()
+            try:
+                save_profile(_profile_name("pipeline", job_id), collapsed)
+            except Exception:
+                logger.exception("profiler.save_failed job_id=%s", job_id)
+
+    return wrapper
+
+
+class ProfilingMiddleware:
+    """Профиль одного запроса по заголовку X-Profile: 1 вместе с X-API-Key.
+
+    Работа запроса переходит между потоком event loop и пулом run_blocking,
+    поэтому сэмплируются все потоки процесса: в профиль попадают и параллельные
+    запросы (корень стека — имя потока). Id профиля — в заголовке ответа X-Profile-Id.
+    """
+
+    def __init__(self, app: Any) -> None:
+        self.app = app
+
+    def _authorized(self, headers: list[tuple[bytes, bytes]]) -> bool:
+        values = dict(headers)
+        if values.get(PROFILE_HEADER) not in (b"1", b"true"):
+            return False
+        if not settings.server_api_key:
+            # как require_api_key: без ключа — dev-режим
+            return True
+        return hmac.compare_digest(values.get(b"x-api-key", b""), settings.server_api_key.encode())
+
+    async def __call__(self, scope: dict, receive: Any, send: Any) -> None:
+        if scope["type"] != "http" or not self._authorized(scope.get("headers") or []):
+            await self.app(scope, receive, send)
+            return
+        profile_id = uuid.uuid4().hex[:12]
+        profiler = _new_profiler()
+        profiler.start()
+
+        async def send_wrapper(message: dict) -> None:
+            if message["type"] == "http.response.start":
+                headers = [*(message.get("headers") or []), (b"x-profile-id", profile_id.encode())]
+                message = {**message, "headers": headers}
+            await send(message)
+            if message["type"] == "http.response.body" and not message.get("more_body", False):
+                # BackgroundTasks запроса выполняются после ответа — в профиль не попадают
+                profiler.stop()
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            collapsed = profiler.stop()
+            name = _profile_name("request", profile_id)
+            try:
+                await asyncio.to_thread(save_profile, name, collapsed)
+            except Exception:
+                logger.exception("profiler.save_failed profile_id=%s", profile_id)
@@ -0,0 +1,280 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import random
+import time
+import uuid
+from contextlib import asynccontextmanager, contextmanager
+from typing import AsyncIterator, Callable, Iterator
+
+from app.core.config import settings
+from app.core.metrics import UPSTREAM_LIMITER_WAIT_SECONDS
+from app.services.redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = "upstream_limiter:"
+# держатель слота асинхронной операции апстрима (см. operation_slot)
+OPERATION_HOLDER_PREFIX = "op:"
+
+# Token bucket: возвращает 0, если токен взят, иначе сколько мс ждать следующего.
+# Время берётся из Redis (TIME), чтобы часы разных машин не влияли на лимит.
+TOKEN_BUCKET_LUA = """
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local t = redis.call('TIME')
+local now = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or burst
+local ts = tonumber(state[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - ts) * rate / 1000)
+local wait = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+else
+    wait = math.ceil((1 - tokens) * 1000 / rate)
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('PEXPIRE', KEYS[1], math.ceil(burst * 1000 / rate) + 1000)
+return wait
+"""
+
+# Семафор с арендой: держатели — ZSET с временем истечения аренды, чтобы
+# слоты упавших процессов освобождались сами.
+SEMAPHORE_ACQUIRE_LUA = """
+local limit = tonumber(ARGV[1])
+local lease_ms = tonumber(ARGV[3])
+local t = redis.call('TIME')
+local now = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', now)
+if redis.call('ZCARD', KEYS[1]) < limit then
+    redis.call('ZADD', KEYS[1], now + lease_ms, ARGV[2])
+    -- не укорачиваем TTL ключа: в нём могут быть долгие аренды операций
+    if redis.call('PTTL', KEYS[1]) < lease_ms then
+        redis.call('PEXPIRE', KEYS[1], lease_ms)
+    end
+    return 1
+end
+return 0
+"""
+
+# Передаёт слот от временного держателя операции (ARGV[2]) с новой арендой.
+# Временный держатель мог истечь — операция в апстриме всё равно идёт, слот ставим.
+SEMAPHORE_REBIND_LUA = """
+local lease_ms = tonumber(ARGV[3])
+local t = redis.call('TIME')
+local now = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+redis.call('ZREM', KEYS[1], ARGV[1])
+redis.call('ZADD', KEYS[1], now + lease_ms, ARGV[2])
+if redis.call('PTTL', KEYS[1]) < lease_ms then
+    redis.call('PEXPIRE', KEYS[1], lease_ms)
+end
+return 1
+"""
+
+
+class LimiterTimeout(RuntimeError):
+    pass
+
+
+class UpstreamLimiter:
+    """Общие для всех процессов лимиты апстрима: RPS (token bucket) и число
+    одновременных запросов/операций (семафор). Вызывающий ждёт свободной ёмкости,
+    а не падает с 429. Если Redis недоступен — пропускаем без лимита."""
+
+    def __init__(self, name: str, rps: float, burst: int, max_concurrency: int) -> None:
+        self.name = name
+        self.rps = rps
+        self.burst = max(1, burst)
+        self.max_concurrency = max_concurrency
+        self._bucket_key = f"{KEY_PREFIX}{name}:bucket"
+        self._semaphore_key = f"{KEY_PREFIX}{name}:semaphore"
+        self._bucket = None
+        self._acquire_slot = None
+        self._rebind_slot = None
+
+    def _scripts(self):
+        if self._bucket is None:
+            redis = get_redis()
+            self._bucket = redis.register_script(TOKEN_BUCKET_LUA)
+            self._acquire_slot = redis.register_script(SEMAPHORE_ACQUIRE_LUA)
+            self._rebind_slot = redis.register_script(SEMAPHORE_REBIND_LUA)
+        return self._bucket, self._acquire_slot
+
+    # Один шаг: сколько секунд ждать до следующей попытки (0 — получили)
+    def _try_rate(self) -> float:
+        if self.rps <= 0:
+            return 0.0
+        bucket, _ = self._scripts()
+        return int(bucket(keys=[self._bucket_key], args=[self.rps, self.burst])) / 1000
+
+    def _try_slot(self, holder: str) -> bool:
+        if self.max_concurrency <= 0:
+            return True
+        _, acquire = self._scripts()
+        lease_ms = int(settings.upstream_limiter_lease_seconds * 1000)
+        return bool(acquire(keys=[self._semaphore_key], args=[self.max_concurrency, holder, lease_ms]))
+
+    def _bind_operation(self, holder: str, operation_id: str, lease_seconds: float) -> None:
+        if self.max_concurrency <= 0:
+            return
+        try:
+            self._scripts()
+            self._rebind_slot(
+                keys=[self._semaphore_key],
+                args=[holder, f"{OPERATION_HOLDER_PREFIX}{operation_id}", int(lease_seconds * 1000)],
+            )
+        except Exception:
+            logger.warning("rate_limiter.bind_failed upstream=%s operation_id=%s", self.name, operation_id)
+
+    def release_operation(self, operation_id: str) -> None:
+        """Освобождает слот операции, взятый через operation_slot: операция
+        завершилась, упала или истекла в апстриме."""
+        self._release_slot(f"{OPERATION_HOLDER_PREFIX}{operation_id}")
+
+    def _release_slot(self, holder: str) -> None:
+        if self.max_concurrency <= 0:
+            return
+        try:
+            get_redis().zrem(self._semaphore_key, holder)
+        except Exception:
+            logger.warning("rate_limiter.release_failed upstream=%s", self.name)
+
+    def _deadline_passed(self, started: float) -> None:
+        if time.monotonic() - started > settings.upstream_limiter_max_wait_seconds:
+            raise LimiterTimeout(f"Timed out waiting for {self.name} capacity")
+
+    def _observe(self, started: float) -> None:
+        waited = time.monotonic() - started
+        UPSTREAM_LIMITER_WAIT_SECONDS.labels(upstream=self.name).observe(waited)
+        if waited > 1:
+            logger.info("rate_limiter.waited upstream=%s wait_ms=%.0f", self.name, waited * 1000)
+
+    def _acquire(self, holder: str) -> bool:
+        """Синхронно ждёт слот конкурентности и токен RPS. True — слот взят
+        (его нужно отпустить); False — Redis недоступен, идём без лимита."""
+        started = time.monotonic()
+        acquired = False
+        try:
+            backoff = 0.025
+            while not self._try_slot(holder):
+                self._deadline_passed(started)
+                time.sleep(backoff * random.uniform(0.5, 1.5))
+                backoff = min(backoff * 2, 0.5)
+            acquired = True
+            while (wait := self._try_rate()) > 0:
+                self._deadline_passed(started)
+                time.sleep(wait)
+        except LimiterTimeout:
+            if acquired:
+                self._release_slot(holder)
+            raise
+        except Exception:
+            logger.warning("rate_limiter.unavailable upstream=%s", self.name, exc_info=True)
+        self._observe(started)
+        return acquired
+
+    @contextmanager
+    def slot(self) -> Iterator[None]:
+        """Синхронно ждёт токен RPS и слот конкурентности на время блока."""
+        holder = uuid.uuid4().hex
+        acquired = self._acquire(holder)
+        try:
+            yield
+        finally:
+            if acquired:
+                self._release_slot(holder)
+
+    @contextmanager
+    def operation_slot(self, lease_seconds: float) -> Iterator[Callable[[str], None]]:
+        """Слот на асинхронную операцию апстрима, которая переживает блок.
+
+        Внутри блока операция отправляется, и её id передаётся в yield-нутый bind:
+        слот переходит к держателю op:<operation_id> с арендой lease_seconds и
+        после блока не отпускается — его освобождает release_operation.
+        Без bind (отправка упала) слот отпускается на выходе из блока.
+        """
+        holder = uuid.uuid4().hex
+        acquired = self._acquire(holder)
+        bound = False
+
+        def bind(operation_id: str) -> None:
+            nonlocal bound
+            if acquired:
+                self._bind_operation(holder, operation_id, lease_seconds)
+                bound = True
+
+        try:
+            yield bind
+        finally:
+            if acquired and not bound:
+                self._release_slot(holder)
+
+    async def _aacquire(self, holder: str) -> bool:
+        """То же, что _acquire, для корутин. Вызовы Redis — в пуле потоков: скрипты
+        короткие, а синхронный клиент не привязан к конкретному event loop."""
+        started = time.monotonic()
+        acquired = False
+        try:
+            backoff = 0.025
+            while not await asyncio.to_thread(self._try_slot, holder):
+                self._deadline_passed(started)
+                await asyncio.sleep(backoff * random.uniform(0.5, 1.5))
+                backoff = min(backoff * 2, 0.5)
+            acquired = True
+            while (wait := await asyncio.to_thread(self._try_rate)) > 0:
+                self._deadline_passed(started)
+                await asyncio.sleep(wait)
+        except LimiterTimeout:
+            if acquired:
+                await asyncio.to_thread(self._release_slot, holder)
+            raise
+        except Exception:
+            logger.warning("rate_limiter.unavailable upstream=%s", self.name, exc_info=True)
+        self._observe(started)
+        return acquired
+
+    @asynccontextmanager
+    async def aslot(self) -> AsyncIterator[None]:
+        """То же, что slot, для корутин."""
+        holder = uuid.uuid4().hex
+        acquired = await self._aacquire(holder)
+        try:
+            yield
+        finally:
+            if acquired:
+                await asyncio.to_thread(self._release_slot, holder)
+
+    @asynccontextmanager
+    async def aoperation_slot(self, lease_seconds: float) -> AsyncIterator[Callable[[str], None]]:
+        """То же, что operation_slot, для корутин (bind синхронный — вызывать через to_thread)."""
+        holder = uuid.uuid4().hex
+        acquired = await self._aacquire(holder)
+        bound = False
+
+        def bind(operation_id: str) -> None:
+            nonlocal bound
+            if acquired:
+                self._bind_operation(holder, operation_id, lease_seconds)
+                bound = True
+
+        try:
+            yield bind
+        finally:
+            if acquired and not bound:
+                await asyncio.to_thread(self._release_slot, holder)
+
+_limiters: dict[str, UpstreamLimiter] = {}
+
+
+def get_limiter(upstream: str) -> UpstreamLimiter:
+    limiter = _limiters.get(upstream)
+    if limiter is None:
+        limits = {
+            "yandex_ocr": (settings.yandex_ocr_rps, settings.yandex_ocr_burst, settings.yandex_ocr_max_concurrency),
+            "yandex_gpt": (settings.yandex_gpt_rps, settings.yandex_gpt_burst, settings.yandex_gpt_max_concurrency),
+        }
+        rps, burst, max_concurrency = limits[upstream] if settings.upstream_limiter_enabled else (0, 1, 0)
+        limiter = _limiters.setdefault(upstream, UpstreamLimiter(upstream, rps, burst, max_concurrency))
+    return limiter
@@ -0,0 +1,25 @@
+from __future__ import annotations
+
+from redis import Redis
+from redis.asyncio import Redis as AsyncRedis
+
+from app.core.config import settings
+
+_redis: Redis | None = None
+_async_redis: AsyncRedis | None = None
+
+
+def get_redis() -> Redis:
+    """Общий синхронный клиент Redis (пул соединений внутри клиента)."""
+    global _redis
+    if _redis is None:
+        _redis = Redis.from_url(settings.redis_url)
+    return _redis
+
+
+def get_async_redis() -> AsyncRedis:
+    """Асинхронный клиент Redis для event loop API-процесса (pub/sub, стримы)."""
+    global _async_redis
+    if _async_redis is None:
+        _async_redis = AsyncRedis.from_url(settings.redis_url)
+    return _async_redis
@@ -0,0 +1,341 @@
+from __future__ import annotations
+
+import logging
+import random
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from typing import Any, Callable, TypeVar
+
+import httpx
+import openai
+
+from app.core.config import settings
+from app.services.redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+BREAKER_STATE_KEY = "resilience:breaker:"
+LATENCY_KEY = "resilience:latency:"
+STATS_KEY = "resilience:stats:"
+LATENCY_TTL_SECONDS = 3600
+LATENCY_CACHE_SECONDS = 5.0
+
+# Время — из Redis (TIME), как в rate_limiter: часы разных машин не влияют.
+# Возвращает 0, если вызов можно делать, иначе сколько мс до следующей попытки.
+# В half_open пропускается один пробный вызов на все процессы (аренда на reset_ms).
+BREAKER_BEFORE_CALL_LUA = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+local opened_until = tonumber(redis.call('HGET', KEYS[1], 'opened_until') or '0')
+if opened_until == 0 then
+    return 0
+end
+if now < opened_until then
+    return opened_until - now
+end
+local trial_until = tonumber(redis.call('HGET', KEYS[1], 'trial_until') or '0')
+if now < trial_until then
+    return trial_until - now
+end
+redis.call('HSET', KEYS[1], 'trial_until', now + tonumber(ARGV[1]))
+return 0
+"""
+
+# Ошибка: +1 к счётчику подряд; открыть при пороге или при ошибке пробного
+# вызова (half_open). Ключ живёт 2×reset: после тишины breaker закрыт.
+BREAKER_FAILURE_LUA = """
+local threshold = tonumber(ARGV[1])
+local reset_ms = tonumber(ARGV[2])
+local t = redis.call('TIME')
+local now = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+local failures = redis.call('HINCRBY', KEYS[1], 'failures', 1)
+redis.call('HSET', KEYS[1], 'last_error', ARGV[3])
+local opened_until = tonumber(redis.call('HGET', KEYS[1], 'opened_until') or '0')
+local opened = 0
+if (opened_until > 0 and now >= opened_until) or (opened_until == 0 and failures >= threshold) then
+    redis.call('HSET', KEYS[1], 'opened_until', now + reset_ms)
+    redis.call('HDEL', KEYS[1], 'trial_until')
+    opened = 1
+end
+redis.call('PEXPIRE', KEYS[1], reset_ms * 2)
+return {failures, opened}
+"""
+
+# Успех: сбросить состояние; 1 — breaker был открыт (для лога)
+BREAKER_SUCCESS_LUA = """
+local was_open = redis.call('HEXISTS', KEYS[1], 'opened_until')
+redis.call('DEL', KEYS[1])
+return was_open
+"""
+
+
+class CircuitOpenError(RuntimeError):
+    """Апстрим недоступен: запрос не отправлялся, breaker открыт."""
+
+    def __init__(self, upstream: str, retry_in: float) -> None:
+        super().__init__(f"{upstream} circuit is open, retry in {retry_in:.0f}s")
+        self.upstream = upstream
+        self.retry_in = retry_in
+
+
+def is_retryable(exc: BaseException) -> bool:
+    """Сетевые ошибки, 429 и 5xx — временные, их имеет смысл повторить."""
+    if isinstance(exc, httpx.HTTPStatusError):
+        return exc.response.status_code == 429 or exc.response.status_code >= 500
+    if isinstance(exc, httpx.TransportError):
+        return True
+    if isinstance(exc, (openai.APIConnectionError, openai.RateLimitError, openai.InternalServerError)):
+        return True
+    return False
+
+
+def _counts_as_outage(exc: BaseException) -> bool:
+    # 4xx и ошибки входных данных — не признак падения апстрима
+    return is_retryable(exc) or isinstance(exc, TimeoutError)
+
+
+class CircuitBreaker:
+    """closed → open после N ошибок подряд → half_open через reset_seconds
+    (пропускается один пробный запрос) → closed при успехе или снова open.
+
+    Состояние общее для всех процессов — хэш в Redis: воркер RQ форкает новый
+    процесс на каждую задачу, и счётчик в памяти никогда не дошёл бы до порога.
+    Если Redis недоступен — breaker считается закрытым."""
+
+    def __init__(self, name: str, failure_threshold: int, reset_seconds: float) -> None:
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self._key = f"{BREAKER_STATE_KEY}{name}"
+        self._before_call = None
+        self._on_failure = None
+        self._on_success = None
+
+    def _scripts(self):
+        if self._before_call is None:
+            redis = get_redis()
+            self._before_call = redis.register_script(BREAKER_BEFORE_CALL_LUA)
+            self._on_failure = redis.register_script(BREAKER_FAILURE_LUA)
+            self._on_success = redis.register_script(BREAKER_SUCCESS_LUA)
+        return self._before_call, self._on_failure, self._on_success
+
+    @property
+    def _reset_ms(self) -> int:
+        return int(self.reset_seconds * 1000)
+
+    def before_call(self) -> None:
+        try:
+            before_call, _, _ = self._scripts()
+            wait_ms = int(before_call(keys=[self._key], args=[self._reset_ms]))
+        except Exception:
+            logger.warning("resilience.breaker_unavailable upstream=%s", self.name)
+            return
+        if wait_ms > 0:
+            raise CircuitOpenError(self.name, wait_ms / 1000)
+
+    def record_success(self) -> None:
+        try:
+            _, _, on_success = self._scripts()
+            was_open = int(on_success(keys=[self._key]))
+        except Exception:
+            logger.warning("resilience.breaker_unavailable upstream=%s", self.name)
+            return
+        if was_open:
+            logger.info("resilience.breaker_closed upstream=%s", self.name)
+
+    def record_failure(self, exc: BaseException) -> None:
+        try:
+            _, on_failure, _ = self._scripts()
+            failures, opened = on_failure(
+                keys=[self._key],
+                args=[self.failure_threshold, self._reset_ms, f"{type(exc).__name__}: {exc}"[:300]],
+            )
+        except Exception:
+            logger.warning("resilience.breaker_unavailable upstream=%s", self.name)
+            return
+        if int(opened):
+            logger.warning("resilience.breaker_opened upstream=%s failures=%s", self.name, failures)
+
+    def snapshot(self) -> dict[str, Any]:
+        redis = get_redis()
+        raw = {k.decode(): v.decode() for k, v in redis.hgetall(self._key).items()}
+        seconds, micros = redis.time()
+        now_ms = seconds * 1000 + micros // 1000
+        opened_until = int(raw.get("opened_until") or 0)
+        state, retry_in = "closed", None
+        if opened_until and now_ms < opened_until:
+            state, retry_in = "open", round((opened_until - now_ms) / 1000, 1)
+        elif opened_until:
+            state = "half_open"
+        return {
+            "state": state,
+            "consecutiveFailures": int(raw.get("failures") or 0),
+            "retryInSeconds": retry_in,
+            "lastError": raw.get("last_error"),
+        }
+
+
+class LatencyTracker:
+    """Последние window длительностей успешных вызовов — общий список в Redis,
+    чтобы порог hedging набирался по всем процессам. Перцентиль кэшируется в
+    процессе на LATENCY_CACHE_SECONDS."""
+
+    def __init__(self, name: str, window: int = 200) -> None:
+        self.window = window
+        self._key = f"{LATENCY_KEY}{name}"
+        self._cached: tuple[float, float, float | None] | None = None
+        self._lock = threading.Lock()
+
+    def add(self, seconds: float) -> None:
+        try:
+            pipe = get_redis().pipeline(transaction=False)
+            pipe.lpush(self._key, f"{seconds:.4f}")
+            pipe.ltrim(self._key, 0, self.window - 1)
+            pipe.expire(self._key, LATENCY_TTL_SECONDS)
+            pipe.execute()
+        except Exception:
+            logger.warning("resilience.latency_unavailable key=%s", self._key)
+
+    def percentile(self, p: float, min_samples: int) -> float | None:
+        now = time.monotonic()
+        with self._lock:
+            if self._cached is not None and self._cached[0] == p and now - self._cached[1] < LATENCY_CACHE_SECONDS:
+                return self._cached[2]
+        try:
+            samples = sorted(float(v) for v in get_redis().lrange(self._key, 0, -1))
+        except Exception:
+            logger.warning("resilience.latency_unavailable key=%s", self._key)
+            return None
+        value = None
+        if len(samples) >= min_samples:
+            value = samples[min(len(samples) - 1, int(p * len(samples)))]
+        with self._lock:
+            self._cached = (p, now, value)
+        return value
+
+
+class UpstreamGuard:
+    """Повторы с jitter-бэкоффом, опциональный hedged-запрос и circuit breaker
+    для одного апстрима. Breaker, выборка задержек и счётчики — общие в Redis."""
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.breaker = CircuitBreaker(
+            name,
+            failure_threshold=settings.upstream_breaker_failure_threshold,
+            reset_seconds=settings.upstream_breaker_reset_seconds,
+        )
+        self.latency = LatencyTracker(name)
+        self._stats_key = f"{STATS_KEY}{name}"
+
+    def _count(self, field: str) -> None:
+        try:
+            get_redis().hincrby(self._stats_key, field, 1)
+        except Exception:
+            logger.warning("resilience.stats_unavailable upstream=%s", self.name)
+
+    def call(self, fn: Callable[[], T], hedge: bool = True) -> T:
+        """hedge=True — только для идемпотентных fn: дублирующий вызов не должен
+        создавать новую платную операцию."""
+        attempts = settings.upstream_retry_attempts + 1
+        for attempt in range(1, attempts + 1):
+            self.breaker.before_call()
+            started = time.monotonic()
+            try:
+                result = self._hedged(fn) if hedge and settings.upstream_hedge_enabled else fn()
+            except Exception as exc:
+                if _counts_as_outage(exc):
+                    self.breaker.record_failure(exc)
+                else:
+                    # апстрим ответил (например, 4xx) — он жив
+                    self.breaker.record_success()
+                if attempt == attempts or not is_retryable(exc):
+                    raise
+                # full jitter: равномерно от 0 до экспоненциального потолка
+                delay = random.uniform(
+                    0,
+                    min(settings.upstream_retry_max_delay_seconds, settings.upstream_retry_base_delay_seconds * 2 ** (attempt - 1)),
+                )
+                self._count("retries")
+                logger.warning(
+                    "resilience.retry upstream=%s attempt=%s delay_ms=%.0f error=%s", self.name, attempt, delay * 1000, exc
+                )
+                time.sleep(delay)
+                continue
+            self.breaker.record_success()
+            self.latency.add(time.monotonic() - started)
+            return result
+        raise AssertionError("unreachable")
+
+    def _hedged(self, fn: Callable[[], T]) -> T:
+        hedge_after = self.latency.percentile(settings.upstream_hedge_percentile, settings.upstream_hedge_min_samples)
+        if hedge_after is None:
+            return fn()
+        primary = _hedge_pool().submit(fn)
+        try:
+            return primary.result(timeout=hedge_after)
+        except FutureTimeoutError:
+            pass
+        # первый запрос дольше pXX — отправляем второй, берём первый успешный
+        self._count("hedges")
+        logger.info("resilience.hedge upstream=%s after_ms=%.0f", self.name, hedge_after * 1000)
+        backup = _hedge_pool().submit(fn)
+        done, _ = wait([primary, backup], return_when=FIRST_COMPLETED)
+        for future in done:
+            if future.exception() is None:
+                if future is backup:
+                    self._count("hedge_wins")
+                return future.result()
+        other = backup if primary in done else primary
+        result = other.result()
+        if other is backup:
+            self._count("hedge_wins")
+        return result
+
+    def stats(self) -> dict[str, Any]:
+        p = settings.upstream_hedge_percentile
+        hedge_after = self.latency.percentile(p, settings.upstream_hedge_min_samples)
+        counters = {k.decode(): int(v) for k, v in get_redis().hgetall(self._stats_key).items()}
+        return {
+            "breaker": self.breaker.snapshot(),
+            "retries": counters.get("retries", 0),
+            "hedges": counters.get("hedges", 0),
+            "hedgeWins": counters.get("hedge_wins", 0),
+            "hedgeAfterMs": round(hedge_after * 1000) if hedge_after is not None else None,
+        }
+
+
+_pool: ThreadPoolExecutor | None = None
+_pool_lock = threading.Lock()
+_guards: dict[str, UpstreamGuard] = {}
+_guards_lock = threading.Lock()
+
+
+def _hedge_pool() -> ThreadPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(max_workers=settings.upstream_hedge_max_threads, thread_name_prefix="hedge")
+        return _pool
+
+
+def get_guard(upstream: str) -> UpstreamGuard:
+    with _guards_lock:
+        guard = _guards.get(upstream)
+        if guard is None:
+            guard = _guards[upstream] = UpstreamGuard(upstream)
+        return guard
+
+
+def guards_stats() -> dict[str, Any]:
+    """Состояние breaker, порог hedging и счётчики апстримов — общие для всех процессов."""
+    result: dict[str, Any] = {}
+    for upstream in ("yandex_ocr", "yandex_gpt"):
+        try:
+            result[upstream] = get_guard(upstream).stats()
+        except Exception:
+            logger.warning("resilience.read_state_failed upstream=%s", upstream)
+    return result
@@ -1,25 +1,131 @@
 from __future__ import annotations
 
-from typing import Optional
+import os
+import tempfile
+import threading
+from typing import Any, Optional
 import boto3
 from botocore.client import Config
+from botocore.exceptions import ClientError
 from app.core.config import settings
+from app.core.timing import timed
+from app.services.s3_utils import parse_s3_url
+
+
+_s3_client = None
+_s3_client_lock = threading.Lock()
 
 
 def get_s3_client():
-    return boto3.client(
-        "s3",
-        endpoint_url=settings.s3_endpoint_url,
-        aws_access_key_id=settings.s3_access_key_id,
-        aws_secret_access_key=settings.s3_secret_access_key,
-        region_name=settings.s3_region_name,
-        config=Config(s3={"addressing_style": "path"}),
-    )
+    """Один S3-клиент на процесс: boto3-клиенты потокобезопасны, а создание
+    клиента дорогое (загрузка моделей сервиса) и каждый раз даёт новый пул соединений."""
+    global _s3_client
+    if _s3_client is None:
+        with _s3_client_lock:
+            if _s3_client is None:
+                _s3_client = boto3.client(
+                    "s3",
+                    endpoint_url=settings.s3_endpoint_url,
+                    aws_access_key_id=settings.s3_access_key_id,
+                    aws_secret_access_key=settings.s3_secret_access_key,
+                    region_name=settings.s3_region_name,
+                    config=Config(
+                        s3={"addressing_style": "path"},
+                        max_pool_connections=settings.s3_max_pool_connections,
+                        retries={"max_attempts": settings.s3_max_attempts, "mode": "standard"},
+                        connect_timeout=settings.s3_connect_timeout_seconds,
+                        read_timeout=settings.s3_read_timeout_seconds,
+                    ),
+                )
+    return _s3_client
+
+
+def s3_pool_stats() -> dict[str, Any]:
+    """Состояние пула соединений urllib3 внутри общего клиента."""
+    if _s3_client is None:
+        return {"initialized": False}
+    http_session = _s3_client._endpoint.http_session
+    pools = []
+    for key in list(http_session._manager.pools.keys()):
+        pool = http_session._manager.pools.get(key)
+        if pool is None:
+            continue
+        pools.append({
+            "host": f"{pool.scheme}://{pool.host}:{pool.port}",
+            "maxSize": pool.pool.maxsize,
+            "inUse": pool.pool.maxsize - pool.pool.qsize(),
+            "created": pool.num_connections,
+            "requests": pool.num_requests,
+        })
+    return {
+        "initialized": True,
+        "maxPoolConnections": settings.s3_max_pool_connections,
+        "pools": pools,
+    }
+
+
+def _reset_after_fork() -> None:
+    # соединения родителя нельзя делить с форкнутым воркером RQ
+    global _s3_client, _s3_client_lock
+    _s3_client = None
+    _s3_client_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
 
 
 def upload_bytes(key: str, data: bytes, content_type: Optional[str] = None) -> str:
     s3 = get_s3_client()
     extra = {"ContentType": content_type} if content_type else None
-    s3.put_object(Bucket=settings.s3_bucket_name, Key=key, Body=data, **({} if not extra else extra))
+    with timed("s3_put"):
+        s3.put_object(Bucket=settings.s3_bucket_name, Key=key, Body=data, **({} if not extra else extra))
     return f"s3://{settings.s3_bucket_name}/{key}"
 
+
+
+def upload_file(key: str, path: str, content_type: Optional[str] = None) -> str:
+    """Загружает файл с диска потоково (multipart для больших файлов), без чтения в память целиком."""
+    s3 = get_s3_client()
+    extra = {"ContentType": content_type} if content_type else None
+    with open(path, "rb") as f, timed("s3_put"):
+        s3.upload_fileobj(f, settings.s3_bucket_name, key, ExtraArgs=extra)
+    return f"s3://{settings.s3_bucket_name}/{key}"
+
+
+def presigned_upload(key: str, content_type: str, max_bytes: int, expires: int) -> dict[str, Any]:
+    """Presigned POST для загрузки из браузера напрямую в S3: тип и размер зашиты в политику."""
+    return get_s3_client().generate_presigned_post(
+        Bucket=settings.s3_bucket_name,
+        Key=key,
+        Fields={"Content-Type": content_type},
+        Conditions=[{"Content-Type": content_type}, ["content-length-range", 1, max_bytes]],
+        ExpiresIn=expires,
+    )
+
+
+def head_object(s3_url: str) -> dict[str, Any] | None:
+    """HEAD объекта s3://bucket/key; None, если объекта нет."""
+    bucket, key = parse_s3_url(s3_url)
+    try:
+        with timed("s3_head"):
+            return get_s3_client().head_object(Bucket=bucket, Key=key)
+    except ClientError as exc:
+        if exc.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+            return None
+        raise
+
+
+def download_to_temp(s3_url: str) -> str:
+    """Скачивает объект s3://bucket/key во временный файл и возвращает путь к нему."""
+    bucket, key = parse_s3_url(s3_url)
+    suffix = os.path.splitext(key)[1]
+    handle = tempfile.NamedTemporaryFile(delete=False, suffix=suffix)
+    path = handle.name
+    try:
+        get_s3_client().download_fileobj(bucket, key, handle)
+    except Exception:
+        handle.close()
+        os.remove(path)
+        raise
+    handle.close()
+    return path
@@ -1,19 +1,17 @@
 import os
 import mimetypes
+import threading
+import time
+from collections import OrderedDict
 from typing import BinaryIO, Optional
-import boto3
 
 from app.core.config import settings
 
 
 def _s3_client():
-	return boto3.client(
-		"s3",
-		endpoint_url=settings.s3_endpoint_url,
-		aws_access_key_id=settings.s3_access_key_id,
-		aws_secret_access_key=settings.s3_secret_access_key,
-		region_name=settings.s3_region_name,
-	)
+	# общий клиент процесса (импорт здесь: app.services.s3 сам импортирует parse_s3_url)
+	from app.services.s3 import get_s3_client
+	return get_s3_client()
 
 
 def s3_key_for_upload(anon_user_id: str, request_id: str, filename: str) -> str:
@@ -30,14 +28,79 @@ def upload_bytes(bucket: str, key: str, data: bytes, content_type: Optional[str]
 	client.put_object(Bucket=bucket, Key=key, Body=data, ContentType=ct)
 
 
+# LRU выданных presigned-ссылок: (bucket, key, expires) -> (url, истекает_в)
+_presign_cache: "OrderedDict[tuple[str, str, int], tuple[str, float]]" = OrderedDict()
+_presign_lock = threading.Lock()
+_presign_stats = {"hits": 0, "misses": 0}
+
+
+def _cache_get(cache_key: tuple[str, str, int], now: float) -> tuple[str, float] | None:
+	entry = _presign_cache.get(cache_key)
+	if entry is None:
+		return None
+	# ссылку отдаём, только пока до её истечения больше запаса S3_PRESIGN_CACHE_MARGIN_SECONDS
+	margin = min(settings.s3_presign_cache_margin_seconds, cache_key[2] / 2)
+	if entry[1] - now <= margin:
+		del _presign_cache[cache_key]
+		return None
+	_presign_cache.move_to_end(cache_key)
+	return entry
+
+
+def _cache_put(cache_key: tuple[str, str, int], url: str, expires_at: float) -> None:
+	_presign_cache[cache_key] = (url, expires_at)
+	_presign_cache.move_to_end(cache_key)
+	while len(_presign_cache) > settings.s3_presign_cache_size:
+		_presign_cache.popitem(last=False)
+
+
+def presign_get_urls_with_expiry(bucket: str, keys: list[str], expires: Optional[int] = None) -> list[tuple[str, int]]:
+	"""Пакетная выдача presigned GET-ссылок: [(url, сколько секунд ещё действует)].
+
+	Уже выданные и не истекающие ссылки берутся из LRU-кэша, остальные
+	подписываются одним общим клиентом.
+	"""
+	exp = int(expires or settings.s3_presign_ttl_seconds)
+	now = time.time()
+	result: list[tuple[str, int] | None] = [None] * len(keys)
+	missing: list[int] = []
+	with _presign_lock:
+		for i, key in enumerate(keys):
+			entry = _cache_get((bucket, key, exp), now)
+			if entry is None:
+				missing.append(i)
+			else:
+				result[i] = (entry[0], int(entry[1] - now))
+		_presign_stats["hits"] += len(keys) - len(missing)
+		_presign_stats["misses"] += len(missing)
+	if missing:
+		client = _s3_client()
+		signed = []
+		for i in missing:
+			url = client.generate_presigned_url(
+				"get_object",
+				Params={"Bucket": bucket, "Key": keys[i]},
+				ExpiresIn=exp,
+			)
+			signed.append((i, url))
+			result[i] = (url, exp)
+		with _presign_lock:
+			for i, url in signed:
+				_cache_put((bucket, keys[i], exp), url, now + exp)
+	return result  # type: ignore[return-value]
+
+
+def presign_get_urls(bucket: str, keys: list[str], expires: Optional[int] = None) -> list[str]:
+	return [url for url, _ in presign_get_urls_with_expiry(bucket, keys, expires)]
+
+
+def presign_cache_stats() -> dict:
+	with _presign_lock:
+		return {**_presign_stats, "size": len(_presign_cache), "maxSize": settings.s3_presign_cache_size}
+
+
 def presigned_get_url(bucket: str, key: str, expires: Optional[int] = None) -> str:
-	client = _s3_client()
-	exp = expires or settings.s3_presign_ttl_seconds
-	return client.generate_presigned_url(
-		"get_object",
-		Params={"Bucket": bucket, "Key": key},
-		ExpiresIn=exp,
-	)
+	return presign_get_urls(bucket, [key], expires)[0]
 
 
 def get_file_url(bucket: str, key: str, expires: Optional[int] = None) -> str:
@@ -46,17 +109,13 @@ def get_file_url(bucket: str, key: str, expires: Optional[int] = None) -> str:
 
 
 def get_file_url_with_expiry(bucket: str, key: str, expires: Optional[int] = None) -> tuple[str, int]:
-	"""Возвращает (url, expires_in секунд)."""
-	exp = expires or settings.s3_presign_ttl_seconds
-	return presigned_get_url(bucket, key, exp), exp
+	"""Возвращает (url, expires_in секунд). Для ссылки из кэша — оставшийся срок."""
+	return presign_get_urls_with_expiry(bucket, [key], expires)[0]
 
 
 def get_files_url(bucket: str, object_names: list[str], expires: Optional[int] = None) -> list[str]:
 	"""Возвращает список публичных presigned-ссылок для нескольких ключей."""
-	urls: list[str] = []
-	for name in object_names:
-		urls.append(get_file_url(bucket, name, expires))
-	return urls
+	return presign_get_urls(bucket, object_names, expires)
 
 
 def parse_s3_url(url: str) -> tuple[str, str]:
@@ -7,6 +7,7 @@ import httpx
 import jwt
 
 from app.core.config import settings
+from app.services.http_clients import get_upstream_clients
 
 logger = logging.getLogger(__name__)
 
@@ -36,10 +37,10 @@ class VkIdService:
             "code_verifier": code_verifier,
         }
         try:
-            with httpx.Client(timeout=15.0) as client:
-                resp = client.post(self.token_url, data=payload)
-                resp.raise_for_status()
-                data = resp.json()
+            client = get_upstream_clients().sync_client("vk_id")
+            resp = client.post(self.token_url, data=payload)
+            resp.raise_for_status()
+            data = resp.json()
         except httpx.HTTPStatusError as exc:
             text = exc.response.text
             logger.warning("vk_id.exchange_failed", status=exc.response.status_code, body=text)
@@ -68,10 +69,10 @@ class VkIdService:
             "v": "5.199",
         }
         try:
-            with httpx.Client(timeout=10.0) as client:
-                resp = client.get(self.users_api_url, params=params)
-                resp.raise_for_status()
-                data = resp.json()
+            client = get_upstream_clients().sync_client("vk_id")
+            resp = client.get(self.users_api_url, params=params, timeout=10.0)
+            resp.raise_for_status()
+            data = resp.json()
         except Exception:
             logger.warning("vk_id.users_get_failed", exc_info=True)
             return {}
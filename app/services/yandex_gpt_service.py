@@ -2,11 +2,14 @@ from __future__ import annotations
 
 import json
 import logging
-from typing import Any, Tuple
+from typing import Any, Callable, Tuple
 
 from openai import OpenAI
 
 from app.core.config import settings
+from app.core.metrics import GPT_GENERATE_SECONDS
+from app.services.http_clients import get_upstream_clients
+from app.services.rate_limiter import get_limiter
 
 logger = logging.getLogger(__name__)
 
@@ -23,6 +26,10 @@ class YandexGPTService:
             api_key=api_key,
             base_url=settings.yandex_gpt_base_url,
             project=project,
+            timeout=settings.yandex_gpt_timeout_seconds,
+            # повторы — в app.services.resilience, чтобы их видел circuit breaker
+            max_retries=0,
+            http_client=get_upstream_clients().sync_client("yandex_gpt"),
         )
 
         if not hasattr(self.client, "responses"):
@@ -31,14 +38,44 @@ class YandexGPTService:
                 "Please install openai>=1.0 inside the runtime environment."
             )
 
-    def generate(self, input_text: str) -> Tuple[str, dict[str, Any]]:
-        if not input_text.strip():
-            raise ValueError("Empty input text for Yandex GPT")
-        logger.info("yandex_gpt.generate: text_len=%s", len(input_text))
-        response = self.client.responses.create(
+    def _stream_response(self, input_text: str, on_delta: Callable[[str], None]) -> Any:
+        stream = self.client.responses.create(
             prompt={"id": self.prompt_id},
             input=input_text,
+            stream=True,
         )
+        with stream:
+            for event in stream:
+                if event.type == "response.output_text.delta":
+                    on_delta(event.delta)
+                elif event.type == "response.completed":
+                    return event.response
+                elif event.type in ("response.failed", "response.incomplete"):
+                    raise RuntimeError(f"Yandex GPT response {event.type}: {getattr(event.response, 'error', None)}")
+                elif event.type == "error":
+                    raise RuntimeError(f"Yandex GPT stream error: {event.message}")
+        raise RuntimeError("Yandex GPT stream ended without response.completed")
+
+    def generate(
+        self,
+        input_text: str,
+        on_delta: Callable[[str], None] | None = None,
+    ) -> Tuple[str, dict[str, Any]]:
+        """Генерация ответа. С on_delta ответ читается потоком и каждый кусок текста
+        передаётся в колбэк по мере поступления."""
+        if not input_text.strip():
+            raise ValueError("Empty input text for Yandex GPT")
+        logger.info("yandex_gpt.generate: text_len=%s stream=%s", len(input_text), on_delta is not None)
+        # общий для всех воркеров лимит RPS/конкурентности: ждём ёмкости вместо 429
+        stream = "true" if on_delta is not None else "false"
+        with get_limiter("yandex_gpt").slot(), GPT_GENERATE_SECONDS.labels(stream=stream).time():
+            if on_delta is not None:
+                response = self._stream_response(input_text, on_delta)
+            else:
+                response = self.client.responses.create(
+                    prompt={"id": self.prompt_id},
+                    input=input_text,
+                )
 
         text = (getattr(response, "output_text", "") or "").strip()
         usage = getattr(response, "usage", None)
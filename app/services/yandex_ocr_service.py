@@ -1,18 +1,129 @@
 from __future__ import annotations
 
+import asyncio
 import base64
+import json
 import logging
 import time
-from typing import Any, Tuple
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Callable, Iterator, Tuple
 
 import httpx
 
 from app.core.config import settings
+from app.core.metrics import OCR_POLL_WAIT_SECONDS, OCR_SUBMIT_SECONDS
+from app.services.http_clients import get_upstream_clients
+from app.services.rate_limiter import get_limiter
 
 logger = logging.getLogger(__name__)
 
-OCR_API_URL = "https://ocr.api.cloud.yandex.net/ocr/v1"
-OPERATIONS_API_URL = "https://operation.api.cloud.yandex.net/operations"
+
+class OCROperationPending(Exception):
+    """Операция не завершилась к дедлайну опроса, но продолжает выполняться в Yandex:
+    результат можно забрать позже по operation_id, не отправляя файл заново."""
+
+    def __init__(self, operation_id: str) -> None:
+        super().__init__(f"Yandex OCR operation {operation_id} is still running")
+        self.operation_id = operation_id
+
+
+class OCROperationFailed(RuntimeError):
+    """Операция завершилась в Yandex с ошибкой."""
+
+
+def operation_lease_seconds() -> float:
+    """Аренда слота квоты на операцию: операция может пережить все отложенные
+    перезапуски пайплайна (OCR_RESUME_DELAY_SECONDS × OCR_RESUME_MAX_ATTEMPTS)
+    вместе с опросом в каждом из них."""
+    resume_window = (settings.ocr_resume_delay_seconds + settings.ocr_poll_timeout_seconds) * (
+        settings.ocr_resume_max_attempts + 1
+    )
+    return max(settings.upstream_limiter_lease_seconds, resume_window)
+
+
+def _finishes_operation(exc: BaseException | None) -> bool:
+    # слот квоты держится, пока операция выполняется в Yandex: отпускаем при
+    # результате, ошибке операции и 404 (операция истекла)
+    if exc is None or isinstance(exc, OCROperationFailed):
+        return True
+    return isinstance(exc, httpx.HTTPStatusError) and exc.response.status_code == 404
+
+
+def _parse_recognition(operation_id: str, recognition: dict[str, Any]) -> Tuple[str, dict[str, Any]]:
+    text_annotation = (
+        recognition.get("textAnnotation")
+        or recognition.get("result", {}).get("textAnnotation")
+        or {}
+    )
+    full_text = (
+        text_annotation.get("fullText")
+        or recognition.get("fullText")
+        or recognition.get("result", {}).get("fullText")
+        or ""
+    )
+    if not full_text:
+        raw = recognition.get("raw") or {}
+        full_text = (
+            raw.get("result", {})
+            .get("textAnnotation", {})
+            .get("fullText")
+            or ""
+        )
+    logger.info("yandex_ocr.recognize: full_text_len=%s", len(full_text or ""))
+
+    return full_text, {
+        "operationId": operation_id,
+        "textAnnotation": text_annotation,
+        "raw": recognition,
+    }
+
+
+def _auth_headers(api_key: str, folder_id: str | None) -> dict[str, str]:
+    headers = {
+        "Authorization": f"Api-Key {api_key}",
+    }
+    if folder_id:
+        headers["x-folder-id"] = folder_id
+    return headers
+
+
+class OCRRequestBody:
+    """JSON-тело recognizeTextAsync с потоковым base64-кодированием content.
+
+    Вместо bytes → base64-строка → JSON-строка → bytes кодирует вход кусками
+    прямо при отправке: в памяти одна копия изображения (bytes/mmap) плюс буфер куска.
+    """
+
+    # кратно 3, чтобы куски base64 склеивались без паддинга
+    CHUNK_SIZE = 3 * 64 * 1024
+
+    def __init__(self, content: Any, mime_type: str | None, language_codes: list[str] | None) -> None:
+        self.content = content
+        self.size = len(content)
+        self.mime_type = mime_type or "image/jpeg"
+        fields = {
+            "mimeType": self.mime_type,
+            "languageCodes": language_codes or ["ru"],
+            "model": "math-markdown",
+        }
+        self._prefix = json.dumps(fields)[:-1].encode() + b', "content": "'
+        self._suffix = b'"}'
+        self.content_length = len(self._prefix) + 4 * ((self.size + 2) // 3) + len(self._suffix)
+
+    @property
+    def headers(self) -> dict[str, str]:
+        return {"Content-Type": "application/json", "Content-Length": str(self.content_length)}
+
+    def __iter__(self) -> Iterator[bytes]:
+        yield self._prefix
+        with memoryview(self.content) as view:
+            for offset in range(0, self.size, self.CHUNK_SIZE):
+                yield base64.b64encode(view[offset:offset + self.CHUNK_SIZE])
+        yield self._suffix
+
+    async def astream(self) -> AsyncIterator[bytes]:
+        for chunk in self:
+            yield chunk
 
 
 class YandexOCRService:
@@ -21,67 +132,70 @@ class YandexOCRService:
         self.folder_id = folder_id
 
     def _headers(self) -> dict[str, str]:
-        headers = {
-            "Authorization": f"Api-Key {self.api_key}",
-        }
-        if self.folder_id:
-            headers["x-folder-id"] = self.folder_id
-        return headers
+        return _auth_headers(self.api_key, self.folder_id)
 
-    def recognize(
+    def submit(
         self,
         content: bytes,
         mime_type: str | None = None,
         language_codes: list[str] | None = None,
+    ) -> str:
+        if not content:
+            raise ValueError("Empty content provided for OCR")
+        body = OCRRequestBody(content, mime_type, language_codes)
+        logger.info("yandex_ocr.recognize: sending request mime=%s size=%s", body.mime_type, body.size)
+        client = get_upstream_clients().sync_client("yandex_ocr")
+        with OCR_SUBMIT_SECONDS.time():
+            resp = client.post(
+                f"{settings.yandex_ocr_api_url}/recognizeTextAsync",
+                content=body,
+                headers={**self._headers(), **body.headers},
+            )
+        resp.raise_for_status()
+        operation_id = resp.json().get("id")
+        if not operation_id:
+            raise RuntimeError("Yandex OCR did not return operation id")
+        return operation_id
+
+    def fetch(
+        self,
+        operation_id: str,
         poll_timeout: float = 60.0,
         poll_interval: float = 2.0,
     ) -> Tuple[str, dict[str, Any]]:
-        if not content:
-            raise ValueError("Empty content provided for OCR")
-        payload = {
-            "content": base64.b64encode(content).decode(),
-            "mimeType": mime_type or "image/jpeg",
-            "languageCodes": language_codes or ["ru"],
-            "model": "math-markdown",
-        }
+        """Дожидается уже отправленной операции и забирает результат.
+        Не успела к poll_timeout — OCROperationPending (операция продолжает выполняться)."""
+        client = get_upstream_clients().sync_client("yandex_ocr")
         headers = self._headers()
-        logger.info("yandex_ocr.recognize: sending request mime=%s size=%s", payload["mimeType"], len(content))
-        with httpx.Client(timeout=30.0) as client:
-            resp = client.post(f"{OCR_API_URL}/recognizeTextAsync", json=payload, headers=headers)
-            resp.raise_for_status()
-            data = resp.json()
-            operation_id = data.get("id")
-            if not operation_id:
-                raise RuntimeError("Yandex OCR did not return operation id")
-            self._wait_operation(client, headers, operation_id, poll_timeout, poll_interval)
+        try:
+            with OCR_POLL_WAIT_SECONDS.time():
+                self._wait_operation(client, headers, operation_id, poll_timeout, poll_interval)
             recognition = self._get_recognition(client, headers, operation_id)
+        except Exception as exc:
+            if _finishes_operation(exc):
+                get_limiter("yandex_ocr").release_operation(operation_id)
+            raise
+        get_limiter("yandex_ocr").release_operation(operation_id)
+        return _parse_recognition(operation_id, recognition)
 
-        text_annotation = (
-            recognition.get("textAnnotation")
-            or recognition.get("result", {}).get("textAnnotation")
-            or {}
-        )
-        full_text = (
-            text_annotation.get("fullText")
-            or recognition.get("fullText")
-            or recognition.get("result", {}).get("fullText")
-            or ""
-        )
-        if not full_text:
-            raw = recognition.get("raw") or {}
-            full_text = (
-                raw.get("result", {})
-                .get("textAnnotation", {})
-                .get("fullText")
-                or ""
-            )
-        logger.info("yandex_ocr.recognize: full_text_len=%s", len(full_text or ""))
-        
-        return full_text, {
-            "operationId": operation_id,
-            "textAnnotation": text_annotation,
-            "raw": recognition,
-        }
+    def recognize(
+        self,
+        content: bytes,
+        mime_type: str | None = None,
+        language_codes: list[str] | None = None,
+        poll_timeout: float = 60.0,
+        poll_interval: float = 2.0,
+        on_submitted: Callable[[str], None] | None = None,
+    ) -> Tuple[str, dict[str, Any]]:
+        # квота Yandex — на одновременные операции: слот привязывается к operation_id
+        # и держится и через отложенный опрос (OCROperationPending), пока fetch
+        # не получит результат, ошибку операции или 404
+        with get_limiter("yandex_ocr").operation_slot(operation_lease_seconds()) as bind:
+            operation_id = self.submit(content, mime_type, language_codes)
+            bind(operation_id)
+        if on_submitted is not None:
+            on_submitted(operation_id)
+        return self.fetch(operation_id, poll_timeout, poll_interval)
 
     def _wait_operation(
         self,
@@ -93,16 +207,16 @@ class YandexOCRService:
     ) -> None:
         deadline = time.time() + poll_timeout
         while True:
-            resp = client.get(f"{OPERATIONS_API_URL}/{operation_id}", headers=headers)
+            resp = client.get(f"{settings.yandex_ocr_operations_url}/{operation_id}", headers=headers)
             resp.raise_for_status()
             body = resp.json()
             if body.get("done"):
                 if "error" in body:
-                    raise RuntimeError(f"Yandex OCR operation error: {body['error']}")
+                    raise OCROperationFailed(f"Yandex OCR operation error: {body['error']}")
                 logger.info("yandex_ocr.operation_done: operation_id=%s", operation_id)
                 return
             if time.time() > deadline:
-                raise TimeoutError("Yandex OCR operation timeout")
+                raise OCROperationPending(operation_id)
             time.sleep(poll_interval)
 
     def _get_recognition(
@@ -111,12 +225,190 @@ class YandexOCRService:
         headers: dict[str, str],
         operation_id: str,
     ) -> dict[str, Any]:
-        resp = client.get(f"{OCR_API_URL}/getRecognition", params={"operationId": operation_id}, headers=headers)
+        resp = client.get(
+            f"{settings.yandex_ocr_api_url}/getRecognition", params={"operationId": operation_id}, headers=headers
+        )
         resp.raise_for_status()
         return resp.json()
 
 
+@dataclass
+class _PendingOperation:
+    future: asyncio.Future
+    deadline: float
+
+
+class OCROperationPoller:
+    """Один поллер на все незавершённые операции OCR текущего event loop.
+
+    Вместо цикла time.sleep на каждую задачу: операции регистрируются в общем
+    словаре, раз в interval корутина опрашивает их все (с ограничением на число
+    одновременных запросов) и разрешает future каждой задачи.
+    """
+
+    def __init__(
+        self,
+        client_factory: Callable[[], httpx.AsyncClient],
+        headers: dict[str, str],
+        interval: float,
+        max_in_flight: int,
+    ) -> None:
+        self._client_factory = client_factory
+        self._headers = headers
+        self._interval = interval
+        self._semaphore = asyncio.Semaphore(max_in_flight)
+        self._pending: dict[str, _PendingOperation] = {}
+        self._task: asyncio.Task | None = None
+
+    @property
+    def pending_count(self) -> int:
+        return len(self._pending)
+
+    def register(self, operation_id: str, timeout: float) -> asyncio.Future:
+        loop = asyncio.get_running_loop()
+        entry = self._pending.get(operation_id)
+        if entry is None or entry.future.done():
+            entry = _PendingOperation(future=loop.create_future(), deadline=loop.time() + timeout)
+            self._pending[operation_id] = entry
+        if self._task is None or self._task.done():
+            self._task = loop.create_task(self._run())
+        return entry.future
+
+    async def wait(self, operation_id: str, timeout: float) -> dict[str, Any]:
+        return await self.register(operation_id, timeout)
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while self._pending:
+            await asyncio.sleep(self._interval)
+            batch = list(self._pending.items())
+            await asyncio.gather(*(self._check(op_id, entry, loop.time()) for op_id, entry in batch))
+
+    async def _check(self, operation_id: str, entry: _PendingOperation, now: float) -> None:
+        if entry.future.done():
+            # ожидающий отменил задачу
+            self._pending.pop(operation_id, None)
+            return
+        try:
+            async with self._semaphore:
+                resp = await self._client_factory().get(
+                    f"{settings.yandex_ocr_operations_url}/{operation_id}", headers=self._headers
+                )
+            resp.raise_for_status()
+            body = resp.json()
+        except Exception as exc:
+            # временные ошибки опроса не фатальны до дедлайна
+            logger.warning("yandex_ocr.poll_failed: operation_id=%s error=%s", operation_id, exc)
+            body = {}
+        if body.get("done"):
+            self._pending.pop(operation_id, None)
+            if "error" in body:
+                entry.future.set_exception(OCROperationFailed(f"Yandex OCR operation error: {body['error']}"))
+            else:
+                logger.info("yandex_ocr.operation_done: operation_id=%s", operation_id)
+                entry.future.set_result(body)
+            return
+        if now > entry.deadline:
+            self._pending.pop(operation_id, None)
+            entry.future.set_exception(OCROperationPending(operation_id))
+
+
+class AsyncYandexOCRService:
+    """Асинхронный клиент OCR: отправка recognizeTextAsync и ожидание через общий поллер.
+
+    Экземпляр привязан к одному event loop (см. app.services.aio_loop).
+    Соединения берутся из общего async-клиента апстрима yandex_ocr.
+    """
+
+    def __init__(
+        self,
+        api_key: str,
+        folder_id: str | None = None,
+        poll_interval: float = 2.0,
+        max_in_flight: int = 8,
+    ) -> None:
+        self.api_key = api_key
+        self.folder_id = folder_id
+        self.poll_interval = poll_interval
+        self.max_in_flight = max_in_flight
+        self._poller: OCROperationPoller | None = None
+
+    def _headers(self) -> dict[str, str]:
+        return _auth_headers(self.api_key, self.folder_id)
+
+    def _get_client(self) -> httpx.AsyncClient:
+        return get_upstream_clients().async_client("yandex_ocr")
+
+    def _get_poller(self) -> OCROperationPoller:
+        if self._poller is None:
+            self._poller = OCROperationPoller(
+                self._get_client,
+                self._headers(),
+                interval=self.poll_interval,
+                max_in_flight=self.max_in_flight,
+            )
+        return self._poller
+
+    async def submit(
+        self,
+        content: bytes,
+        mime_type: str | None = None,
+        language_codes: list[str] | None = None,
+    ) -> str:
+        if not content:
+            raise ValueError("Empty content provided for OCR")
+        body = OCRRequestBody(content, mime_type, language_codes)
+        logger.info("yandex_ocr.submit_async: mime=%s size=%s", body.mime_type, body.size)
+        with OCR_SUBMIT_SECONDS.time():
+            resp = await self._get_client().post(
+                f"{settings.yandex_ocr_api_url}/recognizeTextAsync",
+                content=body.astream(),
+                headers={**self._headers(), **body.headers},
+            )
+        resp.raise_for_status()
+        operation_id = resp.json().get("id")
+        if not operation_id:
+            raise RuntimeError("Yandex OCR did not return operation id")
+        return operation_id
+
+    async def fetch(self, operation_id: str, poll_timeout: float = 60.0) -> Tuple[str, dict[str, Any]]:
+        """Дожидается уже отправленной операции через общий поллер и забирает результат."""
+        try:
+            with OCR_POLL_WAIT_SECONDS.time():
+                await self._get_poller().wait(operation_id, poll_timeout)
+            resp = await self._get_client().get(
+                f"{settings.yandex_ocr_api_url}/getRecognition",
+                params={"operationId": operation_id},
+                headers=self._headers(),
+            )
+            resp.raise_for_status()
+        except Exception as exc:
+            if _finishes_operation(exc):
+                await asyncio.to_thread(get_limiter("yandex_ocr").release_operation, operation_id)
+            raise
+        await asyncio.to_thread(get_limiter("yandex_ocr").release_operation, operation_id)
+        return _parse_recognition(operation_id, resp.json())
+
+    async def recognize(
+        self,
+        content: bytes,
+        mime_type: str | None = None,
+        language_codes: list[str] | None = None,
+        poll_timeout: float = 60.0,
+        on_submitted: Callable[[str], None] | None = None,
+    ) -> Tuple[str, dict[str, Any]]:
+        # слот привязывается к operation_id — см. YandexOCRService.recognize
+        async with get_limiter("yandex_ocr").aoperation_slot(operation_lease_seconds()) as bind:
+            operation_id = await self.submit(content, mime_type, language_codes)
+            await asyncio.to_thread(bind, operation_id)
+        if on_submitted is not None:
+            # колбэк синхронный (пишет в БД) — не в потоке event loop
+            await asyncio.to_thread(on_submitted, operation_id)
+        return await self.fetch(operation_id, poll_timeout)
+
+
 _ocr_service: YandexOCRService | None = None
+_async_ocr_service: AsyncYandexOCRService | None = None
 
 
 def get_ocr_service() -> YandexOCRService:
@@ -131,3 +423,15 @@ def get_ocr_service() -> YandexOCRService:
     return _ocr_service
 
 
+def get_async_ocr_service() -> AsyncYandexOCRService:
+    global _async_ocr_service
+    if _async_ocr_service is None:
+        if not settings.yandex_ocr_api_key:
+            raise RuntimeError("YANDEX_OCR_API_KEY is not configured")
+        _async_ocr_service = AsyncYandexOCRService(
+            api_key=settings.yandex_ocr_api_key,
+            folder_id=settings.yandex_cloud_folder_id,
+            poll_interval=settings.ocr_poll_interval_seconds,
+            max_in_flight=settings.ocr_poller_max_in_flight,
+        )
+    return _async_ocr_service
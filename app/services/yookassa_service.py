@@ -1,10 +1,10 @@
 import base64
-import requests
 from typing import Any, Dict
 import uuid
 import logging
 
 from app.core.config import settings
+from app.services.http_clients import get_upstream_clients
 
 logger = logging.getLogger(__name__)
 
@@ -70,8 +70,8 @@ def create_payment(order_id: str, amount_rub: float, description: str, return_ur
 		"YooKassa create_payment: order_id=%s amount=%.2f include_receipt=%s return_url_present=%s customer_keys=%s",
 		order_id, amount_rub, True, bool(return_url), list(receipt_customer.keys())
 	)
-	resp = requests.post(url, json=payload, headers=headers, timeout=20)
-	if not resp.ok:
+	resp = get_upstream_clients().sync_client("yookassa").post(url, json=payload, headers=headers)
+	if not resp.is_success:
 		err_text = None
 		try:
 			err_text = resp.text
@@ -5,6 +5,10 @@ import tempfile
 from pathlib import Path
 from typing import Any
 
+from rq.worker import SimpleWorker
+
+from app.core.metrics import mark_process_dead
+
 
 def run_cmd(cmd: list[str]) -> None:
     subprocess.check_call(cmd)
@@ -42,3 +46,23 @@ def process_run_job(payload: dict[str, Any]) -> dict[str, Any]:
         append_black_tail(str(inp), str(outp))
     return {"ok": True, "s3_key": "results/stub.mp4"}
 
+
+def run_job_pipeline(job_id: str) -> None:
+    """Точка входа RQ: пайплайн задачи по её id, вход берётся из input_s3_url."""
+    from app.services.job_pipeline import process_job_pipeline
+
+    process_job_pipeline(job_id)
+
+
+class PipelineWorker(SimpleWorker):
+    """Воркер RQ без fork на каждую задачу (rq worker --worker-class app.workers.worker.PipelineWorker).
+
+    Форк давал каждому прогону новый pid: в PROMETHEUS_MULTIPROC_DIR без конца
+    копились файлы метрик, а work-horse, убитый по таймауту, навсегда оставлял +1
+    в job_pipelines_in_flight. Здесь таймаут RQ — исключение внутри пайплайна,
+    а при остановке воркера его live-гейджи снимаются.
+    """
+
+    def teardown(self) -> None:
+        super().teardown()
+        mark_process_dead()
@@ -0,0 +1,332 @@
+"""Сквозной нагрузочный тест API без внешних сервисов.
+
+Поднимает заглушки Yandex OCR, Yandex GPT (Responses API), S3 и YooKassa в этом
+процессе (см. benchmarks.loadtest.fakes), запускает сервис отдельным процессом
+uvicorn, направив на них все апстримы, и подаёт open-loop нагрузку с заданным RPS:
+
+    create_job  POST /api/v1/job (картинка multipart, новый анонимный пользователь)
+    get_job     GET  /api/v1/job/{id} по ранее созданным задачам
+    auth_user   POST /api/v1/auth-user
+    payment     POST /api/v1/payments/intents → POST /api/v1/webhooks/payments/yookassa
+
+Нужны настоящие Postgres (DATABASE_URL, схема из postgresql.md) и Redis (REDIS_URL):
+
+    DATABASE_URL=postgresql://... REDIS_URL=redis://localhost:6378/0 \\
+        python -m benchmarks.loadtest --rps 20 --duration 60 --output report.json
+    python -m benchmarks.loadtest --rps 20 --duration 60 --baseline report.json
+
+Отчёт: пропускная способность, p50/p95/p99 по сценариям, доля ошибок, число
+завершённых пайплайнов и пиковый RSS процессов сервиса.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import io
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+from collections import defaultdict
+from typing import Any
+
+import httpx
+from PIL import Image
+
+from benchmarks.loadtest.fakes import Behaviour, FakeServer, FakeUpstreams
+
+API_KEY = "loadtest"
+SCENARIOS = ("create_job", "get_job", "auth_user", "payment")
+
+
+def _percentile(samples: list[float], p: float) -> float | None:
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(p * len(ordered)))]
+
+
+def _random_ip() -> str:
+    return f"10.{random.randint(0, 255)}.{random.randint(0, 255)}.{random.randint(1, 254)}"
+
+
+def _make_image(side: int) -> bytes:
+    # шум плохо сжимается — размер файла близок к реальным фото страниц
+    img = Image.frombytes("RGB", (side, side), os.urandom(side * side * 3))
+    out = io.BytesIO()
+    img.save(out, format="JPEG", quality=85)
+    return out.getvalue()
+
+
+def _process_tree(pid: int) -> list[int]:
+    pids = [pid]
+    for current in pids:
+        try:
+            for task in os.listdir(f"/proc/{current}/task"):
+                with open(f"/proc/{current}/task/{task}/children") as f:
+                    pids.extend(int(child) for child in f.read().split())
+        except OSError:
+            continue
+    return pids
+
+
+def _rss_mb(pid: int) -> float:
+    """Текущий RSS процесса сервиса вместе с воркерами uvicorn (Linux, /proc)."""
+    total_kb = 0
+    for child in _process_tree(pid):
+        try:
+            with open(f"/proc/{child}/status") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        total_kb += int(line.split()[1])
+        except OSError:
+            continue
+    return total_kb / 1024
+
+
+class LoadTest:
+    def __init__(self, args: argparse.Namespace, fakes: FakeUpstreams) -> None:
+        self.args = args
+        self.fakes = fakes
+        self.mix = self._parse_mix(args.mix)
+        self.latencies: dict[str, list[float]] = defaultdict(list)
+        self.errors: dict[str, int] = defaultdict(int)
+        self.job_ids: list[str] = []
+        self.user_ids: list[str] = []
+        self.image = _make_image(args.image_side)
+        self.peak_rss_mb = 0.0
+
+    @staticmethod
+    def _parse_mix(raw: str) -> dict[str, float]:
+        mix = {}
+        for part in raw.split(","):
+            name, _, weight = part.partition("=")
+            if name.strip() not in SCENARIOS:
+                raise SystemExit(f"unknown scenario: {name}")
+            mix[name.strip()] = float(weight or 1)
+        return mix
+
+    async def _timed(self, name: str, request: Any) -> httpx.Response | None:
+        started = time.perf_counter()
+        try:
+            resp = await request
+        except httpx.HTTPError:
+            self.errors[name] += 1
+            return None
+        self.latencies[name].append(time.perf_counter() - started)
+        if resp.status_code >= 400:
+            self.errors[name] += 1
+        return resp
+
+    async def create_job(self, client: httpx.AsyncClient) -> None:
+        files = {"image": ("page.jpg", self.image, "image/jpeg")}
+        resp = await self._timed("create_job", client.post("/api/v1/job", files=files, headers={"x-user-ip": _random_ip()}))
+        if resp is not None and resp.status_code == 200:
+            self.job_ids.append(resp.json()["jobId"])
+
+    async def get_job(self, client: httpx.AsyncClient) -> None:
+        if not self.job_ids:
+            await self.create_job(client)
+            return
+        await self._timed("get_job", client.get(f"/api/v1/job/{random.choice(self.job_ids)}"))
+
+    async def auth_user(self, client: httpx.AsyncClient) -> None:
+        # половина — повторные визиты уже известных IP
+        ip = _random_ip() if random.random() < 0.5 else f"10.0.0.{random.randint(1, 50)}"
+        resp = await self._timed("auth_user", client.post("/api/v1/auth-user", headers={"x-user-ip": ip}))
+        if resp is not None and resp.status_code == 200:
+            self.user_ids.append(resp.json()["id"])
+
+    async def payment(self, client: httpx.AsyncClient) -> None:
+        if not self.user_ids:
+            await self.auth_user(client)
+            return
+        body = {"userId": random.choice(self.user_ids), "tariffId": "1"}
+        resp = await self._timed(
+            "payment_intent", client.post("/api/v1/payments/intents", json=body, headers={"X-API-Key": API_KEY})
+        )
+        if resp is None or resp.status_code != 200 or not resp.json().get("paymentId"):
+            return
+        webhook = self.fakes.succeeded_webhook(resp.json()["paymentId"])
+        await self._timed("payment_webhook", client.post("/api/v1/webhooks/payments/yookassa", json=webhook))
+
+    async def _sample_rss(self, pid: int, stop: asyncio.Event) -> None:
+        while not stop.is_set():
+            self.peak_rss_mb = max(self.peak_rss_mb, _rss_mb(pid))
+            await asyncio.sleep(0.25)
+
+    async def run(self, base_url: str, service_pid: int) -> dict[str, Any]:
+        names = list(self.mix)
+        weights = [self.mix[name] for name in names]
+        limits = httpx.Limits(max_connections=self.args.connections, max_keepalive_connections=self.args.connections)
+        stop = asyncio.Event()
+        sampler = asyncio.create_task(self._sample_rss(service_pid, stop))
+        async with httpx.AsyncClient(base_url=base_url, timeout=self.args.timeout, limits=limits) as client:
+            total = int(self.args.rps * self.args.duration)
+            started = time.perf_counter()
+            tasks = []
+            # open-loop: запросы по расписанию, не дожидаясь ответов на предыдущие
+            for index in range(total):
+                delay = started + index / self.args.rps - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                scenario = random.choices(names, weights)[0]
+                tasks.append(asyncio.create_task(getattr(self, scenario)(client)))
+            await asyncio.gather(*tasks)
+            elapsed = time.perf_counter() - started
+            jobs = await self._wait_jobs(client)
+        stop.set()
+        await sampler
+        return self._report(elapsed, jobs)
+
+    async def _wait_jobs(self, client: httpx.AsyncClient) -> dict[str, int]:
+        """Дожидается завершения пайплайнов созданных задач (до --drain секунд)."""
+        statuses: dict[str, str] = {}
+        deadline = time.monotonic() + self.args.drain
+        pending = list(self.job_ids)
+        while pending and time.monotonic() < deadline:
+            for job_id in pending:
+                resp = await client.get(f"/api/v1/job/{job_id}")
+                if resp.status_code == 200:
+                    statuses[job_id] = resp.json().get("status")
+            pending = [job_id for job_id in pending if statuses.get(job_id) not in ("done", "failed")]
+            if pending:
+                await asyncio.sleep(1)
+        counts: dict[str, int] = defaultdict(int)
+        for job_id in self.job_ids:
+            counts[statuses.get(job_id) or "unknown"] += 1
+        return dict(counts)
+
+    def _report(self, elapsed: float, jobs: dict[str, int]) -> dict[str, Any]:
+        scenarios = {}
+        for name in sorted({*self.latencies, *self.errors}):
+            samples = self.latencies.get(name, [])
+            count = len(samples)
+            scenarios[name] = {
+                "count": count,
+                "errors": self.errors.get(name, 0),
+                "rps": round(count / elapsed, 2),
+                **{
+                    f"p{int(p * 100)}Ms": round(value * 1000, 1) if (value := _percentile(samples, p)) is not None else None
+                    for p in (0.5, 0.95, 0.99)
+                },
+            }
+        completed = sum(len(samples) for samples in self.latencies.values())
+        return {
+            "config": {"rps": self.args.rps, "duration": self.args.duration, "mix": self.mix, "workers": self.args.workers},
+            "elapsedSeconds": round(elapsed, 2),
+            "throughputRps": round(completed / elapsed, 2),
+            "scenarios": scenarios,
+            "jobs": jobs,
+            "peakRssMb": round(self.peak_rss_mb, 1),
+            "upstreamCalls": dict(self.fakes.counters),
+        }
+
+
+def _print_report(report: dict[str, Any], baseline: dict[str, Any] | None) -> None:
+    def delta(current: float | None, before: float | None) -> str:
+        if current is None or not before:
+            return ""
+        return f" ({(current - before) / before * 100:+.0f}%)"
+
+    base_scenarios = (baseline or {}).get("scenarios", {})
+    print(f"throughput: {report['throughputRps']} rps{delta(report['throughputRps'], (baseline or {}).get('throughputRps'))}")
+    print(f"peak RSS:   {report['peakRssMb']} MB{delta(report['peakRssMb'], (baseline or {}).get('peakRssMb'))}")
+    print(f"jobs:       {report['jobs']}")
+    print(f"{'scenario':<16}{'count':>8}{'errors':>8}{'p50 ms':>18}{'p95 ms':>18}{'p99 ms':>18}")
+    for name, row in report["scenarios"].items():
+        before = base_scenarios.get(name, {})
+        cells = [f"{row[key]}{delta(row[key], before.get(key))}" for key in ("p50Ms", "p95Ms", "p99Ms")]
+        print(f"{name:<16}{row['count']:>8}{row['errors']:>8}" + "".join(f"{cell:>18}" for cell in cells))
+
+
+def _start_service(args: argparse.Namespace, env: dict[str, str]) -> subprocess.Popen:
+    cmd = [sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1", "--port", str(args.port)]
+    cmd += ["--workers", str(args.workers), "--log-level", "warning", "--no-access-log"]
+    proc = subprocess.Popen(cmd, env={**os.environ, **env})
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise SystemExit("service exited during startup")
+        try:
+            if httpx.get(f"http://127.0.0.1:{args.port}/health", timeout=1).status_code == 200:
+                return proc
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    proc.terminate()
+    raise SystemExit("service did not become healthy")
+
+
+def _behaviour(latency_ms: float, error_rate: float, jitter: float) -> Behaviour:
+    return Behaviour(latency_ms=latency_ms, jitter=jitter, error_rate=error_rate)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rps", type=float, default=10.0)
+    parser.add_argument("--duration", type=float, default=30.0, help="секунд подачи нагрузки")
+    parser.add_argument("--mix", default="create_job=1,get_job=4,auth_user=2,payment=0.5")
+    parser.add_argument("--workers", type=int, default=1, help="воркеров uvicorn")
+    parser.add_argument("--port", type=int, default=18002)
+    parser.add_argument("--fakes-port", type=int, default=18080)
+    parser.add_argument("--connections", type=int, default=200)
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--drain", type=float, default=60.0, help="сколько ждать завершения пайплайнов")
+    parser.add_argument("--image-side", type=int, default=1600, help="сторона тестовой картинки, px")
+    parser.add_argument("--jitter", type=float, default=0.4, help="σ логнормальной задержки заглушек")
+    parser.add_argument("--ocr-latency-ms", type=float, default=80.0)
+    parser.add_argument("--ocr-processing-ms", type=float, default=1500.0)
+    parser.add_argument("--ocr-error-rate", type=float, default=0.0)
+    parser.add_argument("--gpt-latency-ms", type=float, default=2000.0)
+    parser.add_argument("--gpt-error-rate", type=float, default=0.0)
+    parser.add_argument("--s3-latency-ms", type=float, default=15.0)
+    parser.add_argument("--s3-error-rate", type=float, default=0.0)
+    parser.add_argument("--yookassa-latency-ms", type=float, default=150.0)
+    parser.add_argument("--yookassa-error-rate", type=float, default=0.0)
+    parser.add_argument("--output", help="сохранить отчёт в JSON")
+    parser.add_argument("--baseline", help="JSON прошлого прогона для сравнения")
+    parser.add_argument("--service-env", action="append", default=[], help="KEY=VALUE для сервиса")
+    args = parser.parse_args()
+
+    if not os.getenv("DATABASE_URL") and not os.getenv("POSTGRES_HOST"):
+        raise SystemExit("DATABASE_URL (Postgres со схемой из postgresql.md) is required")
+
+    fakes = FakeUpstreams(
+        ocr=_behaviour(args.ocr_latency_ms, args.ocr_error_rate, args.jitter),
+        ocr_processing=_behaviour(args.ocr_processing_ms, 0.0, args.jitter),
+        gpt=_behaviour(args.gpt_latency_ms, args.gpt_error_rate, args.jitter),
+        s3=_behaviour(args.s3_latency_ms, args.s3_error_rate, args.jitter),
+        yookassa=_behaviour(args.yookassa_latency_ms, args.yookassa_error_rate, args.jitter),
+    )
+    server = FakeServer(fakes, port=args.fakes_port)
+    server.start()
+    env = {
+        **fakes.service_env(server.base_url),
+        "SERVER_API_KEY": API_KEY,
+        # опрос OCR чаще, чем в проде: иначе время задачи округляется до интервала
+        "OCR_POLL_INTERVAL_SECONDS": "0.2",
+    }
+    env.update(item.split("=", 1) for item in args.service_env)
+    service = _start_service(args, env)
+    try:
+        report = asyncio.run(LoadTest(args, fakes).run(f"http://127.0.0.1:{args.port}", service.pid))
+    finally:
+        service.terminate()
+        service.wait(timeout=30)
+        server.stop()
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+    _print_report(report, baseline)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,261 @@
+"""Локальные заглушки внешних API для нагрузочного теста: Yandex OCR (операции),
+OpenAI-совместимый Responses API (Yandex GPT), S3 (path-style) и YooKassa.
+
+Всё — одно Starlette-приложение на одном порту, запускается в потоке процесса
+нагрузочного теста. У каждого апстрима своё поведение: задержка (логнормальная,
+медиана и разброс) и доля ошибок.
+"""
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import json
+import math
+import random
+import threading
+import time
+import uuid
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator
+
+import uvicorn
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response, StreamingResponse
+from starlette.routing import Route
+
+BUCKET = "loadtest"
+
+
+@dataclass
+class Behaviour:
+    """latency_ms — медиана задержки ответа, jitter — σ логнормального распределения
+    (0 — фиксированная задержка), error_rate — доля ответов error_status."""
+
+    latency_ms: float = 20.0
+    jitter: float = 0.5
+    error_rate: float = 0.0
+    error_status: int = 503
+
+    def delay(self) -> float:
+        if self.latency_ms <= 0:
+            return 0.0
+        return self.latency_ms / 1000 * math.exp(random.gauss(0, self.jitter))
+
+    async def apply(self) -> Response | None:
+        await asyncio.sleep(self.delay())
+        if self.error_rate and random.random() < self.error_rate:
+            return JSONResponse({"error": "injected failure"}, status_code=self.error_status)
+        return None
+
+
+@dataclass
+class FakeUpstreams:
+    ocr: Behaviour = field(default_factory=lambda: Behaviour(latency_ms=80))
+    # время «распознавания»: операция OCR становится done через столько после отправки
+    ocr_processing: Behaviour = field(default_factory=lambda: Behaviour(latency_ms=1500, jitter=0.4))
+    gpt: Behaviour = field(default_factory=lambda: Behaviour(latency_ms=2000, jitter=0.4))
+    gpt_stream_chunks: int = 20
+    s3: Behaviour = field(default_factory=lambda: Behaviour(latency_ms=15))
+    yookassa: Behaviour = field(default_factory=lambda: Behaviour(latency_ms=150))
+
+    operations: dict[str, float] = field(default_factory=dict)
+    objects: dict[str, tuple[bytes, str]] = field(default_factory=dict)
+    payments: dict[str, dict[str, Any]] = field(default_factory=dict)
+    counters: dict[str, int] = field(default_factory=dict)
+
+    def _count(self, name: str) -> None:
+        self.counters[name] = self.counters.get(name, 0) + 1
+
+    # --- Yandex OCR -------------------------------------------------------
+
+    async def ocr_submit(self, request: Request) -> Response:
+        self._count("ocr_submit")
+        await request.body()
+        if (error := await self.ocr.apply()) is not None:
+            return error
+        operation_id = uuid.uuid4().hex
+        self.operations[operation_id] = time.monotonic() + self.ocr_processing.delay()
+        return JSONResponse({"id": operation_id, "done": False})
+
+    async def ocr_operation(self, request: Request) -> Response:
+        self._count("ocr_poll")
+        if (error := await self.ocr.apply()) is not None:
+            return error
+        operation_id = request.path_params["operation_id"]
+        ready_at = self.operations.get(operation_id)
+        if ready_at is None:
+            return JSONResponse({"code": 5, "message": "operation not found"}, status_code=404)
+        return JSONResponse({"id": operation_id, "done": time.monotonic() >= ready_at})
+
+    async def ocr_recognition(self, request: Request) -> Response:
+        self._count("ocr_result")
+        if (error := await self.ocr.apply()) is not None:
+            return error
+        operation_id = request.query_params.get("operationId", "")
+        text = f"Задача {operation_id[:6]}: решите уравнение x^2 - 5x + 6 = 0"
+        return JSONResponse({"result": {"textAnnotation": {"fullText": text, "blocks": []}, "page": "0"}})
+
+    # --- OpenAI Responses API --------------------------------------------
+
+    def _response(self, text: str) -> dict[str, Any]:
+        return {
+            "id": f"resp_{uuid.uuid4().hex}",
+            "object": "response",
+            "created_at": int(time.time()),
+            "model": "fake-gpt",
+            "status": "completed",
+            "output": [
+                {
+                    "type": "message",
+                    "id": f"msg_{uuid.uuid4().hex}",
+                    "role": "assistant",
+                    "status": "completed",
+                    "content": [{"type": "output_text", "text": text, "annotations": []}],
+                }
+            ],
+            "parallel_tool_calls": False,
+            "tool_choice": "auto",
+            "tools": [],
+            "usage": {"input_tokens": 100, "output_tokens": 200, "total_tokens": 300},
+        }
+
+    async def gpt_responses(self, request: Request) -> Response:
+        self._count("gpt")
+        body = json.loads(await request.body() or b"{}")
+        text = "Корни уравнения: x = 2 и x = 3. " * 8
+        if not body.get("stream"):
+            if (error := await self.gpt.apply()) is not None:
+                return error
+            return JSONResponse(self._response(text))
+
+        if self.gpt.error_rate and random.random() < self.gpt.error_rate:
+            return JSONResponse({"error": {"message": "injected failure"}}, status_code=self.gpt.error_status)
+        total = self.gpt.delay()
+        chunks = max(1, self.gpt_stream_chunks)
+        size = max(1, len(text) // chunks)
+
+        async def events() -> AsyncIterator[bytes]:
+            for index, offset in enumerate(range(0, len(text), size)):
+                await asyncio.sleep(total / chunks)
+                event = {"type": "response.output_text.delta", "delta": text[offset:offset + size], "sequence_number": index}
+                yield f"event: {event['type']}\ndata: {json.dumps(event, ensure_ascii=False)}\n\n".encode()
+            done = {"type": "response.completed", "response": self._response(text), "sequence_number": chunks + 1}
+            yield f"event: response.completed\ndata: {json.dumps(done, ensure_ascii=False)}\n\n".encode()
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    # --- S3 (path-style) --------------------------------------------------
+
+    async def s3_object(self, request: Request) -> Response:
+        self._count(f"s3_{request.method.lower()}")
+        if (error := await self.s3.apply()) is not None:
+            return error
+        key = f"{request.path_params['bucket']}/{request.path_params['key']}"
+        if request.method == "PUT":
+            data = await request.body()
+            self.objects[key] = (data, request.headers.get("content-type", "binary/octet-stream"))
+            return Response(headers={"ETag": f'"{hashlib.md5(data).hexdigest()}"'})
+        if request.method == "DELETE":
+            self.objects.pop(key, None)
+            return Response(status_code=204)
+        stored = self.objects.get(key)
+        if stored is None:
+            body = b"<Error><Code>NoSuchKey</Code><Message>not found</Message></Error>"
+            return Response(b"" if request.method == "HEAD" else body, status_code=404, media_type="application/xml")
+        data, content_type = stored
+        headers = {"ETag": f'"{hashlib.md5(data).hexdigest()}"', "Content-Length": str(len(data))}
+        if request.method == "HEAD":
+            return Response(headers=headers, media_type=content_type)
+        return Response(data, headers=headers, media_type=content_type)
+
+    # --- YooKassa ---------------------------------------------------------
+
+    async def yookassa_create(self, request: Request) -> Response:
+        self._count("yookassa_create")
+        body = json.loads(await request.body() or b"{}")
+        if (error := await self.yookassa.apply()) is not None:
+            return error
+        payment_id = str(uuid.uuid4())
+        payment = {
+            "id": payment_id,
+            "status": "pending",
+            "paid": False,
+            "amount": body.get("amount"),
+            "description": body.get("description"),
+            "metadata": body.get("metadata") or {},
+            "confirmation": {"type": "redirect", "confirmation_url": f"https://yookassa.local/checkout/{payment_id}"},
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        }
+        self.payments[payment_id] = payment
+        return JSONResponse(payment)
+
+    async def yookassa_get(self, request: Request) -> Response:
+        self._count("yookassa_get")
+        if (error := await self.yookassa.apply()) is not None:
+            return error
+        payment = self.payments.get(request.path_params["payment_id"])
+        if payment is None:
+            return JSONResponse({"type": "error", "code": "not_found"}, status_code=404)
+        return JSONResponse(payment)
+
+    def succeeded_webhook(self, payment_id: str) -> dict[str, Any]:
+        """Тело уведомления payment.succeeded, которое YooKassa прислала бы по платежу."""
+        payment = {**self.payments[payment_id], "status": "succeeded", "paid": True}
+        self.payments[payment_id] = payment
+        return {"type": "notification", "event": "payment.succeeded", "object": payment}
+
+    def app(self) -> Starlette:
+        return Starlette(
+            routes=[
+                Route("/ocr/v1/recognizeTextAsync", self.ocr_submit, methods=["POST"]),
+                Route("/ocr/v1/getRecognition", self.ocr_recognition, methods=["GET"]),
+                Route("/operations/{operation_id}", self.ocr_operation, methods=["GET"]),
+                Route("/v1/responses", self.gpt_responses, methods=["POST"]),
+                Route("/v3/payments", self.yookassa_create, methods=["POST"]),
+                Route("/v3/payments/{payment_id}", self.yookassa_get, methods=["GET"]),
+                # всё остальное — S3: /{bucket}/{key}
+                Route("/{bucket}/{key:path}", self.s3_object, methods=["GET", "HEAD", "PUT", "DELETE"]),
+            ]
+        )
+
+    def service_env(self, base_url: str) -> dict[str, str]:
+        """Переменные окружения сервиса, направляющие все апстримы на заглушки."""
+        return {
+            "YANDEX_OCR_API_URL": f"{base_url}/ocr/v1",
+            "YANDEX_OCR_OPERATIONS_URL": f"{base_url}/operations",
+            "YANDEX_OCR_API_KEY": "loadtest",
+            "YANDEX_GPT_BASE_URL": f"{base_url}/v1",
+            "YANDEX_GPT_PROMPT_ID": "loadtest",
+            "S3_ENDPOINT_URL": base_url,
+            "S3_BUCKET_NAME": BUCKET,
+            "S3_ACCESS_KEY_ID": "loadtest",
+            "S3_SECRET_ACCESS_KEY": "loadtest",
+            "S3_REGION_NAME": "us-east-1",
+            "YOOKASSA_API_BASE": base_url,
+            "YOOKASSA_SHOP_ID": "loadtest",
+            "YOOKASSA_API_KEY": "loadtest",
+        }
+
+
+class FakeServer:
+    """uvicorn с заглушками в фоновом потоке текущего процесса."""
+
+    def __init__(self, fakes: FakeUpstreams, host: str = "127.0.0.1", port: int = 18080) -> None:
+        self.fakes = fakes
+        self.base_url = f"http://{host}:{port}"
+        config = uvicorn.Config(fakes.app(), host=host, port=port, log_level="warning", access_log=False)
+        self._server = uvicorn.Server(config)
+        self._thread = threading.Thread(target=self._server.run, name="loadtest-fakes", daemon=True)
+
+    def start(self, timeout: float = 10.0) -> None:
+        self._thread.start()
+        deadline = time.monotonic() + timeout
+        while not self._server.started:
+            if time.monotonic() > deadline or not self._thread.is_alive():
+                raise RuntimeError("Fake upstreams did not start")
+            time.sleep(0.05)
+
+    def stop(self) -> None:
+        self._server.should_exit = True
+        self._thread.join(timeout=10)
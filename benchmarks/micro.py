@@ -0,0 +1,230 @@
+"""Микробенчмарки горячих хелперов (выполняются на каждом запросе).
+
+Абсолютные наносекунды между прогонами и машинами несравнимы (частота CPU,
+соседние процессы), поэтому каждый кейс измеряется вперемешку с калибровочным
+циклом чистого Python в том же процессе, а в базе benchmarks/baseline.json
+хранится отношение «кейс / калибровка» (медиана по раундам):
+
+    python -m benchmarks.micro check             # падает (exit 1), если кейс медленнее базы больше порога
+    python -m benchmarks.micro table             # таблица сравнения с базой, без падения
+    python -m benchmarks.micro update            # перезаписать базу текущими замерами
+    python -m benchmarks.micro check -k serialize --threshold 15
+
+Порог по умолчанию — MICROBENCH_THRESHOLD_PCT (25%). Кейс, вышедший за порог,
+перемеряется ещё раз: регрессией считается, только если порог превышен оба раза.
+"""
+from __future__ import annotations
+
+import argparse
+import atexit
+import json
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import timeit
+import uuid
+from datetime import datetime, timezone
+from decimal import Decimal
+from typing import Callable
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), "baseline.json")
+DEFAULT_THRESHOLD_PCT = float(os.getenv("MICROBENCH_THRESHOLD_PCT", "25"))
+
+
+def _entities():
+    from app.db.models import Job, Transaction, User
+
+    now = datetime.now(timezone.utc)
+    user = User(
+        id=uuid.uuid4(),
+        ip="203.0.113.17",
+        username="Могучий лиса",
+        avatar_id=2,
+        anon_user_id=str(uuid.uuid4()),
+        balance_tokens=Decimal("4"),
+        tokens_used_as_anon=1,
+        is_authorized=False,
+        created_at=now,
+        updated_at=now,
+    )
+    job = Job(
+        id=uuid.uuid4(),
+        user_id=user.id,
+        status="done",
+        tokens_reserved=Decimal("1"),
+        tokens_consumed=Decimal("1"),
+        input_s3_url=f"s3://bucket/jobs/{user.id}/page.jpg",
+        detected_text="Решите уравнение x^2 - 5x + 6 = 0. " * 20,
+        generated_text="Корни уравнения: x = 2 и x = 3. " * 60,
+        created_at=now,
+        updated_at=now,
+    )
+    txn = Transaction(
+        id=uuid.uuid4(),
+        user_id=user.id,
+        job_id=job.id,
+        type="gateway_payment",
+        provider="yookassa",
+        status="success",
+        amount_rub=Decimal("76"),
+        tokens_delta=Decimal("10"),
+        currency="RUB",
+        plan="10 токенов",
+        reference=uuid.uuid4().hex,
+        meta={"intent": True, "tariffId": "1", "tokens": 10.0},
+        created_at=now,
+    )
+    return job, user, txn
+
+
+def _cases() -> dict[str, Callable[[], object]]:
+    """Имя кейса → вызов без аргументов. Входные данные готовятся здесь, вне замера."""
+    from app.api.v1.jobs import _serialize_job
+    from app.api.v1.transactions import _serialize_txn
+    from app.api.v1.users import _serialize_public_user
+    from app.services.file_utils import JsonOrderStore
+    from app.services.s3_utils import parse_s3_url, s3_key_for_upload, s3_key_for_video
+    from app.services.user_profile import _hash, avatar_id_for_ip, username_for_ip
+
+    job, user, txn = _entities()
+    ip = "2001:db8:85a3::8a2e:370:7334"
+
+    # дневной файл фиксированного размера: save заменяет одну из существующих заявок
+    store_dir = tempfile.mkdtemp(prefix="microbench-")
+    atexit.register(shutil.rmtree, store_dir, ignore_errors=True)
+    store = JsonOrderStore(base_dir=store_dir)
+    day = "2026-01-15T10:00:00"
+    for index in range(50):
+        store.save({"order_id": f"order-{index}", "created_at": day, "status": "new", "amount": 76, "email": "a@b.c"})
+    order = {"order_id": "order-25", "created_at": day, "status": "paid", "amount": 76, "email": "a@b.c"}
+
+    s3_url = f"s3://bucket/jobs/{user.id}/{job.id}/001_page.jpg"
+    anon_id, request_id = str(uuid.uuid4()), uuid.uuid4().hex
+
+    return {
+        "serialize_job": lambda: _serialize_job(job, user),
+        "serialize_public_user": lambda: _serialize_public_user(user),
+        "serialize_txn": lambda: _serialize_txn(txn),
+        "user_profile_hash": lambda: _hash(ip),
+        "username_for_ip": lambda: username_for_ip(ip),
+        "avatar_id_for_ip": lambda: avatar_id_for_ip(ip),
+        "order_store_save": lambda: store.save(dict(order)),
+        "order_store_load": lambda: store.load("order-25"),
+        "parse_s3_url": lambda: parse_s3_url(s3_url),
+        "s3_key_for_upload": lambda: s3_key_for_upload(anon_id, request_id, "page.jpg"),
+        "s3_key_for_video": lambda: s3_key_for_video(anon_id, request_id, 3),
+    }
+
+
+def _calibration() -> object:
+    # типичная для хелперов смесь: dict, f-строки, join
+    data = {f"k{index}": index * 3 for index in range(20)}
+    return "-".join(f"{key}={value}" for key, value in data.items())
+
+
+def _loops(timer: timeit.Timer, seconds: float) -> int:
+    number, elapsed = timer.autorange()
+    return max(1, int(number * seconds / max(elapsed, 1e-9)))
+
+
+def measure(cases: dict[str, Callable[[], object]], rounds: int, seconds: float) -> dict[str, tuple[float, float]]:
+    """Имя кейса → (нс на вызов, отношение к калибровке).
+
+    В каждом раунде перед каждым кейсом заново меряется калибровка: медленная
+    полоса машины замедляет обе части отношения. Берутся медианы по раундам."""
+    calibration = timeit.Timer(_calibration)
+    calibration_loops = _loops(calibration, seconds)
+    timers = {name: timeit.Timer(func) for name, func in cases.items()}
+    loops = {name: _loops(timer, seconds) for name, timer in timers.items()}
+    ns: dict[str, list[float]] = {name: [] for name in cases}
+    ratios: dict[str, list[float]] = {name: [] for name in cases}
+    for _ in range(rounds):
+        for name, timer in timers.items():
+            base = calibration.timeit(calibration_loops) / calibration_loops
+            current = timer.timeit(loops[name]) / loops[name]
+            ns[name].append(current * 1e9)
+            ratios[name].append(current / base)
+    return {name: (statistics.median(ns[name]), statistics.median(ratios[name])) for name in cases}
+
+
+def _load_baseline(path: str) -> dict:
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding="utf-8") as f:
+        return json.load(f).get("cases", {})
+
+
+def _format_row(name: str, ns: float, ratio: float, before: float | None, threshold: float) -> tuple[str, bool]:
+    if before is None:
+        return f"{name:<24}{ns:>12.0f}{ratio:>10.3f}{'—':>10}{'':>10}  new", False
+    change = (ratio - before) / before * 100
+    regressed = change > threshold
+    mark = "REGRESSION" if regressed else ("faster" if change < -threshold else "ok")
+    return f"{name:<24}{ns:>12.0f}{ratio:>10.3f}{before:>10.3f}{change:>+9.1f}%  {mark}", regressed
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("command", choices=["check", "table", "update"], nargs="?", default="check")
+    parser.add_argument("-k", dest="pattern", help="только кейсы, содержащие подстроку")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD_PCT, help="допустимое замедление, %%")
+    parser.add_argument("--rounds", type=int, default=15, help="раундов «калибровка + кейс»")
+    parser.add_argument("--seconds", type=float, default=0.02, help="длительность одного замера")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    args = parser.parse_args()
+
+    cases = {name: func for name, func in _cases().items() if not args.pattern or args.pattern in name}
+    # база снимается втрое дольше: её случайный выброс ложится на все будущие check
+    rounds = args.rounds * 3 if args.command == "update" else args.rounds
+    results = measure(cases, rounds, args.seconds)
+
+    if args.command == "update":
+        stored = {}
+        if args.pattern and os.path.exists(args.baseline):
+            stored = _load_baseline(args.baseline)
+        stored.update({name: {"ratio": round(ratio, 4)} for name, (_, ratio) in results.items()})
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    "python": platform.python_version(),
+                    "updatedAt": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+                    "cases": dict(sorted(stored.items())),
+                },
+                f,
+                ensure_ascii=False,
+                indent=2,
+            )
+            f.write("\n")
+        print(f"baseline updated: {args.baseline} ({len(results)} cases)")
+        return
+
+    baseline = _load_baseline(args.baseline)
+    suspects = [
+        name
+        for name, (_, ratio) in results.items()
+        if (before := baseline.get(name, {}).get("ratio")) and (ratio - before) / before * 100 > args.threshold
+    ]
+    if suspects:
+        # единичный выброс не должен ронять check: подозрительные кейсы меряются заново
+        remeasured = measure({name: cases[name] for name in suspects}, args.rounds, args.seconds)
+        for name, (ns, ratio) in remeasured.items():
+            if ratio < results[name][1]:
+                results[name] = (ns, ratio)
+
+    print(f"{'case':<24}{'ns/call':>12}{'ratio':>10}{'baseline':>10}{'change':>10}")
+    regressions = []
+    for name, (ns, ratio) in results.items():
+        row, regressed = _format_row(name, ns, ratio, baseline.get(name, {}).get("ratio"), args.threshold)
+        print(row)
+        if regressed:
+            regressions.append(name)
+    if args.command == "check" and regressions:
+        print(f"\n{len(regressions)} case(s) slower than baseline by more than {args.threshold:g}%: {', '.join(regressions)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""Пиковый RSS одного задания на пути «файл → тело запроса OCR».
+
+legacy    — как было: read() → base64 → JSON-строка → bytes (то, что делал httpx json=)
+streaming — mmap файла + OCRRequestBody (base64 кусками при отправке)
+
+Каждый режим меряется в отдельном процессе, чтобы пики не смешивались:
+
+    python -m benchmarks.upload_path_rss --size-mb 12
+"""
+from __future__ import annotations
+
+import argparse
+import base64
+import json
+import mmap
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+
+
+def _rss_mb() -> float:
+    # ru_maxrss в Linux — килобайты
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _consume(chunks) -> int:
+    total = 0
+    for chunk in chunks:
+        total += len(chunk)
+    return total
+
+
+def _run_legacy(path: str) -> int:
+    with open(path, "rb") as f:
+        content = f.read()
+    payload = {
+        "content": base64.b64encode(content).decode(),
+        "mimeType": "image/jpeg",
+        "languageCodes": ["ru"],
+        "model": "math-markdown",
+    }
+    body = json.dumps(payload).encode()
+    return _consume([body])
+
+
+def _run_streaming(path: str) -> int:
+    from app.services.yandex_ocr_service import OCRRequestBody
+
+    with open(path, "rb") as f:
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        return _consume(OCRRequestBody(mapped, "image/jpeg", None))
+    finally:
+        mapped.close()
+
+
+def _child(mode: str, path: str) -> None:
+    if mode == "streaming":
+        # импорт до замера, чтобы не учитывать код приложения
+        import app.services.yandex_ocr_service  # noqa: F401
+    baseline = _rss_mb()
+    sent = {"legacy": _run_legacy, "streaming": _run_streaming}[mode](path)
+    print(json.dumps({"mode": mode, "bodyBytes": sent, "peakDeltaMb": round(_rss_mb() - baseline, 1)}))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size-mb", type=float, default=12.0)
+    parser.add_argument("--child", choices=["legacy", "streaming"], help=argparse.SUPPRESS)
+    parser.add_argument("--path", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        _child(args.child, args.path)
+        return
+
+    size = int(args.size_mb * 1024 * 1024)
+    with tempfile.NamedTemporaryFile(delete=False, suffix=".jpg") as f:
+        f.write(os.urandom(size))
+        path = f.name
+    try:
+        print(f"input: {size / 1024 / 1024:.1f} MB")
+        for mode in ("legacy", "streaming"):
+            out = subprocess.run(
+                [sys.executable, "-m", "benchmarks.upload_path_rss", "--child", mode, "--path", path],
+                check=True,
+                capture_output=True,
+                text=True,
+            ).stdout.strip().splitlines()[-1]
+            result = json.loads(out)
+            print(f"{mode:>10}: peak RSS +{result['peakDeltaMb']} MB, body {result['bodyBytes'] / 1024 / 1024:.1f} MB")
+    finally:
+        os.remove(path)
+
+
+if __name__ == "__main__":
+    main()